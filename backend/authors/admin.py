@@ -10,6 +10,44 @@ def approve_users(modeladmin, request, queryset):
             
 approve_users.short_description = "Approve selected users"
 
+class DeliveryAdmin(admin.ModelAdmin):
+    list_display = ['url', 'remote_node', 'status', 'attempts', 'last_status_code', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'remote_node']
+
+class InboxItemAdmin(admin.ModelAdmin):
+    list_display = ['activity_id', 'type', 'status', 'received_at', 'processed_at']
+    list_filter = ['status', 'type']
+
+class RemoteNodeForm(forms.ModelForm):
+    new_inbound_password = forms.CharField(required=False, widget=forms.PasswordInput,
+                                           help_text="Password the node uses to reach us, apart from the password we send it. "
+                                                     "Leave blank to keep the current one. Nodes without one can't reach us.")
+
+    class Meta:
+        model = RemoteNode
+        exclude = ['inbound_password']
+
+class RemoteNodeAdmin(admin.ModelAdmin):
+    form = RemoteNodeForm
+    list_display = ['url', 'is_active', 'circuit_state', 'consecutive_failures', 'last_success_at', 'latency_p50', 'latency_p95']
+    list_filter = ['is_active']
+    readonly_fields = ['consecutive_failures', 'last_success_at', 'last_failure_at', 'circuit_opened_at', 'latency_p50', 'latency_p95']
+    actions = ['close_circuit']
+
+    @admin.display(description="Circuit")
+    def circuit_state(self, obj):
+        return obj.circuit_state()
+
+    def save_model(self, request, obj, form, change):
+        # only the hash of the inbound password is stored
+        if form.cleaned_data.get('new_inbound_password'):
+            obj.set_inbound_password(form.cleaned_data['new_inbound_password'])
+        super().save_model(request, obj, form, change)
+
+    @admin.action(description="Close the circuit of selected nodes")
+    def close_circuit(self, request, queryset):
+        queryset.update(consecutive_failures=0, circuit_opened_at=None)
+
 class SiteConfigurationAdmin(admin.ModelAdmin):
     list_display = ['require_user_approval']
 
@@ -64,4 +102,6 @@ class AuthorAdmin(admin.ModelAdmin):
 admin.site.register(Author, AuthorAdmin)
 admin.site.register(Follow)
 admin.site.register(SiteConfiguration, SiteConfigurationAdmin)
-admin.site.register(RemoteNode)  
+admin.site.register(RemoteNode, RemoteNodeAdmin)
+admin.site.register(Delivery, DeliveryAdmin)
+admin.site.register(InboxItem, InboxItemAdmin)
@@ -16,7 +16,11 @@ import base64
 from rest_framework.decorators import authentication_classes, permission_classes
 from .node_authentication import NodeBasicAuthentication
 from django.utils import timezone
-from requests.auth import HTTPBasicAuth
+from .node_clients import get_client, get_client_for, get_client_stats
+from .inbox import validate_activity, queue_activity
+from .remote_authors import resolve_author
+from .backfill import request_backfill
+from .token_authentication import revoke_tokens
 import json
 from django.views.decorators.csrf import csrf_exempt
 from urllib.parse import unquote
@@ -36,7 +40,7 @@ def login(request):
                return Response({"detail": "Your account is pending approval."}, status=403)
         django_side_login(request, user)
         token, _ = Token.objects.get_or_create(user=user)
-        return Response({"token": base64.b64encode(f"{username}:{password}".encode()), "userId": user.fqid}, status=200)
+        return Response({"token": token.key, "userId": user.fqid}, status=200)
     else:
         return Response({"detail": "Invalid username or password"}, status=401)
 
@@ -68,13 +72,16 @@ def signup(request):
         user = authenticate(request, username=username, password=password)
         django_side_login(request, user)
         token, _ = Token.objects.get_or_create(user=user)
-        return Response({"token": base64.b64encode(f"{username}:{password}".encode()), "userId": user.fqid}, status=201)
+        return Response({"token": token.key, "userId": user.fqid}, status=201)
     else:
         return Response({"detail": "Your account is pending approval."}, status=201)
 
 @logout_docs
 @api_view(['GET'])
 def logout(request):
+    if request.user.is_authenticated:
+        Token.objects.filter(user=request.user).delete()    # the next login gets a new token
+        revoke_tokens(request.user.id)     # in the token caches of every process
     django_side_logout(request)
     return Response(status=200)
 
@@ -222,7 +229,7 @@ def search_author(request):
     if keyword:
         results = Author.objects.filter(Q(username__icontains=keyword) | Q(display_name__icontains=keyword))
     
-    results = [AuthorSerializer(author).data for author in results]
+    results = AuthorSerializer(results, many=True).data
 
     return Response(results, status=200)
 
@@ -243,9 +250,13 @@ def follow(request):
             follow_request_object = FollowRequestSerializer(follow_request).data
             follow_request_json = json.dumps(follow_request_object)
 
-            requests.post(user_author.fqid + "/inbox/", data=follow_request_json,
-                          auth=HTTPBasicAuth(user_author.remote_node.username, user_author.remote_node.password),
-                          headers={"Content-Type": "application/json"}, timeout=5)
+            inbox = user_author.fqid + "/inbox/"
+            try:
+                get_client(user_author.remote_node).post(inbox, data=follow_request_json,
+                                                         headers={"Content-Type": "application/json"})
+            except requests.RequestException:
+                # the node is down, hand the request to the delivery worker to send once it is back
+                Delivery.objects.create(remote_node=user_author.remote_node, recipient=user_author, url=inbox, payload=follow_request_json)
 
         return Response(status=201)
 
@@ -278,12 +289,8 @@ def manage_follow(request, author_id):
             follow.status = "FOLLOWED"
             follow.save()
 
-            result = {"success": True, "detail": "Follow request accepted."}
-
             if follower.remote_node:
-                result = fetch_remote_posts(follower)
-            if not result["success"]:
-                return Response({"detail": result["detail"]}, status=400)
+                request_backfill(follower)  # their posts are copied by the backfill_remote_posts worker
         elif request.method == "DELETE":
             # remove follow request
             follow = Follow.objects.get(user=author, follower=follower)
@@ -301,12 +308,10 @@ def handle_follow(request, author_id, foreign_author_fqid):
     try:
         author = Author.objects.get(id=author_id)
         foreign_author_fqid = unquote(foreign_author_fqid)  # Decode the percent-encoded URL
-        foreign_author, _ = Author.objects.get_or_create(fqid=foreign_author_fqid)
+        foreign_author = resolve_author({'id': foreign_author_fqid})
         
         if request.method == 'GET':  # Check if foreign author is a follower
-            if Follow.objects.filter(user=author, follower__fqid=foreign_author_fqid).exists():
-                # Fetch the existing foreign_author from the database
-                foreign_author = Author.objects.get(fqid=foreign_author_fqid)
+            if Follow.objects.filter(user=author, follower=foreign_author).exists():
                 return Response({
                     "type": "author",
                     "id": foreign_author.fqid,
@@ -325,54 +330,13 @@ def handle_follow(request, author_id, foreign_author_fqid):
 
         elif request.method == 'DELETE' and request.user.is_authenticated:  # Remove as a follower
             Follow.objects.filter(user=author, follower=foreign_author).delete()
+            Follow.forget_edges(author.id, foreign_author.id)
+            Follow.refresh_timelines(author, foreign_author)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     except Author.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-def fetch_remote_posts(author):
-    """
-    Fetch posts from a remote author and store them locally.
-    """
-    remote_posts_url = f"{author.fqid}/posts/"
-
-    try:
-        response = requests.get(remote_posts_url, auth=HTTPBasicAuth(author.remote_node.username, author.remote_node.password),
-                              headers={"Content-Type": "application/json"}, timeout=5)
-        if response.status_code == 200:
-            remote_posts_data = response.json()
-            remote_posts = remote_posts_data.get('posts', [])
-            
-            relevant_posts = [
-                post for post in remote_posts if post.get('visibility') in ['PUBLIC', 'FRIENDS','UNLISTED']
-            ]
-
-            for post_data in relevant_posts:
-                post_fqid = post_data.get('id')
-                if not post_fqid:
-                    continue
-                
-                Post.objects.update_or_create(
-                    fqid=post_fqid,
-                    defaults={
-                        "title": post_data.get('title', ''),
-                        "description": post_data.get('description', ''),
-                        "contentType": post_data.get('contentType', ''),
-                        "content": post_data.get('content', ''),
-                        "visibility": post_data.get('visibility', 'PUBLIC'),
-                        "author": author,
-                        "published": post_data.get('published', timezone.now()),
-                    }
-                )
-            return {"success": True, "detail": "Posts fetched and saved successfully."}
-        else:
-            return {"success": False, "detail": f"Failed to fetch remote posts. Status: {response.status_code}"}
-    except requests.RequestException as e:
-        return {"success": False, "detail": f"Error fetching remote posts: {str(e)}"}
-
-
-
-
 @get_follows_docs
 @api_view(['GET'])
 def followers(request, author_id):
@@ -456,7 +420,7 @@ def manage_remote_nodes(request):
             )
 
         try:
-            response = requests.post(f"{url}/api/authors/login/", data={'username': username, 'password': password} )  #(remote_node + /login)
+            response = get_client_for(url).post(f"{url}/api/authors/login/", data={'username': username, 'password': password} )  #(remote_node + /login)
 
             if response.status_code == 200:
                 data = response.json()
@@ -480,17 +444,11 @@ def manage_remote_nodes(request):
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
-def extract_author_info(actor):
-    """Helper function to extract author information."""
-    return {
-        'fqid': actor.get('id'),
-        'host': actor.get('host'),
-        'display_name': actor.get('displayName'),
-        'github': actor.get('github'),
-        'profile_image': actor.get('profileImage'),
-        'page': actor.get('page'),
-        'username': actor.get('username', actor.get('id').split('/')[-1])  # Derive username if not provided
-    }
+@remote_node_stats_docs
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def remote_node_stats(request):
+    return Response(get_client_stats())
 
 @csrf_exempt
 @api_view(['POST'])
@@ -498,157 +456,14 @@ def extract_author_info(actor):
 def inbox(request, author_id):
     if request.method != 'POST':
         return Response(status=status.HTTP_403_FORBIDDEN)
-    
-    new_item = request.data
-    
-    item_type = new_item.get('type')
-    
-    if item_type == "post":
-        post_id = new_item['id']
-
-        if not Post.objects.filter(fqid=post_id).exists():  # if post doesn't exist in db yet
-            author_id = new_item['author']['id']
-            host = new_item['author']['host']
-            post_published = new_item.get('published', timezone.now())
-
-            author_check = Author.objects.filter(fqid=author_id)
-
-            if author_check:
-                author = author_check.first()
-            else:
-                author = Author.objects.create(
-                    host=host,
-                    display_name=new_item['author']['displayName'],
-                    username=author_id,
-                    github=new_item['author']['github'],
-                    profile_image=new_item['author']['profileImage'],
-                    page=new_item['author']['page'],
-                    fqid=author_id
-                )
-
-            new_post = Post(
-                title=new_item['title'],
-                description=new_item['description'],
-                contentType=new_item['contentType'],
-                content=new_item['content'],
-                author=author,
-                visibility=new_item['visibility'],
-                fqid=post_id
-            )
-            new_post.save()
-            new_post.published = post_published
-            new_post.save()
-        
-        elif new_item['visibility'] == "DELETED":  # if post exists in db and is marked as deleted
-            post = Post.objects.get(fqid=post_id)
-            post.is_deleted = True
-            post.visibility = "DELETED"
-            post.save()
-            return Response(status=status.HTTP_200_OK)
-        
-        else:   # if post exists in db then there was an edit to the post
-            post = Post.objects.get(fqid=post_id)
-            post.title = new_item['title']
-            post.description = new_item['description']
-            post.content = new_item['content']
-            post.save()
-
-            return Response(status=status.HTTP_200_OK)
-
-    elif item_type == "follow":
-        actor_info = extract_author_info(new_item['actor'])
-        object_fqid = new_item['object']['id']
-
-        local_author = get_object_or_404(Author, fqid=object_fqid)
-
-        remote_author_check = Author.objects.filter(fqid=actor_info['fqid'])
-
-        if remote_author_check.exists():
-            remote_author = remote_author_check.first()
-        else:
-            remote_author = Author.objects.create(
-                host=actor_info['host'],
-                display_name=actor_info['display_name'],
-                username=actor_info['fqid'],
-                github=actor_info['github'],
-                profile_image=actor_info['profile_image'],
-                page=actor_info['page'],
-                fqid=actor_info['fqid'],
-            )
-
-        new_follow, created = Follow.objects.get_or_create(
-            user=local_author,
-            follower=remote_author,
-            status="REQUESTED"
-        )
-        return Response(status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
-
-    elif item_type == "like":
-        actor_info = extract_author_info(new_item['author'])
-        object_fqid = new_item['object']
-        like_id = new_item['id']
-        like_published = new_item.get('published', timezone.now())
-
-        remote_author_check = Author.objects.filter(fqid=actor_info['fqid'])
-
-        if remote_author_check.exists():
-            remote_author = remote_author_check.first()
-        else:
-            remote_author = Author.objects.create(
-                host=actor_info['host'],
-                display_name=actor_info['display_name'],
-                username=actor_info['fqid'],
-                github=actor_info['github'],
-                profile_image=actor_info['profile_image'],
-                page=actor_info['page'],
-                fqid=actor_info['fqid'],
-            )
-
-        new_like, created = Like.objects.get_or_create(
-            author=remote_author,
-            object=object_fqid,
-            fqid=like_id,
-        )
-        new_like.published = like_published
-        new_like.save()
-
-        return Response(status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
-
-    elif item_type == "comment":
-        actor_info = extract_author_info(new_item['author'])
-        comment = new_item['comment']
-        content_type = new_item['contentType']
-        comment_post_fqid = new_item['post']
-        comment_published = new_item.get('published', timezone.now())
-
-        remote_author_check = Author.objects.filter(fqid=actor_info['fqid'])
-
-        if remote_author_check.exists():
-            remote_author = remote_author_check.first()
-        else:
-            remote_author = Author.objects.create(
-                host=actor_info['host'],
-                display_name=actor_info['display_name'],
-                username=actor_info['fqid'],
-                github=actor_info['github'],
-                profile_image=actor_info['profile_image'],
-                page=actor_info['page'],
-                fqid=actor_info['fqid'],
-            )
-
-        comment_post = get_object_or_404(Post, fqid=comment_post_fqid)
 
-        new_comment = Comment(
-            author=remote_author,
-            comment=comment,
-            contentType=content_type,
-            post=comment_post,
-        )
-        new_comment.save()
-        new_comment.published = comment_published
-        new_comment.save()
+    # activities are applied by the process_inbox worker, so a burst from a node doesn't tie up request threads
+    error = validate_activity(request.data)
+    if error:
+        return Response({'detail': error}, status=status.HTTP_400_BAD_REQUEST)
 
-    return Response(status=status.HTTP_201_CREATED)
+    queue_activity(request.data)
+    return Response(status=status.HTTP_202_ACCEPTED)
 
 
 
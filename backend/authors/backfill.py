@@ -0,0 +1,153 @@
+'''
+Backfill of the posts of remote authors.
+
+Views only call request_backfill(author). The backfill_remote_posts management command
+picks up requested backfills, pages through {fqid}/posts/ of each author in a thread
+pool (newest posts first) and stores the posts with one bulk upsert per author from the
+calling thread. Each author's high-water mark is the published time of the newest post
+copied, so later backfills stop as soon as they reach posts that were already copied.
+A backfill that fails is requested again after a backoff, like a failed delivery.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .federation import get_backoff
+from .inbox import upsert_posts
+from .models import Author, Follow, RemoteNode, RemotePostSync
+from .node_clients import get_client, CircuitOpenError
+
+PAGE_SIZE = 50      # posts asked for per page, nodes may send fewer
+MAX_PAGES = 100     # never walk further back than this in one backfill
+VISIBILITIES = ['PUBLIC', 'FRIENDS', 'UNLISTED']     # posts that are copied
+
+
+def request_backfill(author):
+    """
+    Queue a backfill of a remote author's posts.
+    """
+    RemotePostSync.objects.update_or_create(author=author, defaults={'requested_at': timezone.now()})
+
+
+def request_all_backfills():
+    # refresh every remote author that someone here follows
+    followed = Follow.objects.filter(status='FOLLOWED', user__remote_node__isnull=False).values('user')
+    for author in Author.objects.filter(id__in=followed):
+        request_backfill(author)
+
+
+def get_published(post_object):
+    published = post_object.get('published')
+    try:
+        published = parse_datetime(published) if isinstance(published, str) else None
+    except ValueError:
+        return None
+    # nodes that leave out the offset are taken to mean our time zone, like since in get_all_public_posts
+    if published is not None and timezone.is_naive(published):
+        published = timezone.make_aware(published)
+    return published
+
+
+def fetch_new_posts(sync):
+    """
+    Get the post objects of an author that are newer than its high-water mark, newest first.
+    """
+    author = sync.author
+    client = get_client(author.remote_node)
+    new_posts = []
+    for page in range(1, MAX_PAGES + 1):
+        response = client.get(f"{author.fqid}/posts/", params={'page': page, 'size': PAGE_SIZE})
+        if response.status_code == 404:     # past the last page
+            break
+        response.raise_for_status()
+        posts = response.json().get('posts', [])
+        if not posts:
+            break
+
+        for post_object in posts:
+            published = get_published(post_object)
+            if sync.high_water and published and published <= sync.high_water:
+                return new_posts    # everything from here on was copied before
+            new_posts.append(post_object)
+    return new_posts
+
+
+def fetch(sync):
+    # whatever a node sends fails only its own backfill, which is retried later
+    try:
+        return sync, fetch_new_posts(sync), None
+    except Exception as e:
+        return sync, None, e
+
+
+def store_posts(sync, post_objects):
+    author = sync.author
+    post_objects = [post_object for post_object in post_objects if post_object.get('id') and post_object.get('visibility') in VISIBILITIES]
+    # a post can move between pages while they are read, keep one copy of each
+    post_objects = list({post_object['id']: post_object for post_object in reversed(post_objects)}.values())
+    upsert_posts(post_objects, lambda post_object: author)
+
+    published = [timestamp for timestamp in map(get_published, post_objects) if timestamp]
+    if published:
+        sync.high_water = max(published + ([sync.high_water] if sync.high_water else []))
+
+
+def record_failure(sync, error):
+    now = timezone.now()
+    if isinstance(error, CircuitOpenError):
+        # the node is down, try again once its circuit lets a request through
+        retry_at = now + timedelta(seconds=RemoteNode.CIRCUIT_COOLDOWN)
+    else:
+        sync.attempts += 1
+        retry_at = now + get_backoff(sync.attempts)
+    sync.last_error = str(error)
+    RemotePostSync.objects.filter(id=sync.id).update(attempts=sync.attempts, last_error=sync.last_error)
+    # a backfill requested while this one ran keeps its earlier time
+    RemotePostSync.objects.filter(id=sync.id, requested_at__isnull=True).update(requested_at=retry_at)
+
+
+def process_backfills(batch_size=20, workers=8):
+    """
+    Run one batch of requested backfills. Returns how many authors were backfilled.
+    """
+    with transaction.atomic():
+        syncs = list(
+            RemotePostSync.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('author__remote_node')
+            .filter(requested_at__lte=timezone.now(), author__remote_node__isnull=False)
+            .order_by('requested_at')[:batch_size]
+        )
+        # requests made while the batch runs queue the author again
+        RemotePostSync.objects.filter(id__in=[sync.id for sync in syncs]).update(requested_at=None)
+    if not syncs:
+        return 0
+
+    clients = [get_client(sync.author.remote_node) for sync in syncs]
+    for client in clients:
+        client.hold_health()
+    try:
+        # only the HTTP calls run in the pool and posts are stored from this thread
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(fetch, syncs))
+    finally:
+        for client in clients:
+            client.save_held_health()
+
+    for sync, post_objects, error in results:
+        if post_objects is None:
+            record_failure(sync, error)
+            continue
+        high_water = sync.high_water
+        try:
+            with transaction.atomic():
+                store_posts(sync, post_objects)
+                sync.synced_at = timezone.now()
+                sync.attempts = 0
+                sync.last_error = ""
+                sync.save(update_fields=['high_water', 'synced_at', 'attempts', 'last_error'])
+        except Exception as e:
+            sync.high_water = high_water    # nothing was stored
+            record_failure(sync, e)
+    return len(syncs)
@@ -0,0 +1,90 @@
+'''
+Crawl of the authors on remote nodes.
+
+The crawl_authors management command pages through /api/authors/ on every active node.
+Nodes are crawled concurrently: pages are fetched in a thread pool and stored from the
+calling thread with sync_authors, which skips authors whose profile didn't change.
+The next page of each node is saved on the node as it goes, so an interrupted crawl
+picks up where it stopped. The page size is saved with it, since with another size the
+page number would point at other authors, and a crawl with another size starts over.
+'''
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.utils import timezone
+import requests
+from .models import RemoteNode
+from .node_clients import get_client
+from .remote_authors import sync_authors
+
+PAGE_SIZE = 100     # authors asked for per page, nodes may send fewer
+
+
+def is_node_author(author_data, node_url):
+    """
+    Check that an author fetched from a remote node belongs to that node.
+    """
+    if not author_data.get("id") or "http://localhost" in author_data.get("id"):  # Skip local author
+        return False
+    return node_url in author_data.get("id")
+
+
+def fetch_authors_page(node, page, page_size):
+    """
+    Get a page of a node's authors, or None once there are no more pages.
+    """
+    response = get_client(node).get(f"{node.url}/api/authors/", params={'page': page, 'size': page_size})
+    if response.status_code == 404:     # past the last page
+        return None
+    response.raise_for_status()
+    return response.json().get("authors", []) or None
+
+
+def crawl_nodes(nodes=None, page_size=PAGE_SIZE, workers=8, restart=False):
+    """
+    Crawl the authors of remote nodes, all active nodes by default. Returns a summary
+    of what was stored for each node.
+    """
+    nodes = list(RemoteNode.objects.filter(is_active=True) if nodes is None else nodes)
+    summary = {node.url: {'pages': 0, 'created': 0, 'updated': 0, 'finished': False, 'error': None} for node in nodes}
+    restarted = [node for node in nodes if restart or node.author_crawl_page_size != page_size]
+    if restarted:
+        RemoteNode.objects.filter(id__in=[node.id for node in restarted]).update(author_crawl_page=1, author_crawl_page_size=page_size)
+        for node in restarted:
+            node.author_crawl_page = 1
+            node.author_crawl_page_size = page_size
+
+    clients = [get_client(node) for node in nodes]
+    for client in clients:
+        client.hold_health()
+    try:
+        # only the HTTP calls run in the pool, pages are stored from this thread
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {pool.submit(fetch_authors_page, node, node.author_crawl_page, page_size): node for node in nodes}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = pending.pop(future)
+                    node_summary = summary[node.url]
+                    try:
+                        authors = future.result()
+                    except (requests.RequestException, ValueError) as e:
+                        node_summary['error'] = str(e)      # the checkpoint stays, the next crawl retries this page
+                        continue
+
+                    if authors is None:
+                        RemoteNode.objects.filter(pk=node.pk).update(author_crawl_page=1, authors_crawled_at=timezone.now())
+                        node_summary['finished'] = True
+                        continue
+
+                    created, updated = sync_authors([author for author in authors if is_node_author(author, node.url)], node)
+                    node_summary['pages'] += 1
+                    node_summary['created'] += created
+                    node_summary['updated'] += updated
+
+                    node.author_crawl_page += 1
+                    RemoteNode.objects.filter(pk=node.pk).update(author_crawl_page=node.author_crawl_page)
+                    pending[pool.submit(fetch_authors_page, node, node.author_crawl_page, page_size)] = node
+    finally:
+        for client in clients:
+            client.save_held_health()
+    return summary
@@ -158,21 +158,37 @@ delete_post_docs = swagger_auto_schema(
     }
 )
 
+public_posts_params = [
+    openapi.Parameter('since', openapi.IN_QUERY, description="Only posts published after this ISO 8601 datetime. Edits, deletions and posts that reach this node late are not included, use /api/posts/changes/ for those", type=openapi.TYPE_STRING, required=False),
+    openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER, required=False),
+    openapi.Parameter('size', openapi.IN_QUERY, description="Posts per page, 50 by default and at most 100", type=openapi.TYPE_INTEGER, required=False),
+    openapi.Parameter('cursor', openapi.IN_QUERY, description="Cursor from the previous page's next link, empty for the first page", type=openapi.TYPE_STRING, required=False),
+    openapi.Parameter('stream', openapi.IN_QUERY, description="true to stream every matching post in one response instead of a page", type=openapi.TYPE_STRING, required=False),
+]
+
 get_all_public_posts_docs = swagger_auto_schema(
     method='get',
     operation_summary="Get all public posts from all authors",
     operation_description="""
     **When to use**: Use this endpoint to get all publicly visible posts from all authors.
 
-    **How to use**: Send a GET request to retrieve all public posts
+    **How to use**: Send a GET request to retrieve a page of public posts, newest first. Follow `next` for the
+    following page, or send `cursor` for pages that stay stable while new posts come in. `since` only keeps the
+    posts published after a time, so it misses edits, deletions and posts copied from other nodes after they were
+    published; nodes keeping a copy of our posts up to date should poll /api/posts/changes/ instead.
+    `stream=true` sends every matching post in one response, written a chunk at a time.
 
     **Why/Why not**: Should be used as we would to see streams of only public posts.
     """,
+    manual_parameters=public_posts_params,
     responses={200: openapi.Response(
-        description="A list of public posts",
+        description="A page of public posts",
         examples={
             "application/json": {
-                "results": [
+                "type": "posts",
+                "count": 1,
+                "next": None,
+                "posts": [
                     {
                         "id": "550e8400-e29b-41d4-a716-446655440000",
                         "title": "My First Post",
@@ -290,7 +306,7 @@ stream_docs = swagger_auto_schema(
     operation_description="""
     **When to use**: Use this endpoint to retrieve a stream of posts relevant to the authenticated user, based on their follows, friends, and public posts.
 
-    **How to use**: Send a GET request. The endpoint will return public posts and additional posts based on the user's relationships (e.g., followed users, friends).
+    **How to use**: Send a GET request. The endpoint will return public posts and additional posts based on the user's relationships (e.g., followed users, friends). Add `?cursor=` to page with cursors instead of page numbers, then follow the `next` link.
 
     **Why/Why not**: Use this to view a personalized feed of posts, filtered based on visibility settings (public, unlisted, friends-only).
     """,
@@ -1033,6 +1049,10 @@ manage_remote_nodes_docs_post = swagger_auto_schema(
 )
 
 
+image_size_params = [
+    openapi.Parameter('w', openapi.IN_QUERY, description="Width in pixels to resize the image to, rounded up to 64, 320 or 1080. Wider requests get the full image", type=openapi.TYPE_INTEGER, required=False),
+]
+
 get_image_post_docs = swagger_auto_schema(
     method='get',
     operation_summary="get an image post",
@@ -1045,7 +1065,8 @@ get_image_post_docs = swagger_auto_schema(
     """,
     manual_parameters=[
         openapi.Parameter('author_id', openapi.IN_PATH, type=openapi.TYPE_STRING, description="Author ID", example="111"),
-        openapi.Parameter('post_id', openapi.IN_PATH, type=openapi.TYPE_STRING, description="Post ID", example="222")
+        openapi.Parameter('post_id', openapi.IN_PATH, type=openapi.TYPE_STRING, description="Post ID", example="222"),
+        *image_size_params,
     ],
     responses={
         200: openapi.Response(
@@ -1066,13 +1087,48 @@ get_image_post_docs = swagger_auto_schema(
 )
 
 
+get_hosted_image_docs = swagger_auto_schema(
+    method='get',
+    operation_summary="Get an uploaded image",
+    operation_description="""
+    **When to use**: Get an image uploaded to this node, optionally resized.
+
+    **How to use**: Send a GET request with the `file_name` of the image, as listed by `images/all/`. Add `w` for a smaller copy.
+
+    **Why**: Image pickers and profile pictures don't need the full size image.
+    """,
+    manual_parameters=[
+        openapi.Parameter('file_name', openapi.IN_PATH, type=openapi.TYPE_STRING, description="File name of the uploaded image", example="3f1c2a7e-5b1d-4c3e-9a8f-2d6b7e1f0c9a.png"),
+        *image_size_params,
+    ],
+    responses={
+        200: openapi.Response(
+            description="Image retrieved successfully",
+            examples={
+                "image/webp": "<binary image data>"
+            }
+        ),
+        404: openapi.Response(description="Image not found"),
+        400: openapi.Response(
+            description="Invalid width",
+            examples={"application/json": {"detail": "w must be a positive integer."}}
+        )
+    }
+)
+
+
 upload_image_docs = swagger_auto_schema(
     method='post',
     operation_summary="Upload an image",
     operation_description="""
     **When to use**: Upload a new image post.
 
-    **How to use**: Send a POST request with `image_data` (base64-encoded) and `content-type`.
+    **How to use**: Send a POST request in one of three ways:
+    - the image itself as the body, with its `Content-Type` (e.g. `image/png`)
+    - a multipart form with the image file in `image`
+    - `image_data`, the image as a base64 `data:` URI
+
+    Images can be at most 10 MB unless the node sets `MAX_IMAGE_UPLOAD_SIZE`. Uploading an image the node already hosts returns its existing URL.
 
     **Why**: Allows admins to upload new images for authors 
     """,
@@ -1097,9 +1153,17 @@ upload_image_docs = swagger_auto_schema(
             description="Image uploaded successfully",
             examples={"application/json": {"image_url": "http://localhost:8000/media/images/12345.png"}}
         ),
+        200: openapi.Response(
+            description="The image is already hosted",
+            examples={"application/json": {"image_url": "http://localhost:8000/media/images/12345.png"}}
+        ),
         400: openapi.Response(
             description="Invalid image data",
             examples={"application/json": {"error": "Invalid image data"}}
+        ),
+        413: openapi.Response(
+            description="Image too large",
+            examples={"application/json": {"error": "Images can be at most 10485760 bytes"}}
         )
     }
 )
@@ -1511,10 +1575,14 @@ get_all_hosted_images_docs = swagger_auto_schema(
     operation_description="""
     **When to use**: Use this endpoint to retrieve a list of all images hosted on this node.
 
-    **How to use**: Send a GET request to this endpoint. The user must be authenticated.
+    **How to use**: Send a GET request to this endpoint. The user must be authenticated. Images come newest first, 100 at a time; follow `next` for the next page.
 
-    **Why**: This helps users retrieve all stored images, specifically PNG and JPEG files, from the server.
+    **Why**: This helps users retrieve all stored images from the server.
     """,
+    manual_parameters=[
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Cursor from the previous page's next link, empty or left out for the first page", type=openapi.TYPE_STRING, required=False),
+        openapi.Parameter('size', openapi.IN_QUERY, description="Images per page, 100 by default and at most 100", type=openapi.TYPE_INTEGER, required=False),
+    ],
     responses={
         200: openapi.Response(
             description="List of hosted images retrieved",
@@ -1523,7 +1591,8 @@ get_all_hosted_images_docs = swagger_auto_schema(
                     "images": [
                         "/media/images/example1.png",
                         "/media/images/example2.jpeg"
-                    ]
+                    ],
+                    "next": "http://localhost:8000/api/authors/images/all/?cursor=MjAyNC0xMS0wMVQxMjowMDowMCswMDowMHw0Mg%3D%3D"
                 }
             }
         ),
@@ -1731,4 +1800,35 @@ handle_follow_delete_docs = swagger_auto_schema(
         401: openapi.Response(description="Authentication is required to perform this action."),
         404: openapi.Response(description="The author or foreign author does not exist."),
     },
-)
\ No newline at end of file
+)
+
+remote_node_stats_docs = swagger_auto_schema(
+    method='get',
+    operation_summary="Retrieve connection statistics for remote nodes",
+    operation_description="""
+    **When to use**: Use this endpoint to check how this server's connections to remote nodes are performing.
+
+    **How to use**: Send a GET request as an admin. The response has one entry per node client in this process.
+
+    **Why/Why not**: A low connection reuse rate or high latency means connections to a node are being reopened or the node is slow.
+    """,
+    responses={
+        200: openapi.Response(
+            description="Statistics for each remote node client",
+            examples={
+                "application/json": [
+                    {
+                        "url": "https://remote-host.com",
+                        "requests": 120,
+                        "errors": 2,
+                        "connections_opened": 3,
+                        "connection_reuse_rate": 0.975,
+                        "avg_latency_ms": 84.2,
+                        "max_latency_ms": 912.5
+                    }
+                ]
+            }
+        ),
+        403: "Forbidden"
+    }
+)
@@ -0,0 +1,170 @@
+'''
+Delivery of activities to inboxes on remote nodes.
+
+Views queue deliveries in the outbox table and return right away, with one delivery
+per node for public and unlisted posts to nodes that have a shared inbox. The send_deliveries management command
+sends them in the background over the pooled client of each node, nodes in parallel,
+retrying failures with exponential backoff. Deliveries to nodes whose circuit is open
+are held back until the circuit lets a probe through, without using up their attempts.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+import requests
+from .models import Delivery, RemoteNode
+from .node_clients import get_client, CircuitOpenError, CONNECT_TIMEOUT, READ_TIMEOUT
+
+MAX_ATTEMPTS = 8            # deliveries are marked FAILED after this many tries
+BACKOFF_BASE = 30           # seconds before the first retry, doubled after every failure
+BACKOFF_MAX = 6 * 60 * 60   # never wait longer than this between retries
+CLAIM_LEASE = 5 * 60        # seconds a claimed delivery is hidden from other workers
+CIRCUIT_OPEN = "circuit open"   # error of deliveries skipped because their node is down
+# a node's deliveries are sent one after another, so a claim takes few enough of them to all
+# time out well within the lease, before another worker could claim them again
+MAX_NODE_DELIVERIES = CLAIM_LEASE // (CONNECT_TIMEOUT + READ_TIMEOUT) // 2
+
+
+def plan_deliveries(recipients, payload, shared=False):
+    """
+    Group remote recipients by node. If shared, nodes with a shared inbox get the payload
+    once. Everything else goes to the inbox of each recipient.
+
+    The shared inbox gets no list of recipients, so only payloads any author of the node
+    may see, like public and unlisted posts, can be shared.
+    """
+    recipients_by_node = {}
+    for recipient in recipients:
+        node = recipient.remote_node
+        if node and node.is_active:
+            recipients_by_node.setdefault(node.id, (node, []))[1].append(recipient)
+
+    deliveries = []
+    for node, node_recipients in recipients_by_node.values():
+        if node.shared_inbox and shared:
+            deliveries.append(Delivery(remote_node=node, url=node.shared_inbox, payload=payload))
+        else:
+            deliveries.extend(
+                Delivery(remote_node=node, recipient=recipient, url=recipient.fqid + "/inbox/", payload=payload)
+                for recipient in node_recipients
+            )
+    return deliveries
+
+
+def queue_deliveries(recipients, payload, shared=False):
+    """
+    Add deliveries of a JSON payload for the remote recipients to the outbox.
+    """
+    return Delivery.objects.bulk_create(plan_deliveries(recipients, payload, shared))
+
+
+def get_backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def claim_deliveries(batch_size):
+    """
+    Take the deliveries that are due, pushing their next attempt back so that
+    other workers skip them while they are being sent. At most MAX_NODE_DELIVERIES
+    are taken for each node, the rest wait for the next claim.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = (
+            Delivery.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('remote_node')
+            .filter(status='PENDING', next_attempt_at__lte=now)
+            .exclude(remote_node__circuit_opened_at__gt=now - timedelta(seconds=RemoteNode.CIRCUIT_COOLDOWN))
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        deliveries = []
+        node_counts = {}
+        for delivery in due:
+            node_counts[delivery.remote_node_id] = node_counts.get(delivery.remote_node_id, 0) + 1
+            if node_counts[delivery.remote_node_id] <= MAX_NODE_DELIVERIES:
+                deliveries.append(delivery)
+        Delivery.objects.filter(id__in=[delivery.id for delivery in deliveries]).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_LEASE)
+        )
+    return deliveries
+
+
+def send_delivery(client, delivery):
+    """
+    Post a delivery to its inbox. Returns the status code (None if the node couldn't
+    be reached) and an error message.
+    """
+    try:
+        response = client.post(delivery.url, data=delivery.payload, headers={"Content-Type": "application/json"})
+    except CircuitOpenError:
+        return None, CIRCUIT_OPEN
+    except requests.RequestException as e:
+        return None, str(e)
+
+    if response.status_code >= 400:
+        return response.status_code, response.text[:500]
+    return response.status_code, ""
+
+
+def send_node_deliveries(deliveries):
+    """
+    Send deliveries that all go to the same node over the node's keep-alive client.
+    """
+    client = get_client(deliveries[0].remote_node)
+    return [(delivery, *send_delivery(client, delivery)) for delivery in deliveries]
+
+
+def record_result(delivery, status_code, error):
+    now = timezone.now()
+    if error == CIRCUIT_OPEN:
+        # the node is down, try again once its circuit lets a request through
+        delivery.next_attempt_at = now + timedelta(seconds=RemoteNode.CIRCUIT_COOLDOWN)
+        delivery.save(update_fields=['next_attempt_at'])
+        return
+
+    delivery.attempts += 1
+    delivery.last_status_code = status_code
+    delivery.last_error = error
+
+    if status_code is not None and status_code < 400:
+        delivery.status = 'SENT'
+        delivery.sent_at = now
+    elif status_code is not None and status_code < 500 and status_code != 429:
+        delivery.status = 'FAILED'      # the node rejected it, retrying won't help
+    elif delivery.attempts >= MAX_ATTEMPTS:
+        delivery.status = 'FAILED'
+    else:
+        delivery.next_attempt_at = now + get_backoff(delivery.attempts)
+
+    delivery.save(update_fields=['attempts', 'last_status_code', 'last_error', 'status', 'sent_at', 'next_attempt_at'])
+
+
+def process_deliveries(batch_size=100, workers=8):
+    """
+    Send one batch of due deliveries concurrently. Returns how many were attempted.
+    """
+    deliveries = claim_deliveries(batch_size)
+    if not deliveries:
+        return 0
+
+    deliveries_by_node = {}
+    for delivery in deliveries:
+        deliveries_by_node.setdefault(delivery.remote_node_id, []).append(delivery)
+
+    clients = [get_client(node_deliveries[0].remote_node) for node_deliveries in deliveries_by_node.values()]
+    for client in clients:
+        client.hold_health()
+    try:
+        # nodes are sent to in parallel, only the HTTP calls run in the pool and results are saved from this thread
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(send_node_deliveries, deliveries_by_node.values()))
+    finally:
+        for client in clients:
+            client.save_held_health()
+
+    for node_results in results:
+        for delivery, status_code, error in node_results:
+            record_result(delivery, status_code, error)
+
+    return len(deliveries)
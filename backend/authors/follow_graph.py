@@ -0,0 +1,168 @@
+'''
+Cached follow graph.
+
+For each author the cache keeps four id sets: the authors who follow them, the authors
+they follow, the authors who asked to follow them and the authors they asked to follow.
+The sets of any number of authors are loaded with one query. After that, relationship,
+friendship and follower counts are set lookups.
+
+Follow.save() and Follow.delete() evict both ends of the edge. Code that writes follows
+in bulk, and so skips those methods, must call follow_graph.forget() itself. Entries
+also expire after GRAPH_TTL, which bounds how stale another process's cache can get.
+
+Other processes don't see those evictions, so cached edges are only used for display,
+like relationships and follower counts. Decisions about who may read or is sent a post
+load the edges from the database with get(..., fresh=True) or query the follows directly.
+'''
+
+from collections import OrderedDict
+import threading
+import time
+from django.db import transaction
+from django.db.models import Q
+from .models import Follow
+
+CACHE_SIZE = 10000      # authors kept in the cache
+GRAPH_TTL = 60          # seconds an author's edges are used before they are loaded again
+
+
+class Edges:
+    def __init__(self):
+        self.followers = set()      # FOLLOWED edges into the author
+        self.following = set()      # FOLLOWED edges out of the author
+        self.requested = set()      # REQUESTED edges into the author
+        self.requesting = set()     # REQUESTED edges out of the author
+
+    @property
+    def friends(self):
+        return self.followers & self.following
+
+
+class FollowGraph:
+    """
+    Thread safe LRU cache of the follow edges of authors, by author id.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()    # author id -> (edges, expires)
+        self.lock = threading.Lock()
+
+    def get(self, author_ids, fresh=False):
+        """
+        Get the edges of authors by id, loading the authors that aren't cached in one query.
+        With fresh, every author is loaded, for checks that can't act on stale edges.
+        """
+        author_ids = set(author_ids)
+        if fresh:
+            loaded = self.load(author_ids)
+            self.put(loaded)
+            return loaded
+
+        edges = {}
+        now = time.monotonic()
+        with self.lock:
+            for author_id in author_ids:
+                entry = self.entries.get(author_id)
+                if entry is not None and now <= entry[1]:
+                    self.entries.move_to_end(author_id)
+                    edges[author_id] = entry[0]
+
+        missing = author_ids - edges.keys()
+        if missing:
+            loaded = self.load(missing)
+            self.put(loaded)
+            edges.update(loaded)
+        return edges
+
+    @staticmethod
+    def load(author_ids):
+        edges = {author_id: Edges() for author_id in author_ids}
+        rows = Follow.objects.filter(Q(user__in=author_ids) | Q(follower__in=author_ids)).values_list('user', 'follower', 'status')
+        for user_id, follower_id, status in rows:
+            followed = status == 'FOLLOWED'
+            if user_id in edges:
+                (edges[user_id].followers if followed else edges[user_id].requested).add(follower_id)
+            if follower_id in edges:
+                (edges[follower_id].following if followed else edges[follower_id].requesting).add(user_id)
+        return edges
+
+    def put(self, edges):
+        expires = time.monotonic() + GRAPH_TTL
+        with self.lock:
+            for author_id, author_edges in edges.items():
+                self.entries[author_id] = (author_edges, expires)
+                self.entries.move_to_end(author_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, author_ids):
+        with self.lock:
+            for author_id in author_ids:
+                self.entries.pop(author_id, None)
+
+    def forget(self, *author_ids):
+        """
+        Evict authors whose edges changed. They are evicted again once the transaction
+        commits, in case another thread loaded the old edges in the meantime.
+        """
+        self.discard(author_ids)
+        transaction.on_commit(lambda: self.discard(author_ids))
+
+    def forget_author(self, author_id):
+        # a deleted author's edges go away with it, so every author linked to it is stale
+        with self.lock:
+            stale = [
+                cached_id for cached_id, (edges, expires) in self.entries.items()
+                if cached_id == author_id or author_id in edges.followers | edges.following | edges.requested | edges.requesting
+            ]
+        self.forget(*stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+follow_graph = FollowGraph()
+
+
+def are_friends(author_1, author_2):
+    # decides who reads friends only posts, so it never uses the cache
+    edges = Follow.objects.filter(
+        Q(user=author_1, follower=author_2) | Q(user=author_2, follower=author_1), status='FOLLOWED'
+    )
+    return author_1.id != author_2.id and edges.count() == 2
+
+
+def get_friend_ids(author):
+    return follow_graph.get([author.id], fresh=True)[author.id].friends
+
+
+def get_relationships(request_user, authors):
+    """
+    Get the relationship of request_user to each of the authors, keyed by author id:
+    SELF, FRIENDS, FOLLOWED (request_user follows them), REQUESTED or NONE.
+    """
+    if request_user is None:
+        return {author.id: 'NONE' for author in authors}
+
+    edges = follow_graph.get([request_user.id])[request_user.id]
+    relationships = {}
+    for author in authors:
+        if author.id == request_user.id:
+            relationships[author.id] = 'SELF'
+        elif author.id in edges.following:
+            relationships[author.id] = 'FRIENDS' if author.id in edges.followers else 'FOLLOWED'
+        elif author.id in edges.requesting:
+            relationships[author.id] = 'REQUESTED'
+        else:
+            relationships[author.id] = 'NONE'
+    return relationships
+
+
+def get_counts(authors):
+    """
+    Get the (followers, following) counts of authors, keyed by author id.
+    """
+    edges = follow_graph.get([author.id for author in authors])
+    return {author_id: (len(author_edges.followers), len(author_edges.following)) for author_id, author_edges in edges.items()}
@@ -0,0 +1,273 @@
+'''
+Ingestion of activities that remote nodes post to our inboxes.
+
+The inbox view only validates an activity and stores it in the inbox queue table,
+then answers 202. The process_inbox management command applies queued activities in
+batches: authors are resolved for the whole batch at once by resolve_authors, and
+posts, follows, likes and comments are written with bulk queries.
+
+Likes and comments are stored under their id, so one that is sent again is only applied
+once, unless it failed before. Posts and follows are queued every time they are sent;
+posts that didn't change since they were stored are skipped when they are applied.
+'''
+
+from collections import Counter
+import json
+import uuid
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from posts.models import Post, Comment, Like, TimelineEntry, Change, SYNCED_FIELDS
+from .models import Author, Follow, InboxItem
+from .remote_authors import resolve_authors
+
+# fields an activity of each type must have to be queued
+REQUIRED_FIELDS = {
+    'post': ['id', 'title', 'content', 'contentType', 'visibility', 'author'],
+    'follow': ['actor', 'object'],
+    'like': ['id', 'object', 'author'],
+    'comment': ['comment', 'contentType', 'post', 'author'],
+}
+AUTHOR_FIELD = {'post': 'author', 'follow': 'actor', 'like': 'author', 'comment': 'author'}
+
+
+def validate_activity(activity):
+    """
+    Check that an activity can be applied later. Returns an error message, or None.
+    """
+    if not isinstance(activity, dict):
+        return "Activity must be a JSON object."
+
+    item_type = activity.get('type')
+    if item_type not in REQUIRED_FIELDS:
+        return f"Unsupported activity type: {item_type}."
+
+    missing = [field for field in REQUIRED_FIELDS[item_type] if activity.get(field) in (None, "")]
+    if missing:
+        return f"Missing fields: {', '.join(missing)}."
+
+    actor = activity[AUTHOR_FIELD[item_type]]
+    if not isinstance(actor, dict) or not actor.get('id'):
+        return "Author of the activity must have an id."
+    if item_type == 'follow' and (not isinstance(activity['object'], dict) or not activity['object'].get('id')):
+        return "Object of a follow must have an id."
+    return None
+
+
+def get_activity_id(activity):
+    # only likes and comments have ids of their own. Posts are sent again when edited and
+    # follows when asked again after a rejection, so every one of those is queued
+    if activity['type'] in ('like', 'comment') and activity.get('id'):
+        return activity['id']
+    return f"{activity['type']}:{uuid.uuid4()}"
+
+
+def queue_activity(activity):
+    """
+    Store a validated activity for the inbox worker. Returns False if it is a like or
+    comment that was already queued or applied.
+    """
+    payload = json.loads(json.dumps(activity, cls=DjangoJSONEncoder))
+    item, created = InboxItem.objects.get_or_create(
+        activity_id=get_activity_id(activity),
+        defaults={'type': activity['type'], 'payload': payload},
+    )
+    if not created and item.status == 'FAILED':
+        # e.g. its author couldn't be resolved while their node was down, so try it again
+        InboxItem.objects.filter(id=item.id, status='FAILED').update(
+            status='PENDING', error="", payload=payload, received_at=timezone.now(), processed_at=None,
+        )
+        return True
+    return created
+
+
+def fail(item, error):
+    item.status = 'FAILED'
+    item.error = error
+
+
+def apply_posts(items, authors):
+    # the last version of a post in the batch wins
+    latest = {item.payload['id']: item for item in items}
+    existing = set(Post.objects.filter(fqid__in=latest).values_list('fqid', flat=True))
+
+    deleted = [fqid for fqid, item in latest.items() if fqid in existing and item.payload['visibility'] == 'DELETED']
+    if deleted:
+        Post.objects.filter(fqid__in=deleted).update(is_deleted=True, visibility='DELETED')
+        TimelineEntry.remove(Post.objects.filter(fqid__in=deleted))
+        Change.record_posts(Post.objects.filter(fqid__in=deleted))
+
+    upsert_posts([item.payload for fqid, item in latest.items() if fqid not in deleted],
+                 lambda post_object: authors[post_object['author']['id']])
+
+
+def upsert_posts(post_objects, get_author):
+    """
+    Create or update posts from post objects sent by other nodes with one bulk upsert
+    keyed on fqid, then add them to readers' streams. get_author gives the Author of a
+    post object.
+    """
+    stored = {post.fqid: post for post in Post.objects.filter(fqid__in=[post_object['id'] for post_object in post_objects])}
+
+    upserts = []
+    for post_object in post_objects:
+        author = get_author(post_object)
+        post = Post(
+            fqid=post_object['id'],
+            author=author,
+            title=post_object['title'],
+            description=post_object.get('description', ''),
+            contentType=post_object['contentType'],
+            content=post_object['content'],
+            visibility=post_object['visibility'],
+            published=post_object.get('published') or timezone.now(),
+        )
+        post.page = post_object.get('page') or f"{author.page}/posts/{post.id}"
+        post.store_image()
+        if post.fqid in stored and not Post.has_changes(stored[post.fqid], post):
+            continue    # sent again as it is
+        upserts.append(post)
+    if not upserts:
+        return
+
+    Post.objects.bulk_create(
+        upserts, update_conflicts=True, unique_fields=['fqid'],
+        update_fields=SYNCED_FIELDS,
+    )
+    posts = list(Post.objects.filter(fqid__in=[post.fqid for post in upserts]).select_related('author'))
+    for post in posts:
+        TimelineEntry.fan_out(post)
+    Change.record_posts(posts)
+
+
+def apply_follows(items, authors):
+    local_authors = {author.fqid: author for author in Author.objects.filter(fqid__in=[item.payload['object']['id'] for item in items])}
+
+    follows = []
+    for item in items:
+        local_author = local_authors.get(item.payload['object']['id'])
+        if local_author is None:
+            fail(item, "Followed author not found.")
+            continue
+        follows.append(Follow(user=local_author, follower=authors[item.payload['actor']['id']], status='REQUESTED'))
+
+    # follows that already exist keep their status
+    Follow.objects.bulk_create(follows, ignore_conflicts=True)
+    Follow.forget_edges(*{follow.user_id for follow in follows}, *{follow.follower_id for follow in follows})
+
+
+def apply_likes(items, authors):
+    objects = [item.payload['object'] for item in items]
+    # comments first, their ids have no shape that sets them apart from posts on every node
+    comments = {comment.fqid: comment for comment in Comment.objects.filter(fqid__in=objects)}
+    posts = {post.fqid: post for post in Post.objects.filter(fqid__in=[fqid for fqid in objects if fqid not in comments])}
+    existing = set(Like.objects.filter(fqid__in=[item.payload['id'] for item in items]).values_list('fqid', flat=True))
+
+    likes = []
+    for item in items:
+        activity = item.payload
+        if activity['id'] in existing:
+            continue
+        if activity['object'] in comments:
+            target = {'comment': comments[activity['object']]}
+        elif activity['object'] in posts:
+            target = {'post': posts[activity['object']]}
+        else:
+            fail(item, "Liked object not found.")
+            continue
+        likes.append(Like(
+            author=authors[activity['author']['id']],
+            object=activity['object'],
+            fqid=activity['id'],
+            published=activity.get('published') or timezone.now(),
+            **target,
+        ))
+    Like.objects.bulk_create(likes)
+    Change.record_likes(likes)
+
+    # count the new likes on what they liked, one update per liked object
+    for (model, target_id), count in Counter((Comment, like.comment_id) if like.comment_id else (Post, like.post_id) for like in likes).items():
+        model.objects.filter(pk=target_id).update(likes_count=F('likes_count') + count)
+
+
+def apply_comments(items, authors):
+    posts = {post.fqid: post for post in Post.objects.filter(fqid__in=[item.payload['post'] for item in items])}
+    existing = set(Comment.objects.filter(fqid__in=[item.payload['id'] for item in items if item.payload.get('id')]).values_list('fqid', flat=True))
+
+    comments = []
+    for item in items:
+        activity = item.payload
+        if activity.get('id') in existing:
+            continue
+        post = posts.get(activity['post'])
+        if post is None:
+            fail(item, "Commented post not found.")
+            continue
+        author = authors[activity['author']['id']]
+        comment = Comment(
+            author=author,
+            comment=activity['comment'],
+            contentType=activity['contentType'],
+            post=post,
+            published=activity.get('published') or timezone.now(),
+        )
+        comment.fqid = activity.get('id') or f"{author.host}authors/{author.id}/commented/{comment.id}"
+        comments.append(comment)
+    Comment.objects.bulk_create(comments)
+    Change.record_comments(comments)
+
+    for post_id, count in Counter(comment.post_id for comment in comments).items():
+        Post.objects.filter(pk=post_id).update(comments_count=F('comments_count') + count)
+
+
+# applied in this order so likes and comments find posts and comments from the same batch
+APPLIERS = [('post', apply_posts), ('follow', apply_follows), ('comment', apply_comments), ('like', apply_likes)]
+
+
+def apply_items(items):
+    """
+    Apply a batch of queued activities. Items that can't be applied are marked FAILED.
+    """
+    authors = resolve_authors(item.payload[AUTHOR_FIELD[item.type]] for item in items)
+    for item_type, apply in APPLIERS:
+        typed_items = [item for item in items if item.type == item_type]
+        if typed_items:
+            apply(typed_items, authors)
+
+    now = timezone.now()
+    for item in items:
+        item.processed_at = now
+        if item.status == 'PENDING':
+            item.status = 'APPLIED'
+
+
+def process_inbox(batch_size=500):
+    """
+    Apply one batch of queued activities. Returns how many were processed.
+    """
+    with transaction.atomic():
+        items = list(
+            InboxItem.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING')
+            .order_by('received_at', 'id')[:batch_size]
+        )
+        if not items:
+            return 0
+
+        try:
+            with transaction.atomic():
+                apply_items(items)
+        except Exception:
+            # something in the batch is broken, apply the items one at a time to find it
+            for item in items:
+                item.status, item.error = 'PENDING', ""
+                try:
+                    with transaction.atomic():
+                        apply_items([item])
+                except Exception as e:
+                    fail(item, str(e))
+                    item.processed_at = timezone.now()
+
+        InboxItem.objects.bulk_update(items, ['status', 'error', 'processed_at'])
+    return len(items)
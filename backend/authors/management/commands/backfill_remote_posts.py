@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from authors.backfill import process_backfills, request_all_backfills
+
+
+class Command(BaseCommand):
+    help = "Copy the new posts of remote authors whose backfill was requested."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="run the requested backfills and exit")
+        parser.add_argument('--refresh-all', action='store_true', help="first request a backfill of every followed remote author")
+        parser.add_argument('--batch-size', type=int, default=20, help="authors backfilled at a time")
+        parser.add_argument('--workers', type=int, default=8, help="authors fetched at the same time")
+        parser.add_argument('--interval', type=float, default=5.0, help="seconds to wait when nothing was requested")
+
+    def handle(self, *args, **options):
+        if options['refresh_all']:
+            request_all_backfills()
+
+        while True:
+            backfilled = process_backfills(batch_size=options['batch_size'], workers=options['workers'])
+            if backfilled:
+                self.stdout.write(f"Backfilled {backfilled} authors.")
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from authors.crawler import crawl_nodes, PAGE_SIZE
+from authors.models import RemoteNode
+
+
+class Command(BaseCommand):
+    help = "Crawl the authors of remote nodes concurrently, resuming from each node's checkpoint. Meant to be run on a schedule."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--node', action='append', help="url of a node to crawl, can be repeated (default: all active nodes)")
+        parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help="authors asked for per page")
+        parser.add_argument('--workers', type=int, default=8, help="nodes crawled at the same time")
+        parser.add_argument('--restart', action='store_true', help="start from the first page instead of the checkpoint")
+
+    def handle(self, *args, **options):
+        nodes = RemoteNode.objects.filter(url__in=options['node']) if options['node'] else None
+        summary = crawl_nodes(nodes, page_size=options['page_size'], workers=options['workers'], restart=options['restart'])
+
+        for url, node_summary in summary.items():
+            line = f"{url}: {node_summary['pages']} pages, {node_summary['created']} created, {node_summary['updated']} updated"
+            if node_summary['error']:
+                self.stderr.write(f"{line}, stopped: {node_summary['error']}")
+            else:
+                self.stdout.write(line + (", finished" if node_summary['finished'] else ""))
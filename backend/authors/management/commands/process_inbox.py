@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from authors.inbox import process_inbox
+
+
+class Command(BaseCommand):
+    help = "Apply activities queued by the inbox in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="apply the queued activities and exit")
+        parser.add_argument('--batch-size', type=int, default=500, help="activities applied at a time")
+        parser.add_argument('--interval', type=float, default=1.0, help="seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_inbox(batch_size=options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} activities.")
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from authors.federation import process_deliveries
+
+
+class Command(BaseCommand):
+    help = "Send queued deliveries to remote inboxes, retrying failures with exponential backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="send the deliveries that are due and exit")
+        parser.add_argument('--batch-size', type=int, default=100, help="deliveries claimed at a time")
+        parser.add_argument('--workers', type=int, default=8, help="concurrent requests to remote nodes")
+        parser.add_argument('--interval', type=float, default=2.0, help="seconds to wait when nothing is due")
+
+    def handle(self, *args, **options):
+        while True:
+            sent = process_deliveries(batch_size=options['batch_size'], workers=options['workers'])
+            if sent:
+                self.stdout.write(f"Attempted {sent} deliveries.")
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authors', '0025_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remotenode',
+            name='shared_inbox',
+            field=models.URLField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='delivery',
+            name='recipient',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authors', '0026_remotenode_shared_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remotenode',
+            name='circuit_opened_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='remotenode',
+            name='consecutive_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='remotenode',
+            name='last_failure_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='remotenode',
+            name='last_success_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='remotenode',
+            name='latency_p50',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='remotenode',
+            name='latency_p95',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
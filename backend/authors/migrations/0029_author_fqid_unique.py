@@ -0,0 +1,47 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:58
+
+from django.db import IntegrityError, migrations, models, transaction
+from django.db.models import Count, Min
+
+
+def merge_into(Author, kept_id, duplicate_ids):
+    # move every row that points at the duplicates (posts, follows, likes, ...) to the kept author
+    for relation in Author._meta.related_objects:
+        if relation.many_to_many:
+            continue
+        model, field = relation.related_model, relation.field.name
+        for row in model._base_manager.filter(**{f"{field}__in": duplicate_ids}):
+            try:
+                with transaction.atomic():
+                    model._base_manager.filter(pk=row.pk).update(**{field: kept_id})
+            except IntegrityError:
+                # the kept author already has the same row, e.g. the same follow
+                row.delete()
+
+
+def clear_duplicate_fqids(apps, schema_editor):
+    # the oldest author keeps an fqid that was stored more than once and takes over the others' rows, the others lose it
+    Author = apps.get_model('authors', 'Author')
+    Author.objects.filter(fqid="").update(fqid=None)
+    duplicates = Author.objects.exclude(fqid=None).values('fqid').annotate(count=Count('id'), first=Min('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        others = Author.objects.filter(fqid=duplicate['fqid']).exclude(id=duplicate['first'])
+        merge_into(Author, duplicate['first'], list(others.values_list('id', flat=True)))
+        others.update(fqid=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authors', '0028_inboxitem'),
+        ('posts', '0013_published_default'),     # posts, likes and comments of duplicates are merged
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicate_fqids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='author',
+            name='fqid',
+            field=models.URLField(blank=True, null=True, unique=True),
+        ),
+    ]
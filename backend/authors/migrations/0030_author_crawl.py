@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authors', '0029_author_fqid_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='profile_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='remotenode',
+            name='author_crawl_page',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='remotenode',
+            name='authors_crawled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authors', '0030_author_crawl'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RemotePostSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('high_water', models.DateTimeField(blank=True, null=True)),
+                ('requested_at', models.DateTimeField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='post_sync', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['requested_at'], name='post_sync_requested_idx')],
+            },
+        ),
+    ]
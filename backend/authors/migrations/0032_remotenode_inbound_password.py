@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:05
+
+from django.contrib.auth.hashers import make_password
+from django.db import migrations, models
+
+
+def hash_inbound_passwords(apps, schema_editor):
+    # nodes keep using the password they were given until it is set apart
+    RemoteNode = apps.get_model('authors', 'RemoteNode')
+    for node in RemoteNode.objects.all():
+        RemoteNode.objects.filter(id=node.id).update(inbound_password=make_password(node.password))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authors', '0031_remotepostsync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remotenode',
+            name='inbound_password',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+        migrations.RunPython(hash_inbound_passwords, migrations.RunPython.noop),
+    ]
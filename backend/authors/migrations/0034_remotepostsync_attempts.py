@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authors', '0033_follow_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remotepostsync',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authors', '0035_tokenrevocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remotenode',
+            name='author_crawl_page_size',
+            field=models.PositiveIntegerField(default=100),
+        ),
+    ]
@@ -6,9 +6,12 @@ date: October 15, 2024
 '''
 
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.contrib.auth.hashers import make_password, check_password
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
 
 class AuthorManager(BaseUserManager):
     def create_user(self, username, password=None, **extra_fields):
@@ -50,7 +53,8 @@ class Author(AbstractBaseUser, PermissionsMixin):
     page = models.URLField(blank=True, null=True)
     username = models.CharField(max_length=250, unique=True)
     password = models.CharField(max_length=500)
-    fqid = models.URLField(blank=True, null=True)
+    fqid = models.URLField(blank=True, null=True, unique=True)
+    profile_hash = models.CharField(max_length=64, blank=True, default="")  # Hash of the profile a remote node last sent, to skip unchanged authors when crawling
 
     remote_node = models.ForeignKey(
         'RemoteNode',
@@ -68,11 +72,42 @@ class Author(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'username'
     
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        author = super().from_db(db, field_names, values)
+        author.saved_credentials = author.credentials()
+        return author
+
+    def credentials(self):
+        # the fields that decide whether the author's tokens are still good, None while deferred
+        return self.__dict__.get('password'), self.__dict__.get('is_active')
+
     def save(self, *args, **kwargs):
+        # a new author has no tokens, a loaded one only needs them revoked when its credentials changed
+        credentials_changed = getattr(self, 'saved_credentials', self.credentials()) != self.credentials()
         # save fqid on object save
         super().save(*args, **kwargs)   # need to save object to get id first
         if not self.fqid:
             Author.objects.filter(id=self.id).update(fqid=f"{self.host}authors/{self.id}")
+        self.saved_credentials = self.credentials()
+        self.forget(revoke=credentials_changed)
+
+    def delete(self, *args, **kwargs):
+        from .follow_graph import follow_graph
+        self.forget(revoke=True)
+        follow_graph.forget_author(self.id)     # its follows are deleted with it
+        return super().delete(*args, **kwargs)
+
+    def forget(self, revoke=False):
+        # drop cached copies of the author, so changes apply to the next request
+        from .follow_graph import follow_graph
+        from .remote_authors import author_cache
+        from .token_authentication import revoke_tokens, token_cache
+        author_cache.discard(self.fqid)
+        token_cache.forget_user(self.id)    # the cached tokens hold the old author
+        if revoke and self.remote_node_id is None:     # only local authors have tokens
+            revoke_tokens(self.id)
+        follow_graph.discard([self.id])
 
 class Follow(models.Model):
     STATUS_CHOICES = [
@@ -81,23 +116,55 @@ class Follow(models.Model):
     ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='followers')
-    follower = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    follower = models.ForeignKey(settings.AUTH_USER_MODEL, db_index=False, on_delete=models.CASCADE)
     status = models.CharField(choices=STATUS_CHOICES, max_length=20, default= 'REQUESTED')
 
     class Meta:
         unique_together = ['user', 'follower']
+        indexes = [
+            # followers or followings of an author by status, the other end is read from the index alone
+            models.Index(fields=['user', 'status', 'follower'], name='follow_user_status_idx'),
+            models.Index(fields=['follower', 'status', 'user'], name='follow_follower_status_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # a new request doesn't change what either author can see
+        new_request = self._state.adding and self.status == 'REQUESTED'
+        super().save(*args, **kwargs)
+        Follow.forget_edges(self.user_id, self.follower_id)
+        if not new_request:
+            Follow.refresh_timelines(self.user, self.follower)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Follow.forget_edges(self.user_id, self.follower_id)
+        if self.status == 'FOLLOWED':
+            Follow.refresh_timelines(self.user, self.follower)
+        return result
+
+    @staticmethod
+    def forget_edges(*author_ids):
+        # drop the cached follow graph of both ends, see follow_graph.py
+        from .follow_graph import follow_graph
+        follow_graph.forget(*author_ids)
+
+    @staticmethod
+    def refresh_timelines(user, follower):
+        # the edge decides which of user's posts the follower sees, and as friendship which of the follower's posts user sees
+        from posts.models import TimelineEntry
+        TimelineEntry.sync_pair(follower, user)
+        TimelineEntry.sync_pair(user, follower)
 
     @staticmethod
     def are_friends(user1, user2):
-        follow_1 = Follow.objects.filter(user=user1, follower=user2, status='FOLLOWED').exists()
-        follow_2 = Follow.objects.filter(user=user2, follower=user1, status='FOLLOWED').exists()
-        return follow_1 and follow_2
+        from .follow_graph import are_friends
+        return are_friends(user1, user2)
 
     @staticmethod
     def get_friends(user):
-        friends_1 = Follow.objects.filter(user=user, status='FOLLOWED').values_list('follower')
-        friends_2 = Follow.objects.filter(follower=user, status='FOLLOWED').values_list('user')
-        return friends_1.intersection(friends_2)
+        # ids of the authors that follow user and are followed back
+        from .follow_graph import get_friend_ids
+        return get_friend_ids(user)
 
 
 
@@ -114,6 +181,144 @@ class SiteConfiguration(models.Model):
 class RemoteNode(models.Model):
     url = models.URLField(unique=True)
     username = models.CharField(max_length=250)
-    password = models.CharField(max_length=250, default="password")
+    password = models.CharField(max_length=250, default="password")  # Sent to the node on our requests, so it can't be hashed
+    inbound_password = models.CharField(max_length=128, blank=True, default="")  # Salted hash of the password the node sends us, nodes without one can't reach us
     is_active = models.BooleanField(default=True)  # To easily enable/disable nodes
- 
+    shared_inbox = models.URLField(blank=True, default="")  # Inbox that takes an activity once for all of the node's authors, if the node has one
+
+    # health of the node, kept up to date by its client in node_clients.py
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    last_failure_at = models.DateTimeField(null=True, blank=True)
+    circuit_opened_at = models.DateTimeField(null=True, blank=True)  # Set while the node is considered down
+    latency_p50 = models.FloatField(null=True, blank=True)  # ms, over the client's recent requests
+    latency_p95 = models.FloatField(null=True, blank=True)
+
+    # checkpoint of the author crawl, see crawler.py
+    author_crawl_page = models.PositiveIntegerField(default=1)  # Next page of the node's authors to fetch, kept so an interrupted crawl resumes
+    author_crawl_page_size = models.PositiveIntegerField(default=100)  # Page size the checkpoint counts in, a crawl with another size starts over
+    authors_crawled_at = models.DateTimeField(null=True, blank=True)  # When the last full crawl of the node's authors finished
+
+    FAILURE_THRESHOLD = 5   # consecutive failures that open the circuit
+    CIRCUIT_COOLDOWN = 60   # seconds an open circuit skips requests before letting a probe through
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        RemoteNode.forget_credentials(self.id)
+
+    def delete(self, *args, **kwargs):
+        node_id = self.id
+        result = super().delete(*args, **kwargs)
+        RemoteNode.forget_credentials(node_id)
+        return result
+
+    def set_inbound_password(self, raw_password):
+        self.inbound_password = make_password(raw_password)
+
+    def check_inbound_password(self, raw_password):
+        return bool(self.inbound_password) and check_password(raw_password, self.inbound_password)
+
+    @staticmethod
+    def forget_credentials(node_id):
+        # edits and deactivation must apply to the next request, not once the cached verification expires
+        from .node_authentication import credential_cache
+        credential_cache.forget_node(node_id)
+
+    def circuit_retry_at(self):
+        return self.circuit_opened_at + timedelta(seconds=self.CIRCUIT_COOLDOWN)
+
+    def circuit_state(self):
+        """
+        CLOSED while the node is healthy, OPEN while requests to it are skipped and
+        HALF_OPEN once a probe request may be let through to see if it is back.
+        """
+        if self.circuit_opened_at is None:
+            return 'CLOSED'
+        if timezone.now() < self.circuit_retry_at():
+            return 'OPEN'
+        return 'HALF_OPEN'
+
+
+class Delivery(models.Model):
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    remote_node = models.ForeignKey(RemoteNode, on_delete=models.CASCADE, related_name='deliveries')
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='deliveries', blank=True, null=True)   # empty for deliveries to a shared inbox
+    url = models.URLField(max_length=500)   # inbox the payload is posted to
+    payload = models.TextField()            # JSON body
+    status = models.CharField(choices=STATUS_CHOICES, max_length=10, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_status_code = models.IntegerField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name_plural = "Deliveries"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='delivery_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} delivery to {self.url}"
+
+
+class InboxItem(models.Model):
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('APPLIED', 'Applied'),
+        ('FAILED', 'Failed'),
+    ]
+
+    activity_id = models.CharField(max_length=255, unique=True)    # id of a like or comment, so resent ones are stored once; posts and follows get a unique one
+    type = models.CharField(max_length=20)
+    payload = models.JSONField()
+    status = models.CharField(choices=STATUS_CHOICES, max_length=10, default='PENDING')
+    error = models.TextField(blank=True, default="")
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'received_at'], name='inbox_item_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} {self.type} {self.activity_id}"
+
+
+class RemotePostSync(models.Model):
+    author = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='post_sync')   # remote author whose posts are copied here
+    high_water = models.DateTimeField(blank=True, null=True)    # published time of the newest post copied, later backfills stop at it
+    requested_at = models.DateTimeField(blank=True, null=True)  # when the worker should run the backfill, null once it succeeded
+    synced_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)   # failed backfills in a row, sets the backoff before the next retry
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['requested_at'], name='post_sync_requested_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post sync of {self.author}"
+
+class TokenRevocation(models.Model):
+    # a user whose API tokens every process must stop trusting from its cache, because they
+    # logged out, their account changed or it was deleted. Rows are only needed until the
+    # cached tokens they are about would have expired anyway.
+    user_id = models.BigIntegerField()     # not a foreign key, deleted users are revoked too
+    revoked_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['revoked_at'], name='token_revocation_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"Tokens of {self.user_id} revoked at {self.revoked_at}"
@@ -2,6 +2,64 @@ from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from .models import RemoteNode
 import base64
+import binascii
+import hashlib
+import threading
+import time
+
+VERIFIED_TTL = 60   # seconds a verified node credential is trusted without checking it again
+
+
+class CredentialCache:
+    """
+    Credentials that were verified recently, so requests from the same node skip the
+    password hash. Only a digest of the credentials is kept.
+
+    Each process has its own cache, so a hit is still checked against the node's row:
+    a node that was deactivated or given a new password in another process is refused
+    on its next request.
+    """
+
+    def __init__(self):
+        self.entries = {}   # digest -> (node, expires)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def digest(username, password):
+        return hashlib.sha256(f"{username}:{password}".encode()).hexdigest()
+
+    def get(self, username, password):
+        key = self.digest(username, password)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            node, expires = entry
+            if time.monotonic() > expires:
+                del self.entries[key]
+                return None
+            return node
+
+    def put(self, username, password, node):
+        with self.lock:
+            self.entries[self.digest(username, password)] = (node, time.monotonic() + VERIFIED_TTL)
+
+    def forget(self, username, password):
+        with self.lock:
+            self.entries.pop(self.digest(username, password), None)
+
+    def forget_node(self, node_id):
+        with self.lock:
+            for key in [key for key, (node, expires) in self.entries.items() if node.id == node_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+credential_cache = CredentialCache()
+
 
 # to authenticate incoming requests from remote nodes
 class NodeBasicAuthentication(BaseAuthentication):
@@ -10,13 +68,22 @@ class NodeBasicAuthentication(BaseAuthentication):
         if not auth_header or not auth_header.startswith('Basic '):
             return None
 
-        auth_data = auth_header.split(' ')[1]
-        decoded_auth = base64.b64decode(auth_data).decode('utf-8')
-        username, password = decoded_auth.split(':')
-
         try:
-            node = RemoteNode.objects.get(username=username, password=password, is_active=True)
-        except RemoteNode.DoesNotExist:
-            raise AuthenticationFailed('Invalid node credentials')
+            auth_data = auth_header.split(' ')[1]
+            decoded_auth = base64.b64decode(auth_data).decode('utf-8')
+        except (IndexError, binascii.Error, UnicodeDecodeError):
+            raise AuthenticationFailed('Invalid basic authentication header')
+        username, _, password = decoded_auth.partition(':')
+
+        node = credential_cache.get(username, password)
+        if node is not None:
+            node = RemoteNode.objects.filter(id=node.id, is_active=True, inbound_password=node.inbound_password).first()
+            if node is not None:
+                return (node, None)
+            credential_cache.forget(username, password)
 
-        return (node, None)
+        for node in RemoteNode.objects.filter(username=username, is_active=True):
+            if node.check_inbound_password(password):
+                credential_cache.put(username, password, node)
+                return (node, None)
+        raise AuthenticationFailed('Invalid node credentials')
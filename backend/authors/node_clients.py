@@ -0,0 +1,260 @@
+'''
+Keep-alive HTTP clients for traffic to remote nodes.
+
+Every call to a remote node should go through get_client(node) so that connections to
+the node are pooled and reused instead of opening a new one per request.
+
+The client also tracks the health of its node. After enough consecutive failures the
+node's circuit opens and requests fail right away with CircuitOpenError instead of
+waiting on a timeout. Once the cooldown passes one probe request is let through, and
+the circuit closes again if it succeeds.
+
+Several processes share a node's health row, so failures are added to the stored count
+with F() instead of overwriting it, and only a success writes it outright, back to zero.
+'''
+
+from collections import deque
+import threading
+import time
+import requests
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from .models import RemoteNode
+
+CONNECT_TIMEOUT = 3     # seconds to open a connection to a node
+READ_TIMEOUT = 5        # seconds to wait for a node to answer
+POOL_SIZE = 10          # connections kept open per node
+LATENCY_SAMPLES = 200   # recent requests the latency percentiles are taken over
+HEALTH_SAVE_INTERVAL = 30   # seconds between saves of a healthy node's latency
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    Raised instead of sending a request to a node whose circuit is open.
+    """
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[round(fraction * (len(ordered) - 1))]
+
+
+class NodeClient:
+    """
+    HTTP client for one remote node, shared by every request made to that node.
+    """
+
+    def __init__(self, base_url, username=None, password=None):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if username is not None:
+            self.session.auth = HTTPBasicAuth(username, password)
+        self.session.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip'})
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+        self.node = None        # the client's own copy of the RemoteNode whose health is tracked, if any
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.probing = False
+        self.health_saved_at = 0.0
+        self.held_fields = None     # health fields waiting to be saved, while saves are held
+        self.unsaved_failures = 0   # failures not added to the stored count yet
+        self.failures_reset = False     # a success since the last save, the stored count starts again from zero
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+        node = self.node
+        probe = node is not None and self.check_circuit(node)
+
+        start = time.monotonic()
+        try:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException:
+                latency = time.monotonic() - start
+                self.record(latency, ok=False)
+                if node is not None:
+                    self.record_failure(node)
+                raise
+
+            latency = time.monotonic() - start
+            ok = response.status_code < 500 and response.status_code != 429
+            self.record(latency, ok)
+            if node is not None:
+                if ok:
+                    self.record_success(node)
+                else:
+                    self.record_failure(node)
+            return response
+        finally:
+            if probe:
+                # a probe that ended in any other error lets the next request probe again
+                with self.lock:
+                    self.probing = False
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.requests += 1
+            self.errors += not ok
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if ok:
+                self.latencies.append(latency * 1000)
+
+    def check_circuit(self, node):
+        # returns whether the request is the probe of a half open circuit
+        state = node.circuit_state()
+        with self.lock:
+            if state == 'CLOSED':
+                return False
+            if state == 'HALF_OPEN' and not self.probing:
+                self.probing = True     # let this request through as the probe
+                return True
+        raise CircuitOpenError(f"Circuit for {self.base_url} is open until {node.circuit_retry_at()}")
+
+    def record_success(self, node):
+        now = time.monotonic()
+        with self.lock:
+            self.probing = False
+            recovered = node.consecutive_failures or node.circuit_opened_at
+            if not recovered and now - self.health_saved_at < HEALTH_SAVE_INTERVAL:
+                return
+            self.health_saved_at = now
+            node.consecutive_failures = 0
+            self.unsaved_failures = 0
+            self.failures_reset = True
+            node.circuit_opened_at = None
+            node.last_success_at = timezone.now()
+            node.latency_p50 = percentile(self.latencies, 0.5)
+            node.latency_p95 = percentile(self.latencies, 0.95)
+        self.save_health(node, ['consecutive_failures', 'circuit_opened_at', 'last_success_at', 'latency_p50', 'latency_p95'])
+
+    def record_failure(self, node):
+        with self.lock:
+            node.consecutive_failures += 1
+            self.unsaved_failures += 1
+            node.last_failure_at = timezone.now()
+            # a failed probe opens the circuit again for another cooldown
+            if self.probing or node.consecutive_failures >= node.FAILURE_THRESHOLD:
+                node.circuit_opened_at = node.last_failure_at
+            self.probing = False
+        self.save_health(node, ['consecutive_failures', 'last_failure_at', 'circuit_opened_at'])
+
+    def save_health(self, node, fields):
+        with self.lock:
+            if self.held_fields is not None:
+                self.held_fields.update(fields)
+                return
+            values = {field: getattr(node, field) for field in fields}
+            if 'consecutive_failures' in fields:
+                failures, reset = self.unsaved_failures, self.failures_reset
+                self.unsaved_failures, self.failures_reset = 0, False
+                values['consecutive_failures'] = failures if reset else F('consecutive_failures') + failures
+        RemoteNode.objects.filter(pk=node.pk).update(**values)
+
+    def hold_health(self):
+        """
+        Keep health changes in memory until save_held_health() is called, for callers
+        that make requests from threads that shouldn't touch the database. Callers call
+        save_held_health() in a finally block, or the client keeps holding them.
+        """
+        with self.lock:
+            self.held_fields = set()
+
+    def save_held_health(self):
+        with self.lock:
+            fields, self.held_fields = self.held_fields, None
+        if fields and self.node is not None:
+            self.save_health(self.node, fields)
+
+    def connection_counts(self):
+        # urllib3 counts the connections it opened and the requests it sent on each pool
+        opened = sent = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+                    sent += pool.num_requests
+        return opened, sent
+
+    def stats(self):
+        opened, sent = self.connection_counts()
+        with self.lock:
+            return {
+                'url': self.base_url,
+                'requests': self.requests,
+                'errors': self.errors,
+                'connections_opened': opened,
+                'connection_reuse_rate': round(1 - opened / sent, 3) if sent else None,
+                'avg_latency_ms': round(self.total_latency / self.requests * 1000, 1) if self.requests else None,
+                'max_latency_ms': round(self.max_latency * 1000, 1),
+                'p50_latency_ms': round(percentile(self.latencies, 0.5), 1) if self.latencies else None,
+                'p95_latency_ms': round(percentile(self.latencies, 0.95), 1) if self.latencies else None,
+            }
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client_for(base_url, username=None, password=None):
+    """
+    Get the shared client for a node url and credentials, creating it on first use.
+    """
+    key = (base_url, username, password)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            # credentials changed, drop the clients that use the old ones
+            for old_key in [old_key for old_key in _clients if old_key[0] == base_url and username is not None and old_key[1] is not None]:
+                _clients.pop(old_key).close()
+            client = _clients[key] = NodeClient(base_url, username, password)
+        return client
+
+
+def get_client(node):
+    """
+    Get the shared, authenticated client for a RemoteNode. Requests made with it update
+    the node's health and are refused while its circuit is open.
+
+    The client keeps its own copy of the node's health, made from the first node it is
+    given, so callers holding other instances of the node don't change it under each other.
+    """
+    client = get_client_for(node.url, node.username, node.password)
+    with client.lock:
+        if client.node is None or client.node.pk != node.pk:
+            client.node = RemoteNode(**{field.attname: getattr(node, field.attname) for field in RemoteNode._meta.concrete_fields})
+    return client
+
+
+def get_client_stats():
+    with _clients_lock:
+        clients = list(_clients.values())
+    return [client.stats() for client in clients]
+
+
+def clear_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -7,9 +7,14 @@ from django.db.models import Q
 from .models import *
 from posts.serializers import *
 from posts.models import *
-from posts.views import get_post
+from posts.views import get_post, serve_image, serve_sized_file, IMAGE_FIELDS
+from posts.pagination import KeysetPagination, paginate_collection
+from .federation import queue_deliveries
 from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.core.files import File
 from django.core.files.storage import default_storage
+from posts.uploads import UploadTooLarge, limit_upload_size, receive_file, receive_stream, too_large_response
 import requests
 from requests.auth import HTTPBasicAuth
 import json
@@ -19,7 +24,12 @@ from .docs import *
 
 
 import base64
-from django.http import HttpResponse, JsonResponse
+import hashlib
+import mimetypes
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
 
 @create_new_post_docs
 @list_recent_posts_docs
@@ -81,27 +91,21 @@ def create_new_post(request, author_id):
 
 def send_post_to_remote(post):
     author = post.author
-    post_object = PostSummarySerializer(post).data
-    json_post = json.dumps(post_object)
 
     if post.visibility in ['PUBLIC', 'UNLISTED']:
         # public and unlisted posts should be sent to all followers
-        follower_ids = Follow.objects.filter(user=author, status="FOLLOWED").values_list('follower', flat=True)
-        followers = Author.objects.filter(id__in=follower_ids)
-        for follower in followers:
-            if follower.remote_node and follower.remote_node.is_active == True:
-                requests.post(follower.fqid + "/inbox/", data=json_post,
-                              auth=HTTPBasicAuth(follower.remote_node.username, follower.remote_node.password),
-                              headers={"Content-Type": "application/json"}, timeout=5)
+        recipient_ids = Follow.objects.filter(user=author, status="FOLLOWED").values_list('follower', flat=True)
     else:
         # friends only should only be sent to remote friends
-        friend_ids = Follow.get_friends(author)
-        friends = Author.objects.filter(id__in=friend_ids)
-        for friend in friends:
-            if friend.remote_node and friend.remote_node.is_active == True:
-                requests.post(friend.fqid + "/inbox/", data=json_post,
-                              auth=HTTPBasicAuth(friend.remote_node.username, friend.remote_node.password),
-                              headers={"Content-Type": "application/json"}, timeout=5)
+        recipient_ids = Follow.get_friends(author)
+    recipients = list(Author.objects.filter(id__in=recipient_ids, remote_node__is_active=True).select_related('remote_node'))
+
+    if recipients:
+        post_object = PostSummarySerializer(post, inline_images=True).data   # other nodes get the image data, not a link back to us
+        json_post = json.dumps(post_object)
+        # the send_deliveries worker posts these to the remote inboxes, so this request doesn't wait on other nodes
+        # friends only posts go to each friend's own inbox, the shared inbox can't tell who may see them
+        queue_deliveries(recipients, json_post, shared=post.visibility in ['PUBLIC', 'UNLISTED'])
 
 # # List recent posts by an author
 def list_recent_posts(request, author_id):
@@ -136,16 +140,21 @@ def list_recent_posts(request, author_id):
         # Unauthenticated users see only public posts
         posts = posts.filter(visibility='PUBLIC', is_shared=False)
 
-    # Apply pagination
-    paginator = PageNumberPagination()
+    # Apply pagination, with an opt-in cursor for deep pages
+    if KeysetPagination.is_requested(request):
+        paginator = KeysetPagination(10)
+    else:
+        paginator = PageNumberPagination()
     paginated_posts = paginator.paginate_queryset(posts, request)
 
-    serializer = PostSummarySerializer(paginated_posts, many=True)
+    serializer = PostSummarySerializer(paginated_posts, many=True, inline_images=wants_inline_images(request))
 
     response_data = {
         "type": "posts",
         "posts": serializer.data
     }
+    if isinstance(paginator, KeysetPagination):
+        response_data["next"] = paginator.get_next_link()
 
     return Response(response_data, status=200)
 
@@ -160,11 +169,11 @@ def post_detail(request, author_id, post_id):
 
     if request.method == 'GET':
         if post.visibility in ['PUBLIC', 'UNLISTED']:
-            return Response(PostSummarySerializer(post).data, status=200)
+            return Response(PostSummarySerializer(post, inline_images=wants_inline_images(request)).data, status=200)
 
         if post.visibility == 'FRIENDS':
             if request.user.is_authenticated:
-                return Response(PostSummarySerializer(post).data, status=200)
+                return Response(PostSummarySerializer(post, inline_images=wants_inline_images(request)).data, status=200)
             else:
                 return Response({"detail": "Must be authenticated to view friends only posts."}, status=401)
 
@@ -207,7 +216,7 @@ def update_existing_post(request, author_id, post_id):
         'id': post.id,
         'title': post.title,
         'description': post.description,
-        'content': post.content,
+        'content': get_post_content(post),
         'contentType': post.contentType,
         'visibility': post.visibility,
         'published': post.published,
@@ -225,6 +234,8 @@ def delete_post(request, author_id, post_id):
         if shared_exists:
             shared_posts = Post.objects.filter(original_post=post)
             shared_posts.update(is_deleted=True)
+            TimelineEntry.remove(shared_posts)
+            Change.record_posts(shared_posts)
 
         post.is_deleted = True  # Mark as deleted
         post.visibility = 'DELETED'
@@ -234,25 +245,74 @@ def delete_post(request, author_id, post_id):
     return Response(status=status.HTTP_403_FORBIDDEN)  # Forbidden if not the author
 
 
+class PublicPostsPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'size'
+    max_page_size = 100
+
+STREAM_CHUNK_SIZE = 200     # posts read and serialized at a time when streaming
+
+def stream_posts(posts, inline_images=False):
+    """
+    Write the posts as one JSON object, a chunk at a time, so memory doesn't grow with the
+    number of posts.
+    """
+    encoder = JSONEncoder()
+
+    def encode(chunk):
+        # the chunk's posts without the surrounding list brackets
+        return encoder.encode(PostSummarySerializer(chunk, many=True, inline_images=inline_images).data)[1:-1]
+
+    yield '{"type": "posts", "posts": ['
+    separator = ''
+    chunk = []
+    for post in posts.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        chunk.append(post)
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield separator + encode(chunk)
+            separator = ', '
+            chunk = []
+    if chunk:
+        yield separator + encode(chunk)
+    yield ']}'
+
 @get_all_public_posts_docs
 @api_view(['GET'])
 def get_all_public_posts(request):
-    # auth_header = request.headers['Authorization']
-    # # auth_header is going to equal something like Basic QWxhZGRpbjpvcGVuIHNlc2FtZQ==
-    # # so split this and decode the base64 value which will give me user:password
-    # password="test"
-    # username="jas"
-    # validCred = RemoteNode.objects.filter(type="incoming",username=username,password=password)
-    # if len(validCred)==1:
-    #     #Succussfully authenticated
-    #     pass
-    # else:
-    #     #could not find credentials 
-    #     pass
-    
-    public_posts = Post.objects.filter(visibility="PUBLIC").order_by('-published')
-    serialized_posts = [PostSummarySerializer(post).data for post in public_posts]
-    return Response({"posts": serialized_posts}, status=200)
+    public_posts = Post.objects.filter(visibility="PUBLIC", is_deleted=False).order_by('-published', '-id')
+
+    # only the posts published after a time. Edits, deletions and posts that arrive late keep
+    # their publish time, so delta sync goes through the changes feed (posts.views.get_changes)
+    since = request.query_params.get('since')
+    if since:
+        try:
+            since = parse_datetime(since)
+        except ValueError:
+            since = None
+        if since is None:
+            return Response({"detail": "since must be an ISO 8601 datetime."}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        public_posts = public_posts.filter(published__gt=since)
+
+    if request.query_params.get('stream') == 'true':
+        return StreamingHttpResponse(stream_posts(public_posts, wants_inline_images(request)), content_type='application/json')
+
+    # Paginate, with an opt-in cursor that stays stable while new posts come in
+    if KeysetPagination.is_requested(request):
+        paginator = KeysetPagination(PublicPostsPagination.page_size)
+    else:
+        paginator = PublicPostsPagination()
+    paginated_posts = paginator.paginate_queryset(public_posts, request)
+
+    response_data = {
+        "type": "posts",
+        "posts": PostSummarySerializer(paginated_posts, many=True, inline_images=wants_inline_images(request)).data,
+        "next": paginator.get_next_link(),
+    }
+    if not isinstance(paginator, KeysetPagination):
+        response_data["count"] = paginator.page.paginator.count
+    return Response(response_data, status=200)
 
 
 @share_post_docs
@@ -280,6 +340,7 @@ def share_post(request, post_id):
             author=request.user,
             title=post.title,
             content=post.content,
+            image=post.image,
             description=f"<b>{request.user.display_name} shared <a href='{original_post_url}'>{post.author.display_name}'s post</a></b>: {post.description}",
             contentType=post.contentType,
             visibility='PUBLIC',  # Ensure shared posts are always public
@@ -314,7 +375,7 @@ def list_shared_posts(request, author_id):
     else:
         shared_posts = shared_posts.filter(visibility='PUBLIC')
     
-    serializer = PostSerializer(shared_posts, many=True)
+    serializer = PostSerializer(shared_posts, many=True, inline_images=wants_inline_images(request))
     return Response(serializer.data)
 
 @stream_docs
@@ -322,41 +383,25 @@ def list_shared_posts(request, author_id):
 def stream(request, author_id):
     author = get_object_or_404(Author, id=author_id)
 
-    # Initialize an empty queryset for posts
-    posts = Post.objects.none()  
-
-    # Check for public posts
+    # Entries are written when posts and follows change, so reading the stream is a single range scan
     if request.user.is_authenticated:
-        # Get the user's friends and followers
-        following = Follow.objects.filter(follower=author, status="FOLLOWED").values_list('user', flat=True)
-        friends = Follow.get_friends(author)
-
-        # Public posts: include shared posts and also allow non-shared if the user is a follower
-        public_posts = Post.objects.filter(~Q(author=author), visibility='PUBLIC')
-        public_posts = public_posts.filter(Q(is_shared=True) & Q(author__in=following) | Q(is_shared=False))  # Allow public posts that are not shared
-
-        # Add public posts to the posts queryset
-        posts = posts | public_posts
-
-        # Unlisted posts: must be shared
-        following_posts = Post.objects.filter(author__in=following, visibility='UNLISTED')
-        posts = posts | following_posts
-
-        # Friends-only posts: must be shared
-        friends_posts = Post.objects.filter(author__in=friends, visibility__in=['UNLISTED', 'FRIENDS'])
-        posts = posts | friends_posts
+        # the author's own entries, plus public posts from everyone else
+        entries = TimelineEntry.objects.filter(Q(owner=author) | (Q(owner__isnull=True) & ~Q(author=author)))
     else:
         # If the user is not authenticated, include all public posts
-        posts = Post.objects.filter(~Q(author=author), visibility='PUBLIC', is_shared=False)
+        entries = TimelineEntry.objects.filter(owner__isnull=True).exclude(author=author)
 
-    # Remove deleted posts
-    posts = posts.exclude(is_deleted=True).order_by('-published')
+    entries = entries.select_related('post__author').order_by('-published')
 
-    # Paginate the stream
-    paginator = PageNumberPagination()
-    paginated_posts = paginator.paginate_queryset(posts, request)
+    # Paginate the stream, with an opt-in cursor that skips the count query
+    if KeysetPagination.is_requested(request):
+        paginator = KeysetPagination(10)
+    else:
+        paginator = PageNumberPagination()
+    paginated_entries = paginator.paginate_queryset(entries, request)
+    paginated_posts = [entry.post for entry in paginated_entries]
 
-    serializer = PostSummarySerializer(paginated_posts, many=True)
+    serializer = PostSummarySerializer(paginated_posts, many=True, inline_images=wants_inline_images(request))
     return paginator.get_paginated_response(serializer.data)
 
 
@@ -365,41 +410,73 @@ def stream(request, author_id):
 @api_view(['GET'])
 def get_image_post(request, author_id, post_id):
     # Get the post by author_serial and post_serial
-    post = get_object_or_404(Post, id=post_id, author_id=author_id)
+    post = get_object_or_404(Post.objects.only(*IMAGE_FIELDS), id=post_id, author_id=author_id)
 
     # Check if the contentType is an image
     if not post.contentType.startswith('image/'):
         return JsonResponse({"detail": "Not an image post"}, status=404)
 
-    # Decode the base64 content to binary
-    try:
-        image_data = base64.b64decode(post.content)
-    except base64.binascii.Error:
-        return JsonResponse({"detail": "Invalid image data"}, status=400)
-
-    # Return the image as a binary
-    return HttpResponse(image_data, content_type=post.contentType)
+    return serve_image(request, post)
 
 
+@limit_upload_size
 @upload_image_docs
 @api_view(['POST'])
 @permission_classes([IsAdminUser])  # Restrict this to node admins
 def upload_image(request):
-    image_data = request.data.get('image_data')
-    content_type = request.data.get('content_type', 'image/png')
+    try:
+        if request.content_type.startswith('image/'):
+            # the body is the image, streamed to a temporary file
+            content_type = request.content_type.split(';')[0]
+            if request.stream is None:
+                return Response({"error": "Invalid image data"}, status=400)
+            image_file, size, content_hash = receive_stream(request.stream)
+        elif 'image' in request.FILES:
+            # multipart upload, Django already spooled the file to disk
+            content_type = request.FILES['image'].content_type
+            image_file, size, content_hash = receive_file(request.FILES['image'])
+        else:
+            # the image as a data: URI in the body, decoded in memory
+            image_data = request.data.get('image_data')
+            if not image_data or not image_data.startswith('data:'):
+                return Response({"error": "Invalid image data"}, status=400)
+
+            format, _, imgstr = image_data.partition(';base64,')
+            if len(imgstr) * 3 // 4 > settings.MAX_IMAGE_UPLOAD_SIZE:
+                return too_large_response()
+            content_type = format[len('data:'):]
+            img_data = base64.b64decode(imgstr)
+            image_file, size, content_hash = ContentFile(img_data), len(img_data), hashlib.sha256(img_data).hexdigest()
+    except UploadTooLarge:
+        return too_large_response()
+
+    with image_file:
+        # an image that is already hosted isn't stored again
+        existing = HostedImage.objects.filter(content_hash=content_hash).first()
+        if existing is not None:
+            return Response({"image_url": existing.url}, status=200)
+
+        img_ext = content_type.split('/')[-1]
+        if not content_type.startswith('image/') or not img_ext.isalnum():
+            return Response({"error": "Invalid image data"}, status=400)
+        image_name = f"images/{uuid.uuid4()}.{img_ext}"
+        path = default_storage.save(image_name, File(image_file))
+        HostedImage.describe(path.split('/')[-1], image_file, size, content_hash, owner=request.user).save()
 
-    if not image_data or not image_data.startswith('data:'):
-        return Response({"error": "Invalid image data"}, status=400)
+    image_url = default_storage.url(path)  # Get URL of stored image
+    return Response({"image_url": image_url}, status=201)
 
-    format, imgstr = image_data.split(';base64,')
-    img_ext = format.split('/')[-1]
-    img_data = base64.b64decode(imgstr)
 
-    image_name = f"images/{uuid.uuid4()}.{img_ext}"
-    path = default_storage.save(image_name, ContentFile(img_data))
+@get_hosted_image_docs
+@api_view(['GET'])
+def get_hosted_image(request, file_name):
+    # uploads are saved under a new name and never changed, so their name is their ETag
+    path = f"images/{file_name}"
+    if file_name.startswith('.') or not default_storage.exists(path):
+        return JsonResponse({"detail": "Image not found"}, status=404)
 
-    image_url = default_storage.url(path)  # Get URL of stored image
-    return Response({"image_url": image_url}, status=201)
+    content_type = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    return serve_sized_file(request, path, f'"{file_name}"', content_type, "public, max-age=31536000, immutable")
 
 
 @get_likes_docs
@@ -408,27 +485,23 @@ def get_likes(request, author_id, object_id):
 
     try:
         post_object = Post.objects.get(id=object_id)
-        object_full_id = post_object.fqid
+        likes = Like.objects.filter(post=post_object)
         object_page = f"{post_object.author.page}/posts/{post_object.id}"
+        object_likes_count = post_object.likes_count
     except Post.DoesNotExist:
         try:
             comment_object = Comment.objects.get(fqid=object_id)
-            object_full_id = comment_object.page.fqid
-            object_page = f"{post_object.author.page}/comments/{comment_object.fqid}/likes"
+            likes = Like.objects.filter(comment=comment_object)
+            object_page = f"{comment_object.post.author.page}/comments/{comment_object.fqid}/likes"
+            object_likes_count = comment_object.likes_count
         except:
             return Response("only posts and comments have likes", status=status.HTTP_400_BAD_REQUEST)
 
-    likes = Like.objects.filter(object=object_full_id).order_by('-published')
-    paginator = Paginator(likes, 50)  # 50 likes per page
-    page_number = request.query_params.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    likes = likes.order_by('-published')
     serializer = LikesSerializer({
         'page': object_page,
         'id': f"{request.build_absolute_uri()}",
-        'page_number': page_obj.number,
-        'size': paginator.per_page,
-        'count': paginator.count,
-        'src': page_obj.object_list,
+        **paginate_collection(likes, request, 50, count=object_likes_count),  # 50 likes per page
     })
     return Response(serializer.data)
 
@@ -437,8 +510,9 @@ def get_comment_likes(request, author_serial, post_serial, comment_fqid):
     comment = Comment.objects.get(fqid=comment_fqid)
     object_page = f"{comment.post.author.page}/comments/{comment.id}/likes"
 
-    likes = Like.objects.filter(object=comment.fqid).order_by('-published')
+    likes = Like.objects.filter(comment=comment).order_by('-published')
     paginator = Paginator(likes, 50)  # 50 likes per page
+    paginator.count = comment.likes_count   # maintained counter, skips the COUNT(*)
     if hasattr(request, 'query_params'):
         page_number = request.query_params.get('page', 1)
     elif hasattr(request, 'GET'):
@@ -463,18 +537,22 @@ def like_object(request, author_id, object_id):
     author = request.user
 
     try:
-        post_object = Post.objects.get(id=object_id)
+        post_object = Post.objects.select_related('author').get(id=object_id)
         object_full_id = f"{post_object.author.host}authors/{post_object.author.id}/posts/{post_object.id}"
+        target = {'post': post_object}
     except Post.DoesNotExist:
         try:
-            comment_object = Comment.objects.get(id=object_id)
+            comment_object = Comment.objects.select_related('post__author').get(id=object_id)
             object_full_id = comment_object.fqid
+            target = {'comment': comment_object}
         except:
             return Response("only posts and comments have likes", status=status.HTTP_400_BAD_REQUEST)
     
+    # the liked object is already known, so saving the like is a single insert
     like, created = Like.objects.get_or_create(
         author=author,
-        object=object_full_id,
+        **target,
+        defaults={'object': object_full_id},
     )
     serializer = LikeSerializer(like)
     return Response(serializer.data, status=201 if created else 200)
@@ -520,16 +598,10 @@ def comments_on_post(request, author_serial, post_serial):
             return Response({"detail": "Invalid post visibility setting."}, status=400)
 
         comments = Comment.objects.filter(post=post).order_by('-published')
-        paginator = Paginator(comments, 5)  # 5 comments per page
-        page_number = request.query_params.get('page', 1)
-        page_obj = paginator.get_page(page_number)
         serializer = CommentsSerializer({
             'page': request.build_absolute_uri(),
             'id': f"{request.build_absolute_uri()}",
-            'page_number': page_obj.number,
-            'size': paginator.per_page,
-            'count': paginator.count,
-            'src': page_obj.object_list,
+            **paginate_collection(comments, request, 5, count=post.comments_count),  # 5 comments per page
         })
         return Response(serializer.data)
 
@@ -594,16 +666,10 @@ def get_author_comments(request, author_serial):
             post__visibility__in=['PUBLIC', 'UNLISTED']
         ).order_by('-published')
 
-    paginator = Paginator(comments, 10)  # 10 comments per page
-    page_number = request.query_params.get('page', 1)
-    page_obj = paginator.get_page(page_number)
     serializer = CommentsSerializer({
         'page': request.build_absolute_uri(),
         'id': f"{request.build_absolute_uri()}",
-        'page_number': page_obj.number,
-        'size': paginator.per_page,
-        'count': paginator.count,
-        'src': page_obj.object_list,
+        **paginate_collection(comments, request, 10),  # 10 comments per page
     })
     return Response(serializer.data)
 
@@ -614,16 +680,10 @@ def get_author_comments_by_fqid(request, author_fqid):
     if author.exists():
         author = author.first()
         comments = Comment.objects.filter(author=author).order_by('-published')
-        paginator = Paginator(comments, 10)  # 10 comments per page
-        page_number = request.query_params.get('page', 1)
-        page_obj = paginator.get_page(page_number)
         serializer = CommentsSerializer({
             'page': author.page,
             'id': f"{author.host}authors/{author.id}",
-            'page_number': page_obj.number,
-            'size': paginator.per_page,
-            'count': paginator.count,
-            'src': page_obj.object_list,
+            **paginate_collection(comments, request, 10),  # 10 comments per page
         })
         return Response(serializer.data)
     return Response({'error': f'author with fqid={author_fqid} does not exist'}, status=status.HTTP_404_NOT_FOUND)
@@ -635,16 +695,10 @@ def get_author_likes_by_fqid(request, author_fqid):
     if author.exists():
         author = author.first()
         likes = Like.objects.filter(author=author).order_by('-published')
-        paginator = Paginator(likes, 10)  # 10 comments per page
-        page_number = request.query_params.get('page', 1)
-        page_obj = paginator.get_page(page_number)
         serializer = LikesSerializer({
             'page': author.page,
             'id': f"{author.host}authors/{author.id}",
-            'page_number': page_obj.number,
-            'size': paginator.per_page,
-            'count': paginator.count,
-            'src': page_obj.object_list,
+            **paginate_collection(likes, request, 10),  # 10 comments per page
         })
         return Response(serializer.data)
     return Response({'error': f'author with fqid={author_fqid} does not exist'}, status=status.HTTP_404_NOT_FOUND)
@@ -681,10 +735,13 @@ def check_liked(request, author_id, post_id):
     check if an author liked a post
     """
     post = get_object_or_404(Post, id=post_id)
-    liked = Like.objects.filter(author__id=author_id, object=post.fqid)
+    liked = Like.objects.filter(post=post, author__id=author_id)
 
     return Response({"liked": liked.exists()})
 
+
+HOSTED_IMAGES_PAGE_SIZE = 100   # images per page of the listing, clients can ask for up to 100 with size
+
 @get_all_hosted_images_docs
 @api_view(['GET'])
 def get_all_hosted_images(request):
@@ -693,13 +750,10 @@ def get_all_hosted_images(request):
     """
 
     if request.user.is_authenticated:
-        all_images = []
-
-        _, files = default_storage.listdir('images')
-        for file_name in files:
-            if file_name.lower().endswith(('.png', '.jpeg')):   # images are only png or jpeg
-                all_images.append("/media/images/" + file_name)
+        # newest first, a page at a time from the image index
+        paginator = KeysetPagination(HOSTED_IMAGES_PAGE_SIZE, time_field='created_at')
+        images = paginator.paginate_queryset(HostedImage.objects.only('id', 'file_name', 'created_at'), request)
 
-        return Response({'images': all_images}, status=200)
+        return Response({'images': [image.url for image in images], 'next': paginator.get_next_link()}, status=200)
 
     return Response({'detail': 'user must be authenticated to view images on node'}, status=401)
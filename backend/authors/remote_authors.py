@@ -0,0 +1,173 @@
+'''
+Resolution of the author objects other nodes send us to Author rows.
+
+resolve_authors() turns any number of author objects into Author rows with one IN
+query and one bulk upsert for the authors we haven't stored yet. Resolved authors are
+kept in an in-process LRU cache, and the profile fields of a remote author are only
+written again once its cache entry is older than PROFILE_TTL.
+
+sync_authors() stores authors crawled from a node, skipping those whose profile hash
+matches the one stored the last time they were crawled.
+'''
+
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import time
+from django.db import transaction
+from .models import Author
+
+CACHE_SIZE = 10000          # authors kept in the cache
+PROFILE_TTL = 10 * 60       # seconds before a cached author's profile is refreshed from the objects we're sent
+
+# author object key -> Author field, for the profile fields other nodes send
+PROFILE_FIELDS = {
+    'host': 'host',
+    'displayName': 'display_name',
+    'github': 'github',
+    'profileImage': 'profile_image',
+    'page': 'page',
+}
+
+
+class AuthorCache:
+    """
+    Thread safe LRU cache of Author rows by fqid, with the time each was cached.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, fqid):
+        # returns None if the author isn't cached or its entry is older than PROFILE_TTL
+        with self.lock:
+            entry = self.entries.get(fqid)
+            if entry is None:
+                return None
+            author, cached_at = entry
+            if time.monotonic() - cached_at > PROFILE_TTL:
+                return None
+            self.entries.move_to_end(fqid)
+            return author
+
+    def put(self, authors):
+        now = time.monotonic()
+        with self.lock:
+            for author in authors:
+                self.entries[author.fqid] = (author, now)
+                self.entries.move_to_end(author.fqid)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, fqid):
+        with self.lock:
+            self.entries.pop(fqid, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+author_cache = AuthorCache()
+
+
+def get_profile(author_object):
+    # only the fields that were sent, so a bare {'id': ...} never blanks out a stored profile
+    profile = {field: author_object[key] for key, field in PROFILE_FIELDS.items() if key in author_object}
+    if profile.get('profile_image') is None:
+        profile.pop('profile_image', None)
+    return profile
+
+
+def is_remote(author):
+    # authors from other nodes are stored with their fqid as their username
+    return author.username == author.fqid
+
+
+def resolve_authors(author_objects):
+    """
+    Get the Author rows for author objects (dicts with at least an 'id') sent by other
+    nodes, keyed by fqid. Authors that aren't stored yet are created, and the profiles
+    of remote authors are updated from the objects if they changed.
+    """
+    objects_by_fqid = {author_object['id']: author_object for author_object in author_objects}
+    authors = {}
+    for fqid in objects_by_fqid:
+        author = author_cache.get(fqid)
+        if author is not None:
+            authors[fqid] = author
+
+    uncached = [fqid for fqid in objects_by_fqid if fqid not in authors]
+    if not uncached:
+        return authors
+
+    stored = {author.fqid: author for author in Author.objects.filter(fqid__in=uncached)}
+    changed = []
+    for fqid, author in stored.items():
+        profile = get_profile(objects_by_fqid[fqid])
+        if is_remote(author) and any(getattr(author, field) != value for field, value in profile.items()):
+            for field, value in profile.items():
+                setattr(author, field, value)
+            changed.append(author)
+    if changed:
+        Author.objects.bulk_update(changed, list(PROFILE_FIELDS.values()))
+
+    missing = [
+        Author(username=fqid, fqid=fqid, **get_profile(objects_by_fqid[fqid]))
+        for fqid in uncached if fqid not in stored
+    ]
+    if missing:
+        # another worker may have created some of them since the query above
+        Author.objects.bulk_create(missing, update_conflicts=True, unique_fields=['fqid'], update_fields=list(PROFILE_FIELDS.values()))
+        if any(author.pk is None for author in missing):
+            missing = list(Author.objects.filter(fqid__in=[author.fqid for author in missing]))
+        stored.update({author.fqid: author for author in missing})
+
+    # rows are only cached once they are committed, so a rolled back transaction can't leave them behind
+    resolved = list(stored.values())
+    transaction.on_commit(lambda: author_cache.put(resolved))
+    authors.update(stored)
+    return authors
+
+
+def resolve_author(author_object):
+    return resolve_authors([author_object])[author_object['id']]
+
+
+def get_profile_hash(author_object):
+    profile = {key: author_object.get(key) for key in PROFILE_FIELDS}
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode()).hexdigest()
+
+
+def sync_authors(author_objects, remote_node):
+    """
+    Store authors crawled from a remote node in bulk. Returns how many authors were
+    created and how many were updated; authors whose profile is unchanged are skipped.
+    """
+    objects_by_fqid = {author_object['id']: author_object for author_object in author_objects}
+    stored = {author.fqid: author for author in Author.objects.filter(fqid__in=objects_by_fqid)}
+    sync_fields = list(PROFILE_FIELDS.values()) + ['profile_hash', 'remote_node']
+
+    created, changed = [], []
+    for fqid, author_object in objects_by_fqid.items():
+        profile_hash = get_profile_hash(author_object)
+        author = stored.get(fqid)
+        if author is None:
+            created.append(Author(username=fqid, fqid=fqid, profile_hash=profile_hash, remote_node=remote_node, **get_profile(author_object)))
+        elif is_remote(author) and author.profile_hash != profile_hash:
+            for field, value in get_profile(author_object).items():
+                setattr(author, field, value)
+            author.profile_hash = profile_hash
+            author.remote_node = remote_node
+            changed.append(author)
+
+    if created:
+        Author.objects.bulk_create(created, update_conflicts=True, unique_fields=['fqid'], update_fields=sync_fields)
+    if changed:
+        Author.objects.bulk_update(changed, sync_fields)
+        for author in changed:
+            author_cache.discard(author.fqid)
+    return len(created), len(changed)
@@ -1,5 +1,15 @@
 from rest_framework import serializers
 from .models import *
+from .follow_graph import follow_graph, get_relationships, get_counts
+
+
+class AuthorListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # load the follow graph of the whole page with one query, not a few per author
+        authors = list(data.all() if hasattr(data, 'all') else data)
+        request_user = self.child.request_user
+        follow_graph.get([author.id for author in authors] + ([request_user.id] if request_user else []))
+        return super().to_representation(authors)
 
 
 class AuthorSerializer(serializers.Serializer):
@@ -16,6 +26,9 @@ class AuthorSerializer(serializers.Serializer):
     followers = serializers.SerializerMethodField()
     following = serializers.SerializerMethodField()
 
+    class Meta:
+        list_serializer_class = AuthorListSerializer
+
     def create(self, validated_data):
         """
         Create and return a new `Author` instance, given the validated data
@@ -30,31 +43,19 @@ class AuthorSerializer(serializers.Serializer):
         """
         Get the relationship between the requesting user and the author being serialized.
         """
-
-        if self.request_user:
-            if self.request_user.id == obj.id:
-                return 'SELF'
-            
-            if Follow.are_friends(self.request_user, obj):
-                return 'FRIENDS'
-            
-            following = Follow.objects.filter(user=obj, follower=self.request_user)
-            if following.exists():
-                return Follow.objects.get(user=obj, follower=self.request_user).status
-        
-        return 'NONE'
+        return get_relationships(self.request_user, [obj])[obj.id]
     
     def get_followers(self, obj):
         """
         Get the number of followers for a user
         """
-        return Follow.objects.filter(user=obj, status="FOLLOWED").count()
+        return get_counts([obj])[obj.id][0]
     
     def get_following(self, obj):
         """
-        Get the number of followers for a user
+        Get the number of authors a user follows
         """
-        return Follow.objects.filter(follower=obj, status="FOLLOWED").count()
+        return get_counts([obj])[obj.id][1]
 
     def update(self, instance, validated_data):
         """
@@ -1,10 +1,20 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
-from authors.models import Author, Follow, RemoteNode
-from posts.models import Post, Comment, Like
-from authors.serializers import AuthorSummarySerializer
+from authors.models import Author, Follow, RemoteNode, Delivery, InboxItem, RemotePostSync, TokenRevocation
+from authors.federation import process_deliveries, MAX_NODE_DELIVERIES, CLAIM_LEASE
+from authors.inbox import process_inbox, upsert_posts
+from authors.crawler import crawl_nodes
+from authors.backfill import request_backfill, process_backfills
+from authors.node_authentication import credential_cache
+from authors.token_authentication import token_cache, REVOCATION_CHECK_INTERVAL
+from authors.remote_authors import resolve_authors, resolve_author, author_cache
+from authors.node_clients import get_client, get_client_stats, clear_clients, CircuitOpenError, CONNECT_TIMEOUT, READ_TIMEOUT
+from authors.posts_views import send_post_to_remote
+from posts.models import Post, Comment, Like, TimelineEntry, HostedImage, Change
+from authors.serializers import AuthorSerializer, AuthorSummarySerializer
+from authors.follow_graph import follow_graph
 from posts.serializers import LikesSerializer
 
 from rest_framework.authtoken.models import Token
@@ -12,6 +22,19 @@ from unittest.mock import patch
 import json
 import base64
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from io import StringIO
+from django.db import connection, transaction, IntegrityError
+from django.test.utils import CaptureQueriesContext
+from datetime import timedelta
+from django.utils import timezone
+import requests
+import hashlib
+import shutil
+import tempfile
+import uuid
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 
 class AuthorAPITests(APITestCase):
 
@@ -270,9 +293,99 @@ class PostAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
 
+    def test_stream_follows_follow_changes(self):
+        # unlisted posts show up in the stream once the follow is accepted and leave when it is removed
+        self.client.login(username=self.author.username, password=self.password)
+        Post.objects.create(
+            title="Unlisted Post",
+            content="Unlisted content",
+            author=self.other_user,
+            visibility="UNLISTED"
+        )
+        url = reverse('api:authors:stream', args=[self.user.id])
+        self.assertEqual(self.client.get(url).data['count'], 0)
+
+        follow = Follow.objects.create(user=self.other_user, follower=self.user, status="FOLLOWED")
+        self.assertEqual(self.client.get(url).data['count'], 1)
+
+        follow.delete()
+        self.assertEqual(self.client.get(url).data['count'], 0)
+
+    def test_stream_cursor_pagination(self):
+        # cursor mode walks the stream newest first without a count
+        for i in range(12):
+            Post.objects.create(title=f"Post {i}", content="content", author=self.other_user, visibility="PUBLIC")
+        url = reverse('api:authors:stream', args=[self.user.id])
+
+        response = self.client.get(url, {'cursor': ''})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        first_page = [post['title'] for post in response.data['results']]
+        self.assertEqual(first_page, [f"Post {i}" for i in range(11, 1, -1)])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([post['title'] for post in response.data['results']], ["Post 1", "Post 0"])
+        self.assertIsNone(response.data['next'])
+
+        # a forged cursor with an id of the wrong type is refused, not a server error
+        forged = base64.urlsafe_b64encode(b"2024-01-01T00:00:00|zzz").decode()
+        self.assertEqual(self.client.get(url, {'cursor': forged}).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('api:authors:get_all_hosted_images'), {'cursor': forged})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_follow_changes_only_touch_that_pair_of_streams(self):
+        third_user = Author.objects.create(username="thirduser", display_name="Third User")
+        Follow.objects.create(user=third_user, follower=self.user, status="FOLLOWED")
+        Post.objects.create(title="Third Unlisted", content="content", author=third_user, visibility="UNLISTED")
+        third_entry_ids = set(TimelineEntry.objects.filter(owner=self.user, author=third_user).values_list('id', flat=True))
+        unlisted = Post.objects.create(title="Other Unlisted", content="content", author=self.other_user, visibility="UNLISTED")
+        friends_only = Post.objects.create(title="Other Friends", content="content", author=self.other_user, visibility="FRIENDS")
+
+        def stream(owner):
+            return set(TimelineEntry.objects.filter(owner=owner).values_list('post', flat=True))
+
+        follow = Follow.objects.create(user=self.other_user, follower=self.user, status="REQUESTED")
+        self.assertNotIn(unlisted.id, stream(self.user))
+
+        follow.status = "FOLLOWED"
+        follow.save()
+        self.assertIn(unlisted.id, stream(self.user))
+        self.assertNotIn(friends_only.id, stream(self.user))
+        Follow.objects.create(user=self.user, follower=self.other_user, status="FOLLOWED")
+        self.assertIn(friends_only.id, stream(self.user))
+        # the other author's entries in the stream were left alone
+        self.assertEqual(set(TimelineEntry.objects.filter(owner=self.user, author=third_user).values_list('id', flat=True)), third_entry_ids)
+
+        follow.delete()
+        self.assertFalse(stream(self.user) & {unlisted.id, friends_only.id})
+
+    def test_public_posts_have_one_public_entry(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TimelineEntry.objects.create(owner=None, post=self.post, author=self.user, published=self.post.published)
+
+    def test_rebuild_timelines_command(self):
+        # the rebuild command restores a stream that was lost
+        Follow.objects.create(user=self.other_user, follower=self.user, status="FOLLOWED")
+        Post.objects.create(
+            title="Other Post",
+            content="Other content",
+            author=self.other_user,
+            visibility="PUBLIC"
+        )
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+
+        url = reverse('api:authors:stream', args=[self.user.id])
+        response = self.client.get(url)
+        self.assertEqual([post['title'] for post in response.data['results']], ["Other Post"])
+
 class CommentsLikesImagesAPITests(APITestCase):
 
     def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_settings.enable()
         self.user = Author.objects.create(username="testuser", display_name="Test User", host="http://localhost:3000/api/")
         self.password = "testpass"
         self.user.set_password(self.password)
@@ -298,6 +411,10 @@ class CommentsLikesImagesAPITests(APITestCase):
 
     # Existing test methods remain the same
 
+    def tearDown(self):
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
     def test_upload_image(self):
         # Test POST request to upload an image
         self.client.login(username=self.admin_user.username, password=self.password)
@@ -313,6 +430,17 @@ class CommentsLikesImagesAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertIn('image_url', response.data)
 
+        file_name = response.data['image_url'].split('/')[-1]
+        response = self.client.get(reverse('api:authors:get_hosted_image', args=[file_name]))
+        self.assertEqual(b''.join(response.streaming_content), b'test image content')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        # thumbnails of files that aren't images fall back to the file itself
+        response = self.client.get(reverse('api:authors:get_hosted_image', args=[file_name]), {'w': 64})
+        self.assertEqual(response['ETag'], f'"{file_name}"')
+        response = self.client.get(reverse('api:authors:get_hosted_image', args=['missing.png']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_get_image_post(self):
         # Test GET request to retrieve an image post
         image_content = base64.b64encode(b'test image content').decode('utf-8')
@@ -328,7 +456,7 @@ class CommentsLikesImagesAPITests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response['Content-Type'], 'image/png')
-        self.assertEqual(response.content, base64.b64decode(image_content))
+        self.assertEqual(b''.join(response.streaming_content), base64.b64decode(image_content))
 
     def test_get_likes(self):
         # Test GET request to retrieve likes on a post
@@ -338,6 +466,21 @@ class CommentsLikesImagesAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 1)
 
+    def test_get_likes_cursor(self):
+        # cursor mode leaves out the page number and count but keeps the likes object
+        Like.objects.create(author=self.user, object=self.post.fqid)
+        Like.objects.create(author=self.other_user, object=self.post.fqid)
+        url = reverse('api:authors:get_likes', args=[self.user.id, self.post.id])
+        response = self.client.get(url, {'cursor': '', 'size': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['type'], 'likes')
+        self.assertEqual(len(response.data['src']), 1)
+        self.assertNotIn('count', response.data)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['src']), 1)
+        self.assertIsNone(response.data['next'])
+
     def test_like_object(self):
         # Test POST request to like a post
         self.client.login(username=self.author.username, password=self.password)
@@ -424,6 +567,76 @@ class CommentsLikesImagesAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('images', response.data)
 
+    def test_hosted_images_are_indexed_and_paged(self):
+        self.client.login(username=self.admin_user.username, password=self.password)
+        image_urls = []
+        for content in [b'first image', b'second image', b'third image']:
+            image_data = 'data:image/png;base64,' + base64.b64encode(content).decode()
+            response = self.client.post(reverse('api:authors:upload_image'), {'image_data': image_data})
+            image_urls.append(response.data['image_url'])
+
+        image = HostedImage.objects.get(file_name=image_urls[0].split('/')[-1])
+        self.assertEqual((image.owner, image.size, image.content_type), (self.admin_user, len(b'first image'), 'image/png'))
+        self.assertEqual(image.content_hash, hashlib.sha256(b'first image').hexdigest())
+
+        url = reverse('api:authors:get_all_hosted_images') + '?size=2'
+        pages = []
+        with patch('django.core.files.storage.default_storage.listdir') as listdir:
+            while url and len(pages) < 3:
+                response = self.client.get(url)
+                pages.append(response.data['images'])
+                url = response.data['next']
+        listdir.assert_not_called()
+        self.assertEqual(pages, [image_urls[:0:-1], image_urls[:1]])
+
+    def test_upload_image_streams_raw_and_multipart_bodies(self):
+        self.client.login(username=self.admin_user.username, password=self.password)
+        url = reverse('api:authors:upload_image')
+
+        response = self.client.post(url, b'raw image body', content_type='image/png')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        image = HostedImage.objects.get(file_name=response.data['image_url'].split('/')[-1])
+        self.assertEqual((image.size, image.content_type), (len(b'raw image body'), 'image/png'))
+        with default_storage.open(f"images/{image.file_name}") as stored:
+            self.assertEqual(stored.read(), b'raw image body')
+
+        response = self.client.post(url, {'image': SimpleUploadedFile('photo.jpeg', b'multipart image', content_type='image/jpeg')})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['image_url'].endswith('.jpeg'))
+
+        # the same bytes again, in any mode, get the stored image
+        image_data = 'data:image/png;base64,' + base64.b64encode(b'raw image body').decode()
+        response = self.client.post(url, {'image_data': image_data})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['image_url'], image.url)
+        self.assertEqual(HostedImage.objects.count(), 2)
+
+    @override_settings(MAX_IMAGE_UPLOAD_SIZE=10)
+    def test_upload_image_size_limit(self):
+        self.client.login(username=self.admin_user.username, password=self.password)
+        url = reverse('api:authors:upload_image')
+
+        self.assertEqual(self.client.post(url, b'eleven byte', content_type='image/png').status_code, 413)
+        image_data = 'data:image/png;base64,' + base64.b64encode(b'eleven byte').decode()
+        self.assertEqual(self.client.post(url, {'image_data': image_data}).status_code, 413)
+        # bodies that are too big from their Content-Length aren't read at all
+        with patch('authors.posts_views.receive_stream') as receive_stream:
+            self.assertEqual(self.client.post(url, b'x' * 100000, content_type='image/png').status_code, 413)
+        receive_stream.assert_not_called()
+        self.assertFalse(HostedImage.objects.exists())
+
+    def test_import_hosted_images(self):
+        file_name = f"{uuid.uuid4()}.png"
+        default_storage.save(f"images/{file_name}", ContentFile(b'uploaded before the index'))
+        call_command('import_hosted_images', stdout=StringIO())
+        call_command('import_hosted_images', stdout=StringIO())
+
+        image = HostedImage.objects.get(file_name=file_name)
+        self.assertIsNone(image.owner)
+        self.assertEqual(image.size, len(b'uploaded before the index'))
+        # files that aren't images stay out of the listing
+        self.assertFalse(HostedImage.objects.exclude(content_type__startswith='image/').exists())
+
     def test_get_all_public_posts(self):
         # Test GET request to get all public posts
         Post.objects.create(
@@ -438,6 +651,27 @@ class CommentsLikesImagesAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['posts']), 2)
 
+    def test_get_all_public_posts_paged_since_and_streamed(self):
+        since = timezone.now()
+        for i in range(3):
+            Post.objects.create(title=f"New {i}", content="new", author=self.other_user, visibility="PUBLIC",
+                                published=since + timedelta(minutes=i + 1))
+        url = reverse('api:authors:get_all_public_posts')
+
+        response = self.client.get(url, {'since': since.isoformat(), 'size': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([post['title'] for post in response.data['posts']], ["New 2", "New 1"])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([post['title'] for post in response.data['posts']], ["New 0"])
+
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        with patch('authors.posts_views.STREAM_CHUNK_SIZE', 2):
+            response = self.client.get(url, {'stream': 'true'})
+            streamed = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(streamed['posts']), Post.objects.filter(visibility="PUBLIC", is_deleted=False).count())
+        self.assertEqual(streamed['posts'][0]['title'], "New 2")
+
 
 class PostFeatureTests(APITestCase):
 
@@ -589,6 +823,7 @@ class PostFeatureTests(APITestCase):
         self.post.visibility = "FRIENDS"
         self.post.save()
         url = reverse('api:authors:get_post', args=[self.post.author.id, self.post.id])
+        self.client.credentials()   # the token authenticates the author, read as an anonymous user
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
@@ -669,11 +904,12 @@ class InboxTests(APITestCase):
         }
 
         response = self.client.post(url, post_object, format='json')
+        process_inbox()
         new_post = Post.objects.filter(fqid=post_id)
         self.assertTrue(new_post.exists())      # check for the id
         new_post = new_post.first()
         self.assertEqual(new_post.title, title)     # check for the title
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
 
     def test_resend_edited_posts(self):
         url = reverse('api:authors:inbox', args=[self.author.id])
@@ -704,11 +940,12 @@ class InboxTests(APITestCase):
         }
 
         response = self.client.post(url, post_object, format='json')
+        process_inbox()
         new_post = Post.objects.filter(fqid=post_id)
         self.assertTrue(new_post.exists())      # check for the id
         new_post = new_post.first()
         self.assertEqual(new_post.title, new_title)     # check that title was updated
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
 
 
     def test_resend_deleted_posts(self):
@@ -739,10 +976,11 @@ class InboxTests(APITestCase):
         }
 
         response = self.client.post(url, post_object, format='json')
+        process_inbox()
         new_post = Post.objects.filter(fqid=post_id)
         self.assertTrue(new_post.exists())
         self.assertTrue(new_post.first().is_deleted)    # check that post is deleted
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
 
     def test_share_public_images_with_remote(self):
         url = reverse('api:authors:inbox', args=[self.author.id])
@@ -772,7 +1010,8 @@ class InboxTests(APITestCase):
         }
 
         response = self.client.post(url, post_object, format='json')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)     # check that post was created
+        process_inbox()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         new_post = Post.objects.filter(fqid=post_id)
         self.assertTrue(new_post.exists())
         
@@ -781,6 +1020,58 @@ class InboxTests(APITestCase):
         self.assertEqual(image_response.status_code, status.HTTP_200_OK)    # check that image is public and visible
 
     
+    def test_like_from_remote(self):
+        url = reverse('api:authors:inbox', args=[self.author.id])
+        like_object = {
+            "type": "like",
+            "author": {
+                "type": "author",
+                "id": "http://nodeaaaa/api/authors/111",
+                "host": "http://nodeaaaa/api/",
+                "displayName": "Greg Johnson",
+                "github": "http://github.com/gjohnson",
+                "profileImage": "https://i.imgur.com/k7XVwpB.jpeg",
+                "page": "http://nodeaaaa/authors/greg"
+            },
+            "published": "2015-03-09T13:07:04+00:00",
+            "id": "http://nodeaaaa/api/authors/111/liked/166",
+            "object": self.post.fqid
+        }
+
+        response = self.client.post(url, like_object, format='json')
+        process_inbox()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        like = Like.objects.get(fqid="http://nodeaaaa/api/authors/111/liked/166")
+        self.assertEqual(like.post, self.post)
+        self.assertEqual(like.published.year, 2015)     # published from the remote node is kept
+
+        response = self.client.post(url, like_object, format='json')
+        process_inbox()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)     # resending the like doesn't count it twice
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+    def test_like_of_comment_with_any_id_shape(self):
+        remote_author = Author.objects.create(username="http://nodeaaaa/api/authors/112", display_name="Sam", host="http://nodeaaaa/api/",
+                                              fqid="http://nodeaaaa/api/authors/112")
+        comment = Comment.objects.create(author=remote_author, post=self.post, comment="hi",
+                                         fqid="http://nodeaaaa/api/authors/112/posts/7/comments/9")
+        like_object = {
+            "type": "like",
+            "author": {"type": "author", "id": "http://nodeaaaa/api/authors/111", "host": "http://nodeaaaa/api/", "displayName": "Greg"},
+            "id": "http://nodeaaaa/api/authors/111/liked/167",
+            "object": comment.fqid,
+        }
+        response = self.client.post(reverse('api:authors:inbox', args=[self.author.id]), like_object, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        process_inbox()
+        self.assertEqual(Like.objects.get(fqid=like_object['id']).comment, comment)
+
+        like = Like.objects.create(author=self.author, object=comment.fqid)
+        self.assertEqual((like.comment, like.post), (comment, None))
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_count, 2)
+
     def test_follow_remote_author(self):
         url = reverse('api:authors:inbox', args=[self.author.id])
         remote_author_id = "http://nodeaaaa/api/authors/111"
@@ -801,9 +1092,718 @@ class InboxTests(APITestCase):
         }
 
         response = self.client.post(url, follow_request_object, format='json')
+        process_inbox()
         new_remote_author_check = Author.objects.filter(fqid=remote_author_id)
         self.assertTrue(new_remote_author_check.exists())
 
         new_follow_request = Follow.objects.filter(user=self.author, follower=new_remote_author_check.first())
         self.assertTrue(new_follow_request.exists())
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+
+    def test_invalid_activity_is_rejected(self):
+        url = reverse('api:authors:inbox', args=[self.author.id])
+        response = self.client.post(url, {"type": "like", "object": self.post.fqid}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(InboxItem.objects.exists())
+
+    def test_inbox_batch(self):
+        # activities are only queued by the inbox and applied together by the worker
+        url = reverse('api:authors:inbox', args=[self.author.id])
+        greg = {"type": "author", "id": "http://nodeaaaa/api/authors/111", "host": "http://nodeaaaa/api/",
+                "displayName": "Greg Johnson", "page": "http://nodeaaaa/authors/greg"}
+        comment_object = {"type": "comment", "id": "http://nodeaaaa/api/authors/111/commented/130", "author": greg,
+                          "comment": "Nice post", "contentType": "text/plain", "post": self.post.fqid,
+                          "published": "2015-03-09T13:07:04+00:00"}
+        like_object = {"type": "like", "id": "http://nodeaaaa/api/authors/111/liked/167", "author": greg,
+                       "object": "http://nodeaaaa/api/authors/111/commented/130"}
+
+        for activity in [comment_object, comment_object, like_object]:
+            response = self.client.post(url, activity, format='json')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(InboxItem.objects.count(), 2)      # the resent comment was only queued once
+        self.assertFalse(Comment.objects.exists())
+
+        self.assertEqual(process_inbox(), 2)
+        comment = Comment.objects.get(fqid=comment_object['id'])
+        self.assertEqual(comment.published.year, 2015)
+        self.assertEqual(comment.likes_count, 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(Author.objects.filter(fqid=greg['id']).count(), 1)
+        self.assertEqual(InboxItem.objects.filter(status="APPLIED").count(), 2)
+
+    def test_inbox_item_without_target_fails(self):
+        url = reverse('api:authors:inbox', args=[self.author.id])
+        like_object = {"type": "like", "id": "http://nodeaaaa/api/authors/111/liked/168", "object": "http://nodeaaaa/api/authors/111/posts/404",
+                       "author": {"type": "author", "id": "http://nodeaaaa/api/authors/111", "host": "http://nodeaaaa/api/"}}
+        self.client.post(url, like_object, format='json')
+
+        process_inbox()
+        item = InboxItem.objects.get()
+        self.assertEqual(item.status, "FAILED")
+        self.assertFalse(Like.objects.exists())
+
+        # once the post exists, the same like sent again is queued again and applied
+        Post.objects.create(title="Late", content="content", author=self.author, fqid=like_object['object'])
+        self.client.post(url, like_object, format='json')
+        process_inbox()
+        self.assertEqual(InboxItem.objects.get().status, "APPLIED")
+        self.assertTrue(Like.objects.filter(fqid=like_object['id']).exists())
+
+    def test_posts_and_follows_sent_again_are_applied_again(self):
+        url = reverse('api:authors:inbox', args=[self.author.id])
+        greg = {"type": "author", "id": "http://nodeaaaa/api/authors/111", "host": "http://nodeaaaa/api/",
+                "displayName": "Greg Johnson", "page": "http://nodeaaaa/authors/greg"}
+        version_a = {"type": "post", "id": "http://nodeaaaa/api/authors/111/posts/1", "title": "A", "content": "first",
+                     "contentType": "text/plain", "visibility": "PUBLIC", "author": greg}
+        version_b = dict(version_a, title="B", content="second")
+
+        for version in [version_a, version_b, version_a]:
+            self.client.post(url, version, format='json')
+            process_inbox()
+        self.assertEqual(Post.objects.get(fqid=version_a['id']).title, "A")
+        # a post sent again as it is isn't written or logged again
+        changes = Change.objects.count()
+        self.client.post(url, version_a, format='json')
+        process_inbox()
+        self.assertEqual(Change.objects.count(), changes)
+
+        # only the fields an upsert writes are compared, the stored author stays
+        upsert_posts([dict(version_a, description="")], lambda post_object: self.author)
+        self.assertEqual(Change.objects.count(), changes)
+        self.assertEqual(Post.objects.get(fqid=version_a['id']).author.fqid, greg['id'])
+
+        follow_object = {"type": "follow", "actor": greg, "object": AuthorSummarySerializer(self.author).data}
+        self.client.post(url, follow_object, format='json')
+        process_inbox()
+        Follow.objects.filter(user=self.author).delete()    # rejected
+        self.client.post(url, follow_object, format='json')
+        process_inbox()
+        self.assertTrue(Follow.objects.filter(user=self.author, follower__fqid=greg['id'], status="REQUESTED").exists())
+
+class RemoteAuthorTests(TestCase):
+
+    def setUp(self):
+        author_cache.clear()
+        self.greg = {"type": "author", "id": "http://nodeaaaa/api/authors/111", "host": "http://nodeaaaa/api/",
+                     "displayName": "Greg Johnson", "page": "http://nodeaaaa/authors/greg"}
+        self.lara = {"type": "author", "id": "http://nodebbbb/api/authors/222", "host": "http://nodebbbb/api/",
+                     "displayName": "Lara Croft", "page": "http://nodebbbb/authors/222"}
+
+    def test_resolve_authors_in_bulk(self):
+        Author.objects.create(username=self.lara['id'], fqid=self.lara['id'], display_name="Lara Croft", host="http://nodebbbb/api/", page=self.lara['page'])
+
+        with self.assertNumQueries(2):      # one IN query and one insert for greg
+            authors = resolve_authors([self.greg, self.lara, self.greg])
+
+        self.assertEqual(set(authors), {self.greg['id'], self.lara['id']})
+        self.assertEqual(authors[self.greg['id']].display_name, "Greg Johnson")
+        self.assertEqual(Author.objects.get(fqid=self.greg['id']).username, self.greg['id'])
+
+    def test_resolved_authors_are_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resolve_authors([self.greg])
+
+        with self.assertNumQueries(0):
+            author = resolve_author({**self.greg, "displayName": "Greg J"})
+        self.assertEqual(author.display_name, "Greg Johnson")   # the profile isn't refreshed until the entry expires
+
+        author_cache.entries[self.greg['id']] = (author, 0)     # expire the entry
+        self.assertEqual(resolve_author({**self.greg, "displayName": "Greg J"}).display_name, "Greg J")
+        self.assertEqual(Author.objects.get(fqid=self.greg['id']).display_name, "Greg J")
+
+    def test_local_profiles_are_not_overwritten(self):
+        local = Author.objects.create(username="testuser", display_name="Test User", fqid="http://localhost:8000/api/authors/1")
+        author = resolve_author({"id": local.fqid, "displayName": "Someone Else"})
+        self.assertEqual(author.id, local.id)
+        self.assertEqual(Author.objects.get(id=local.id).display_name, "Test User")
+
+class CrawlerTests(TestCase):
+
+    def setUp(self):
+        clear_clients()
+        self.node = RemoteNode.objects.create(url="http://nodeaaaa", username="node", password="nodepass")
+        self.pages = {
+            1: [{"type": "author", "id": "http://nodeaaaa/api/authors/111", "host": "http://nodeaaaa/api/", "displayName": "Greg Johnson"},
+                {"type": "author", "id": "http://nodeaaaa/api/authors/112", "host": "http://nodeaaaa/api/", "displayName": "Lara Croft"}],
+            2: [{"type": "author", "id": "http://nodeaaaa/api/authors/113", "host": "http://nodeaaaa/api/", "displayName": "Sam"},
+                {"type": "author", "id": "http://nodebbbb/api/authors/1", "host": "http://nodebbbb/api/", "displayName": "Not from this node"}],
+        }
+
+    def respond(self, method, url, params=None, **kwargs):
+        response = requests.Response()
+        authors = self.pages.get(params['page'])
+        response.status_code = 200 if authors else 404
+        response._content = json.dumps({"type": "authors", "authors": authors or []}).encode()
+        return response
+
+    def test_crawl_authors(self):
+        with patch('requests.Session.request', side_effect=self.respond) as mock_request:
+            call_command('crawl_authors', stdout=StringIO())
+        self.assertEqual(mock_request.call_count, 3)
+        self.assertEqual(mock_request.call_args_list[0].kwargs['params'], {'page': 1, 'size': 100})
+
+        crawled = Author.objects.filter(remote_node=self.node)
+        self.assertEqual(crawled.count(), 3)
+        self.assertFalse(Author.objects.filter(fqid="http://nodebbbb/api/authors/1").exists())
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.author_crawl_page, 1)
+        self.assertIsNotNone(self.node.authors_crawled_at)
+
+        # a second crawl only writes authors whose profile changed
+        self.pages[1][0]["displayName"] = "Greg J"
+        with patch('requests.Session.request', side_effect=self.respond):
+            summary = crawl_nodes()
+        self.assertEqual(summary["http://nodeaaaa"]["created"], 0)
+        self.assertEqual(summary["http://nodeaaaa"]["updated"], 1)
+        self.assertEqual(Author.objects.get(fqid="http://nodeaaaa/api/authors/111").display_name, "Greg J")
+
+    def test_crawl_with_another_page_size_starts_over(self):
+        RemoteNode.objects.filter(pk=self.node.pk).update(author_crawl_page=2)
+        with patch('requests.Session.request', side_effect=self.respond) as mock_request:
+            crawl_nodes(page_size=2)
+        self.assertEqual(mock_request.call_args_list[0].kwargs['params'], {'page': 1, 'size': 2})
+        self.assertTrue(Author.objects.filter(fqid="http://nodeaaaa/api/authors/111").exists())
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.author_crawl_page_size, 2)
+
+    def test_crawl_resumes_from_checkpoint(self):
+        def fail_on_second_page(method, url, params=None, **kwargs):
+            if params['page'] == 2:
+                raise requests.ConnectionError("reset")
+            return self.respond(method, url, params)
+
+        with patch('requests.Session.request', side_effect=fail_on_second_page):
+            summary = crawl_nodes()
+        self.assertIsNotNone(summary["http://nodeaaaa"]["error"])
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.author_crawl_page, 2)
+
+        with patch('requests.Session.request', side_effect=self.respond) as mock_request:
+            crawl_nodes()
+        self.assertEqual(mock_request.call_args_list[0].kwargs['params']['page'], 2)
+        self.assertEqual(Author.objects.filter(remote_node=self.node).count(), 3)
+
+    def test_connection_view_reports_without_crawling(self):
+        with patch('requests.Session.request') as mock_request:
+            response = self.client.get(reverse('test_remote_connection'))
+        mock_request.assert_not_called()
+        node = next(node for node in response.data['nodes'] if node['url'] == self.node.url)
+        self.assertEqual(node['author_crawl_page'], 1)
+        self.assertFalse(node['circuit_open'])
+
+class BackfillTests(APITestCase):
+
+    def setUp(self):
+        clear_clients()
+        self.author = Author.objects.create(username="testuser", display_name="Test User", host="http://localhost:8000/api/")
+        self.password = "testpass"
+        self.author.set_password(self.password)
+        self.author.save()
+
+        self.node = RemoteNode.objects.create(url="http://nodeaaaa", username="node", password="nodepass")
+        self.remote_author = Author.objects.create(username="http://nodeaaaa/api/authors/111", display_name="Greg",
+                                                   host="http://nodeaaaa/api/", fqid="http://nodeaaaa/api/authors/111",
+                                                   remote_node=self.node)
+        self.remote_posts = [self.post_object(number) for number in range(5, 0, -1)]     # newest first
+
+    def post_object(self, number):
+        return {"type": "post", "id": f"http://nodeaaaa/api/authors/111/posts/{number}", "title": f"Post {number}",
+                "contentType": "text/plain", "content": "content", "visibility": "PUBLIC",
+                "published": f"2024-01-0{number}T00:00:00+00:00"}
+
+    def respond(self, method, url, params=None, **kwargs):
+        response = requests.Response()
+        start = (params['page'] - 1) * 2     # the remote node only sends two posts per page
+        posts = self.remote_posts[start:start + 2]
+        response.status_code = 200 if posts else 404
+        response._content = json.dumps({"type": "posts", "posts": posts}).encode()
+        return response
+
+    @patch('requests.Session.request')
+    def test_accepting_remote_follow_queues_backfill(self, mock_request):
+        self.client.login(username=self.author.username, password=self.password)
+        Follow.objects.create(user=self.author, follower=self.remote_author, status="REQUESTED")
+        url = reverse('api:authors:manage_follow', args=[self.author.id])
+        response = self.client.put(url, {'follower': self.remote_author.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        mock_request.assert_not_called()
+        self.assertIsNotNone(RemotePostSync.objects.get(author=self.remote_author).requested_at)
+
+    def test_backfill_follows_pages_and_stops_at_high_water(self):
+        request_backfill(self.remote_author)
+        with patch('requests.Session.request', side_effect=self.respond) as mock_request:
+            call_command('backfill_remote_posts', '--once', stdout=StringIO())
+        self.assertEqual(mock_request.call_count, 4)    # three pages of posts and the end
+        self.assertEqual(Post.objects.filter(author=self.remote_author).count(), 5)
+        sync = RemotePostSync.objects.get(author=self.remote_author)
+        self.assertEqual(sync.high_water.day, 5)
+        self.assertIsNone(sync.requested_at)
+
+        # later backfills only read until they reach the newest post already copied
+        self.remote_posts.insert(0, self.post_object(6))
+        request_backfill(self.remote_author)
+        with patch('requests.Session.request', side_effect=self.respond) as mock_request:
+            process_backfills()
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(Post.objects.filter(author=self.remote_author).count(), 6)
+        self.assertEqual(Post.objects.get(fqid="http://nodeaaaa/api/authors/111/posts/6").published.day, 6)
+
+    def test_backfill_reads_published_times_without_offset(self):
+        request_backfill(self.remote_author)
+        with patch('requests.Session.request', side_effect=self.respond):
+            process_backfills()
+
+        self.remote_posts.insert(0, dict(self.post_object(6), published="2024-01-06T00:00:00"))
+        request_backfill(self.remote_author)
+        with patch('requests.Session.request', side_effect=self.respond):
+            self.assertEqual(process_backfills(), 1)
+        sync = RemotePostSync.objects.get(author=self.remote_author)
+        self.assertEqual((sync.attempts, sync.last_error), (0, ""))
+        self.assertEqual(sync.high_water.day, 6)
+
+    def test_errors_storing_posts_retry_only_their_backfill(self):
+        request_backfill(self.remote_author)
+        with patch('requests.Session.request', side_effect=self.respond):
+            with patch('authors.backfill.upsert_posts', side_effect=KeyError('author')):
+                self.assertEqual(process_backfills(), 1)
+        sync = RemotePostSync.objects.get(author=self.remote_author)
+        self.assertEqual(sync.attempts, 1)
+        self.assertIsNone(sync.high_water)
+        self.assertGreater(sync.requested_at, timezone.now())
+
+    def test_failed_backfill_is_retried_after_backoff(self):
+        request_backfill(self.remote_author)
+        with patch('requests.Session.request', side_effect=requests.ConnectionError("down")):
+            process_backfills()
+        sync = RemotePostSync.objects.get(author=self.remote_author)
+        self.assertEqual(sync.attempts, 1)
+        self.assertEqual(sync.last_error, "down")
+        self.assertGreater(sync.requested_at, timezone.now())
+
+        # nothing is fetched until the backoff has passed
+        with patch('requests.Session.request', side_effect=self.respond) as mock_request:
+            self.assertEqual(process_backfills(), 0)
+        mock_request.assert_not_called()
+
+        RemotePostSync.objects.filter(id=sync.id).update(requested_at=timezone.now() - timedelta(seconds=1))
+        with patch('requests.Session.request', side_effect=self.respond):
+            self.assertEqual(process_backfills(), 1)
+        sync.refresh_from_db()
+        self.assertEqual((sync.attempts, sync.last_error, sync.requested_at), (0, "", None))
+        self.assertEqual(Post.objects.filter(author=self.remote_author).count(), 5)
+
+class NodeAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        credential_cache.clear()
+        self.author = Author.objects.create(username="testuser", display_name="Test User", fqid="http://localhost:8000/api/authors/1")
+        self.node = RemoteNode(url="http://nodeaaaa", username="node", password="outpass")
+        self.node.set_inbound_password("nodepass")
+        self.node.save()
+        self.url = reverse('api:authors:inbox', args=[self.author.id])
+        self.follow_object = {"type": "follow", "actor": {"type": "author", "id": "http://nodeaaaa/api/authors/111"},
+                              "object": {"type": "author", "id": self.author.fqid}}
+
+    def post_as(self, username, password):
+        credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+        return self.client.post(self.url, self.follow_object, format='json', HTTP_AUTHORIZATION=f"Basic {credentials}")
+
+    def test_node_password_is_hashed(self):
+        self.assertNotIn("nodepass", self.node.inbound_password)
+        self.assertTrue(self.node.check_inbound_password("nodepass"))
+        self.assertEqual(self.post_as("node", "wrongpass").status_code, status.HTTP_403_FORBIDDEN)
+        # the password we send the node isn't the one it sends us
+        self.assertEqual(self.post_as("node", "outpass").status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_nodes_without_inbound_password_are_refused(self):
+        node = RemoteNode.objects.create(url="http://nodebbbb", username="other", password="otherpass")
+        self.assertEqual(node.inbound_password, "")
+        self.assertEqual(self.post_as("other", "otherpass").status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_verified_credentials_are_cached(self):
+        self.assertEqual(self.post_as("node", "nodepass").status_code, status.HTTP_202_ACCEPTED)
+        InboxItem.objects.all().delete()
+        with patch.object(RemoteNode, 'check_inbound_password') as mock_check:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post_as("node", "nodepass").status_code, status.HTTP_202_ACCEPTED)
+        mock_check.assert_not_called()
+        # only the node's row is read, to see it is still active with the same password
+        self.assertEqual(len([query for query in queries if 'authors_remotenode' in query['sql']]), 1)
+
+    def test_changes_in_another_process_invalidate_cache(self):
+        self.assertEqual(self.post_as("node", "nodepass").status_code, status.HTTP_202_ACCEPTED)
+        # updates that skip save() leave this process's cache as it is, like edits made in another process
+        RemoteNode.objects.filter(id=self.node.id).update(is_active=False)
+        self.assertEqual(self.post_as("node", "nodepass").status_code, status.HTTP_403_FORBIDDEN)
+
+        node = RemoteNode.objects.get(id=self.node.id)
+        node.is_active = True
+        node.save()
+        self.assertEqual(self.post_as("node", "nodepass").status_code, status.HTTP_202_ACCEPTED)
+        node.set_inbound_password("newpass")
+        RemoteNode.objects.filter(id=node.id).update(inbound_password=node.inbound_password)
+        self.assertEqual(self.post_as("node", "nodepass").status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.post_as("node", "newpass").status_code, status.HTTP_202_ACCEPTED)
+
+    def test_deactivating_node_invalidates_cache(self):
+        self.assertEqual(self.post_as("node", "nodepass").status_code, status.HTTP_202_ACCEPTED)
+        self.node.is_active = False
+        self.node.save()
+        self.assertEqual(self.post_as("node", "nodepass").status_code, status.HTTP_403_FORBIDDEN)
+
+class TokenAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.author = Author.objects.create(username="testuser", display_name="Test User", host="http://localhost:8000/api/", is_approved=True)
+        self.password = "testpass"
+        self.author.set_password(self.password)
+        self.author.save()
+
+    def test_login_returns_api_token(self):
+        response = self.client.post(reverse('api:authors:login'), {'username': 'testuser', 'password': self.password})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['token'], Token.objects.get(user=self.author).key)
+
+    def test_token_lookup_is_cached(self):
+        token = Token.objects.create(user=self.author)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        url = reverse('api:authors:stream', args=[self.author.id])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([query for query in queries if 'authtoken_token' in query['sql']])
+
+        # logging out revokes the token
+        self.client.get(reverse('api:authors:logout'))
+        self.assertFalse(Token.objects.filter(key=token.key).exists())
+        self.assertIsNone(token_cache.get(token.key))
+
+    def test_only_credential_changes_revoke_tokens(self):
+        TokenRevocation.objects.all().delete()
+        response = self.client.post(reverse('api:authors:login'), {'username': 'testuser', 'password': self.password})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        author = Author.objects.get(id=self.author.id)
+        author.display_name = "New Name"
+        author.save()
+        self.assertFalse(TokenRevocation.objects.exists())
+
+        author.set_password("newpass")
+        author.save()
+        self.assertEqual(list(TokenRevocation.objects.values_list('user_id', flat=True)), [self.author.id])
+
+    def test_logout_in_another_process_revokes_cached_token(self):
+        token = Token.objects.create(user=self.author)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        url = reverse('api:authors:stream', args=[self.author.id])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        # another process deletes the token and records the revocation, this cache still has it
+        Token.objects.filter(key=token.key).delete()
+        TokenRevocation.objects.create(user_id=self.author.id)
+        self.assertIsNotNone(token_cache.get(token.key))
+
+        token_cache.checked_at -= REVOCATION_CHECK_INTERVAL
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertIsNone(token_cache.get(token.key))
+
+class FollowGraphTests(APITestCase):
+
+    def setUp(self):
+        follow_graph.clear()
+        self.authors = [
+            Author.objects.create(username=f"user{i}", display_name=f"User {i}", host="http://localhost:8000/api/", is_approved=True)
+            for i in range(4)
+        ]
+        me, friend, followed, requested = self.authors
+        Follow.objects.create(user=friend, follower=me, status='FOLLOWED')
+        Follow.objects.create(user=me, follower=friend, status='FOLLOWED')
+        Follow.objects.create(user=followed, follower=me, status='FOLLOWED')
+        Follow.objects.create(user=requested, follower=me, status='REQUESTED')
+
+    def test_batch_serializes_relationships_with_one_query(self):
+        me = self.authors[0]
+        follow_graph.clear()
+        with CaptureQueriesContext(connection) as queries:
+            data = AuthorSerializer(self.authors, many=True, request_user=me).data
+        self.assertEqual(len([query for query in queries if 'authors_follow' in query['sql']]), 1)
+
+        self.assertEqual([author['relationship'] for author in data], ['SELF', 'FRIENDS', 'FOLLOWED', 'REQUESTED'])
+        self.assertEqual([(author['followers'], author['following']) for author in data], [(1, 2), (1, 1), (1, 0), (0, 0)])
+        self.assertEqual(Follow.get_friends(me), {self.authors[1].id})
+
+    def test_follow_changes_evict_the_cache(self):
+        me, friend, followed, requested = self.authors
+        self.assertFalse(Follow.are_friends(me, followed))
+
+        Follow.objects.create(user=me, follower=followed, status='FOLLOWED')
+        self.assertTrue(Follow.are_friends(me, followed))
+
+        Follow.objects.get(user=me, follower=friend).delete()
+        self.assertFalse(Follow.are_friends(me, friend))
+
+        url = reverse('api:authors:get_relationship', args=[me.id, requested.id])
+        follow = Follow.objects.get(user=requested, follower=me)
+        follow.status = 'FOLLOWED'
+        follow.save()
+        self.assertEqual(self.client.get(url).data['relationship'], 'FOLLOWED')
+
+    def test_friendship_checks_ignore_stale_cache(self):
+        me, friend, followed, requested = self.authors
+        self.assertEqual(Follow.get_friends(me), {friend.id})
+
+        # another process unfriends them, this process's cache isn't evicted
+        Follow.objects.filter(user=me, follower=friend).delete()
+        self.assertIn(friend.id, follow_graph.get([me.id])[me.id].friends)
+        self.assertFalse(Follow.are_friends(me, friend))
+        self.assertEqual(Follow.get_friends(me), set())
+
+class DeliveryTests(APITestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(username="testuser", display_name="Test User", host="http://localhost:8000/api/")
+        self.password = "testpass"
+        self.author.set_password(self.password)
+        self.author.save()
+
+        self.node = RemoteNode.objects.create(url="http://nodeaaaa", username="node", password="nodepass")
+        self.remote_follower = Author.objects.create(username="http://nodeaaaa/api/authors/111", display_name="Greg",
+                                                     host="http://nodeaaaa/api/", fqid="http://nodeaaaa/api/authors/111",
+                                                     remote_node=self.node)
+        Follow.objects.create(user=self.author, follower=self.remote_follower, status="FOLLOWED")
+        clear_clients()
+
+    @patch('requests.Session.request')
+    @patch('requests.post')
+    def test_new_post_is_queued(self, mock_post, mock_session_post):
+        # creating a post only queues deliveries, nothing is sent in the request
+        self.client.login(username=self.author.username, password=self.password)
+        url = reverse('api:authors:author_posts', args=[self.author.id])
+        data = {'title': 'New Post', 'content': 'content', 'contentType': 'text/plain', 'visibility': 'PUBLIC'}
+        response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        mock_post.assert_not_called()
+        mock_session_post.assert_not_called()
+        delivery = Delivery.objects.get()
+        self.assertEqual(delivery.url, "http://nodeaaaa/api/authors/111/inbox/")
+        self.assertEqual(delivery.status, "PENDING")
+        self.assertEqual(json.loads(delivery.payload)['title'], 'New Post')
+
+    @patch('requests.Session.request')
+    def test_deliveries_are_sent(self, mock_post):
+        mock_post.return_value.status_code = 201
+        delivery = Delivery.objects.create(remote_node=self.node, recipient=self.remote_follower,
+                                           url="http://nodeaaaa/api/authors/111/inbox/", payload="{}")
+
+        self.assertEqual(process_deliveries(), 1)
+
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, "SENT")
+        self.assertEqual(delivery.attempts, 1)
+        self.assertIsNotNone(delivery.sent_at)
+
+    @patch('requests.Session.request')
+    def test_claims_take_few_deliveries_per_node(self, mock_post):
+        mock_post.return_value.status_code = 201
+        Delivery.objects.bulk_create([
+            Delivery(remote_node=self.node, url=f"http://nodeaaaa/api/authors/{number}/inbox/", payload="{}")
+            for number in range(MAX_NODE_DELIVERIES + 5)
+        ])
+        # sent one after another, the claimed deliveries must all time out within the lease
+        self.assertLess(MAX_NODE_DELIVERIES * (CONNECT_TIMEOUT + READ_TIMEOUT), CLAIM_LEASE)
+
+        self.assertEqual(process_deliveries(), MAX_NODE_DELIVERIES)
+        self.assertEqual(process_deliveries(), 5)
+        self.assertEqual(Delivery.objects.filter(status="SENT").count(), MAX_NODE_DELIVERIES + 5)
+
+    @patch('requests.Session.request')
+    def test_failed_deliveries_are_retried_later(self, mock_post):
+        mock_post.return_value.status_code = 503
+        mock_post.return_value.text = "unavailable"
+        delivery = Delivery.objects.create(remote_node=self.node, recipient=self.remote_follower,
+                                           url="http://nodeaaaa/api/authors/111/inbox/", payload="{}")
+
+        process_deliveries()
+        self.assertEqual(process_deliveries(), 0)     # not due again until the backoff passes
+
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, "PENDING")
+        self.assertEqual(delivery.attempts, 1)
+        self.assertEqual(delivery.last_status_code, 503)
+
+    def test_shared_inbox_gets_one_delivery(self):
+        # followers on a node with a shared inbox get one delivery for the whole node
+        self.node.shared_inbox = "http://nodeaaaa/api/authors/inbox/"
+        self.node.save()
+        other_follower = Author.objects.create(username="http://nodeaaaa/api/authors/112", display_name="Lara",
+                                               host="http://nodeaaaa/api/", fqid="http://nodeaaaa/api/authors/112",
+                                               remote_node=self.node)
+        Follow.objects.create(user=self.author, follower=other_follower, status="FOLLOWED")
+
+        Post.objects.create(title="Post", content="content", author=self.author, visibility="PUBLIC")
+        send_post_to_remote(Post.objects.get(title="Post"))
+
+        delivery = Delivery.objects.get()
+        self.assertEqual(delivery.url, "http://nodeaaaa/api/authors/inbox/")
+        self.assertIsNone(delivery.recipient)
+
+        # friends only posts go to each friend, since the shared inbox names no recipients
+        Follow.objects.create(user=other_follower, follower=self.author, status="FOLLOWED")
+        Post.objects.create(title="Friends Post", content="content", author=self.author, visibility="FRIENDS")
+        send_post_to_remote(Post.objects.get(title="Friends Post"))
+        friends_delivery = Delivery.objects.exclude(id=delivery.id).get()
+        self.assertEqual((friends_delivery.recipient, friends_delivery.url), (other_follower, "http://nodeaaaa/api/authors/112/inbox/"))
+
+    @patch('requests.Session.request', autospec=True)
+    def test_deliveries_to_a_node_share_a_session(self, mock_request):
+        mock_request.return_value.status_code = 201
+        for inbox in ["http://nodeaaaa/api/authors/111/inbox/", "http://nodeaaaa/api/authors/112/inbox/"]:
+            Delivery.objects.create(remote_node=self.node, url=inbox, payload="{}")
+
+        self.assertEqual(process_deliveries(), 2)
+        client = get_client(self.node)
+        sessions = {call.args[0] for call in mock_request.call_args_list}
+        self.assertEqual(sessions, {client.session})     # both went through the node's pooled client
+        self.assertEqual(client.stats()['requests'], 2)
+        self.assertEqual(Delivery.objects.filter(status="SENT").count(), 2)
+
+    def test_client_is_replaced_when_credentials_change(self):
+        client = get_client(self.node)
+        self.assertIs(get_client(self.node), client)
+
+        self.node.password = "newpass"
+        self.assertIsNot(get_client(self.node), client)
+        self.assertEqual(len(get_client_stats()), 1)
+
+    def test_remote_node_stats_requires_admin(self):
+        get_client(self.node)
+        url = reverse('api:authors:remote_node_stats')
+        self.client.login(username=self.author.username, password=self.password)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.author.is_staff = True
+        self.author.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['url'], "http://nodeaaaa")
+
+    @patch('requests.Session.request')
+    def test_circuit_opens_after_failures(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError("refused")
+        client = get_client(self.node)
+        for _ in range(RemoteNode.FAILURE_THRESHOLD):
+            with self.assertRaises(requests.ConnectionError):
+                client.get("http://nodeaaaa/api/authors/")
+
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.consecutive_failures, RemoteNode.FAILURE_THRESHOLD)
+        self.assertEqual(self.node.circuit_state(), "OPEN")
+
+        # requests fail right away while the circuit is open
+        with self.assertRaises(CircuitOpenError):
+            get_client(self.node).get("http://nodeaaaa/api/authors/")
+        self.assertEqual(mock_request.call_count, RemoteNode.FAILURE_THRESHOLD)
+
+    @patch('requests.Session.request')
+    def test_failures_add_to_stored_count(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError("refused")
+        client = get_client(self.node)
+        with self.assertRaises(requests.ConnectionError):
+            client.get("http://nodeaaaa/api/authors/")
+
+        # another worker's failures are kept, not overwritten with this client's count
+        RemoteNode.objects.filter(pk=self.node.pk).update(consecutive_failures=3)
+        with self.assertRaises(requests.ConnectionError):
+            client.get("http://nodeaaaa/api/authors/")
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.consecutive_failures, 4)
+
+    @patch('requests.Session.request')
+    def test_held_health_is_saved_when_sending_fails(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError("refused")
+        Delivery.objects.create(remote_node=self.node, url="http://nodeaaaa/api/authors/111/inbox/", payload="{}")
+        with patch('authors.federation.send_delivery', side_effect=RuntimeError("bug")):
+            with self.assertRaises(RuntimeError):
+                process_deliveries()
+        client = get_client(self.node)
+        self.assertIsNone(client.held_fields)
+
+        with self.assertRaises(requests.ConnectionError):
+            client.get("http://nodeaaaa/api/authors/")
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.consecutive_failures, 1)
+
+    @patch('requests.Session.request')
+    def test_probe_that_raises_lets_the_next_request_probe(self, mock_request):
+        self.node.consecutive_failures = RemoteNode.FAILURE_THRESHOLD
+        self.node.circuit_opened_at = timezone.now() - timedelta(seconds=RemoteNode.CIRCUIT_COOLDOWN + 1)
+        self.node.save()
+        client = get_client(self.node)
+
+        mock_request.side_effect = RuntimeError("bug")
+        with self.assertRaises(RuntimeError):
+            client.get("http://nodeaaaa/api/authors/")
+        self.assertFalse(client.probing)
+
+        mock_request.side_effect = None
+        mock_request.return_value.status_code = 200
+        client.get("http://nodeaaaa/api/authors/")
+        self.assertEqual(client.node.circuit_state(), "CLOSED")
+
+    def test_client_keeps_its_own_copy_of_the_node(self):
+        client = get_client(self.node)
+        other = RemoteNode.objects.get(pk=self.node.pk)
+        self.assertIs(get_client(other), client)
+        self.assertIsNot(client.node, self.node)
+        self.assertIsNot(client.node, other)
+
+        other.consecutive_failures = 99     # a caller's instance doesn't change the client's health
+        self.assertEqual(client.node.consecutive_failures, 0)
+
+    @patch('requests.Session.request')
+    def test_probe_closes_circuit(self, mock_request):
+        mock_request.return_value.status_code = 200
+        self.node.consecutive_failures = RemoteNode.FAILURE_THRESHOLD
+        self.node.circuit_opened_at = timezone.now() - timedelta(seconds=RemoteNode.CIRCUIT_COOLDOWN + 1)
+        self.node.save()
+        self.assertEqual(self.node.circuit_state(), "HALF_OPEN")
+
+        get_client(self.node).get("http://nodeaaaa/api/authors/")
+
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.circuit_state(), "CLOSED")
+        self.assertEqual(self.node.consecutive_failures, 0)
+        self.assertIsNotNone(self.node.last_success_at)
+        self.assertIsNotNone(self.node.latency_p95)
+
+    @patch('requests.Session.request')
+    def test_deliveries_wait_for_open_circuit(self, mock_request):
+        mock_request.return_value.status_code = 503
+        mock_request.return_value.text = "unavailable"
+        self.node.consecutive_failures = RemoteNode.FAILURE_THRESHOLD
+        self.node.circuit_opened_at = timezone.now() - timedelta(seconds=RemoteNode.CIRCUIT_COOLDOWN + 1)
+        self.node.save()
+        for inbox in ["http://nodeaaaa/api/authors/111/inbox/", "http://nodeaaaa/api/authors/112/inbox/"]:
+            Delivery.objects.create(remote_node=self.node, url=inbox, payload="{}")
+
+        # the first delivery is the probe, it fails and the second one is held back
+        self.assertEqual(process_deliveries(), 2)
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(sorted(Delivery.objects.values_list('attempts', flat=True)), [0, 1])
+        self.assertEqual(process_deliveries(), 0)     # nothing is claimed for the node while its circuit is open
+
+    @patch('requests.Session.request')
+    def test_follow_is_queued_when_node_is_down(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError("refused")
+        url = reverse('api:authors:follow')
+        response = self.client.post(url, {'user': self.remote_follower.id, 'follower': self.author.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        delivery = Delivery.objects.get()
+        self.assertEqual(delivery.url, "http://nodeaaaa/api/authors/111/inbox/")
+        self.assertEqual(json.loads(delivery.payload)['type'], "follow")
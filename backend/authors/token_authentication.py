@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from datetime import timedelta
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from .models import TokenRevocation
+import threading
+import time
+
+TOKEN_TTL = 5 * 60      # seconds a token's user is trusted without looking it up again
+CACHE_SIZE = 10000      # tokens kept in the cache
+REVOCATION_CHECK_INTERVAL = 1   # seconds between looks at the tokens other processes revoked
+REVOCATION_OVERLAP = 10     # seconds of revocations read again, for ones committed late or on another clock
+
+
+class TokenCache:
+    """
+    LRU cache of the tokens that were looked up recently, with their user.
+
+    Each process has its own cache, so a logout in one process is passed on to the
+    others through the TokenRevocation table, which every cache reads at most once
+    every REVOCATION_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()    # key -> (token, expires)
+        self.lock = threading.Lock()
+        self.checked_at = time.monotonic()
+        self.revocations_since = timezone.now()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            token, expires = entry
+            if time.monotonic() > expires:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return token
+
+    def put(self, token):
+        with self.lock:
+            self.entries[token.key] = (token, time.monotonic() + TOKEN_TTL)
+            self.entries.move_to_end(token.key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def forget_user(self, user_id):
+        with self.lock:
+            for key in [key for key, (token, expires) in self.entries.items() if token.user_id == user_id]:
+                del self.entries[key]
+
+    def forget_revoked(self):
+        """
+        Drop the tokens of users that were revoked in any process since the last look.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if now - self.checked_at < REVOCATION_CHECK_INTERVAL:
+                return
+            self.checked_at = now
+            since, self.revocations_since = self.revocations_since, timezone.now()
+        revoked = TokenRevocation.objects.filter(revoked_at__gte=since - timedelta(seconds=REVOCATION_OVERLAP))
+        for user_id in set(revoked.values_list('user_id', flat=True)):
+            self.forget_user(user_id)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.checked_at = time.monotonic()
+            self.revocations_since = timezone.now()
+
+
+token_cache = TokenCache()
+
+
+def revoke_tokens(user_id):
+    """
+    Make every process look up a user's tokens again, after they were deleted or the
+    user changed.
+    """
+    token_cache.forget_user(user_id)
+    now = timezone.now()
+    TokenRevocation.objects.create(user_id=user_id, revoked_at=now)
+    # caches never keep a token longer than TOKEN_TTL, older revocations are done with
+    TokenRevocation.objects.filter(revoked_at__lt=now - timedelta(seconds=TOKEN_TTL + REVOCATION_OVERLAP)).delete()
+
+
+# to authenticate API requests from our frontend with the token it gets on login
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        token_cache.forget_revoked()
+        token = token_cache.get(key)
+        if token is not None:
+            return (token.user, token)
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.put(token)
+        return (user, token)
@@ -17,6 +17,9 @@ urlpatterns = [
     # author inbox
     path("<int:author_id>/inbox/", author_views.inbox, name="inbox"),
 
+    # shared inbox for activities sent once to this node
+    path("inbox/", author_views.inbox, {'author_id': None}, name="shared_inbox"),
+
     # get author info and update/edit author info by author id
     path("<int:author_id>/full/", author_views.get_full_author, name="get_full_author"),
 
@@ -88,6 +91,8 @@ urlpatterns = [
 
     path('images/all/', posts_views.get_all_hosted_images, name="get_all_hosted_images"),
 
+    path('images/<str:file_name>/', posts_views.get_hosted_image, name="get_hosted_image"),
+
     # LIKES URLS ------------------------------------------------------------------------------
 
     # Get likes for a specific object
@@ -120,6 +125,7 @@ urlpatterns = [
 
     # remote nodes
     path('remote-nodes/', author_views.manage_remote_nodes, name='manage_remote_nodes'),
+    path('remote-nodes/stats/', author_views.remote_node_stats, name='remote_node_stats'),
 
     # BY FQID URLS ------------------------------------------------------------------------------
 
@@ -168,6 +168,7 @@ STATICFILES_DIRS = [
 # Media files settings
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+MAX_IMAGE_UPLOAD_SIZE = int(os.environ.get("MAX_IMAGE_UPLOAD_SIZE", 10 * 1024 * 1024))  # bytes
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -204,6 +205,7 @@ AUTH_USER_MODEL = 'authors.Author'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        'authors.token_authentication.CachedTokenAuthentication',  # the frontend's credential
         'rest_framework.authentication.BasicAuthentication',
     ],
     
@@ -0,0 +1,73 @@
+'''
+Content addressed store for the images of image posts.
+
+Image bytes are stored once under MEDIA_ROOT/blobs/, at a path made from their SHA-256
+digest, and posts keep only the digest. Posts with the same image share one file.
+'''
+
+import base64
+import binascii
+import hashlib
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+BLOB_DIR = 'blobs'
+
+
+def blob_path(digest):
+    # two levels of directories keep any one directory small
+    return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def store_blob(data):
+    """
+    Store bytes and return their digest. Bytes that are already stored aren't written again.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest)
+    if not default_storage.exists(path):
+        saved_path = default_storage.save(path, ContentFile(data))
+        if saved_path != path:
+            # another request stored the same bytes at the same time, keep theirs
+            default_storage.delete(saved_path)
+    return digest
+
+
+def open_blob(digest):
+    return default_storage.open(blob_path(digest), 'rb')
+
+
+def blob_size(digest):
+    return default_storage.size(blob_path(digest))
+
+
+def decode_image(content):
+    """
+    Get the bytes of image post content, sent either as a data URL (data:image/png;base64,...)
+    or as bare base64. Raises ValueError if the content is neither, e.g. a link.
+    """
+    if content.startswith('data:'):
+        _, separator, content = content.partition(';base64,')
+        if not separator:
+            raise ValueError("Image data URLs must be base64")
+    try:
+        return base64.b64decode(content, validate=True)
+    except binascii.Error as e:
+        raise ValueError(str(e))
+
+
+def image_mime_type(content_type):
+    # image/png;base64 -> image/png
+    return content_type.split(';')[0]
+
+
+def encode_image(digest, content_type):
+    """
+    Get a stored image as post content: bare base64 for the image/...;base64 content types
+    of the API, a data URL for the plain image types our frontend sends.
+    """
+    with open_blob(digest) as blob:
+        data = base64.b64encode(blob.read()).decode()
+    if content_type.endswith(';base64'):
+        return data
+    return f"data:{image_mime_type(content_type)};base64,{data}"
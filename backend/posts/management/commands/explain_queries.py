@@ -0,0 +1,95 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from authors.models import Author, Follow
+from posts.models import Post, Comment
+
+
+class Rollback(Exception):
+    pass
+
+
+def hot_queries(author, post):
+    # the querysets behind the follower, stream, post and comment list views
+    return {
+        'followers': Follow.objects.filter(user=author, status='FOLLOWED').values_list('follower'),
+        'following': Follow.objects.filter(follower=author, status='FOLLOWED').values_list('user'),
+        'author posts': Post.objects.filter(author=author, is_deleted=False).order_by('-published')[:10],
+        'shared posts': Post.objects.filter(author=author, is_shared=True).order_by('-published')[:10],
+        'public posts': Post.objects.filter(visibility='PUBLIC', is_deleted=False).order_by('-published')[:50],
+        'post comments': Comment.objects.filter(post=post).order_by('-published')[:10],
+        'author comments': Comment.objects.filter(author=author).order_by('-published')[:10],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query plan and timing of the hot follow, post and comment querysets. "
+        "Run it before and after migrating the indexes to compare. With --seed, test data "
+        "is created in a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Authors to create for the run, each with posts, comments and follows.")
+        parser.add_argument('--runs', type=int, default=20, help="Times each query is run for the timing.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self.seed(options['seed'])
+                self.explain(options['runs'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def explain(self, runs):
+        post = Post.objects.select_related('author').order_by('-published').first()
+        if post is None:
+            self.stdout.write(self.style.WARNING("No posts to query, use --seed."))
+            return
+        author = post.author
+
+        for name, queryset in hot_queries(author, post).items():
+            start = time.perf_counter()
+            for _ in range(runs):
+                list(queryset.all())
+            elapsed = (time.perf_counter() - start) / runs * 1000
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {elapsed:.2f} ms"))
+            self.stdout.write(queryset.explain())
+
+    def seed(self, count, posts_per_author=20, comments_per_post=5, follows_per_author=20):
+        now = timezone.now()
+        host = "http://localhost:8000/api/"
+        authors = Author.objects.bulk_create([
+            Author(username=f"explain-{uuid.uuid4().hex}", display_name="Explain", host=host)
+            for _ in range(count)
+        ])
+
+        posts = []
+        for author in authors:
+            for _ in range(posts_per_author):
+                post_id = uuid.uuid4()
+                posts.append(Post(
+                    id=post_id, author=author, title="Explain", content="", fqid=f"{host}authors/{author.id}/posts/{post_id}",
+                    published=now - timedelta(minutes=random.randrange(100000)),
+                    visibility=random.choice(['PUBLIC', 'PUBLIC', 'UNLISTED', 'FRIENDS']),
+                    is_shared=random.random() < 0.1, is_deleted=random.random() < 0.05,
+                ))
+        Post.objects.bulk_create(posts, batch_size=1000)
+
+        Comment.objects.bulk_create([
+            Comment(author=random.choice(authors), post=post, comment="Explain", published=now - timedelta(minutes=random.randrange(100000)))
+            for post in posts for _ in range(comments_per_post)
+        ], batch_size=1000)
+
+        Follow.objects.bulk_create([
+            Follow(user=author, follower=follower, status=random.choice(['FOLLOWED', 'FOLLOWED', 'REQUESTED']))
+            for author in authors for follower in random.sample(authors, min(follows_per_author, len(authors)))
+            if follower != author
+        ], batch_size=1000, ignore_conflicts=True)
+        self.stdout.write(f"Seeded {len(authors)} authors, {len(posts)} posts and {len(posts) * comments_per_post} comments.")
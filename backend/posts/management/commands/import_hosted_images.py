@@ -0,0 +1,41 @@
+import mimetypes
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from posts.models import HostedImage
+from posts.uploads import hash_chunks
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Index the files in media/images/ that aren't in the hosted image table yet, such as "
+        "images uploaded before the table existed. Safe to run again."
+    )
+
+    def handle(self, *args, **options):
+        if not default_storage.exists('images'):
+            self.stdout.write("No images directory, nothing to import.")
+            return
+
+        _, files = default_storage.listdir('images')
+        indexed = set(HostedImage.objects.values_list('file_name', flat=True))
+
+        batch = []
+        imported = 0
+        for file_name in files:
+            content_type = mimetypes.guess_type(file_name)[0] or ''
+            if file_name in indexed or not content_type.startswith('image/'):
+                continue
+            path = f"images/{file_name}"
+            with default_storage.open(path, 'rb') as image_file:
+                size, content_hash = hash_chunks(image_file.chunks())
+                # the file's modification time is the best guess at when it was uploaded
+                created_at = default_storage.get_modified_time(path)
+                batch.append(HostedImage.describe(file_name, image_file, size, content_hash, created_at=created_at))
+            if len(batch) >= BATCH_SIZE:
+                imported += len(HostedImage.objects.bulk_create(batch, ignore_conflicts=True))
+                batch = []
+        imported += len(HostedImage.objects.bulk_create(batch, ignore_conflicts=True))
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {imported} image(s)."))
@@ -0,0 +1,29 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from posts.blobs import blob_path
+from posts.models import Post
+from posts.thumbnails import FORMATS, THUMBNAIL_WIDTHS, Image, make_thumbnail
+
+
+class Command(BaseCommand):
+    help = (
+        "Make every thumbnail size of the images of image posts and of uploaded images, so "
+        "the first requests for them don't wait for the resize. Existing thumbnails are kept."
+    )
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError("Making thumbnails needs Pillow, install it with pip install Pillow.")
+
+        digests = Post.objects.exclude(image='').values_list('image', flat=True).distinct()
+        paths = [blob_path(digest) for digest in digests.iterator()]
+        if default_storage.exists('images'):
+            paths += [f"images/{file_name}" for file_name in default_storage.listdir('images')[1]]
+
+        made = 0
+        for path in paths:
+            for width in THUMBNAIL_WIDTHS:
+                for extension in FORMATS:
+                    if make_thumbnail(path, width, extension) is not None:
+                        made += 1
+        self.stdout.write(self.style.SUCCESS(f"{made} thumbnail(s) of {len(paths)} image(s) are ready."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from authors.models import Author
+from posts.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized stream of every author (or only the given authors)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--author', type=int, action='append', dest='authors', help="id of an author to rebuild, can be repeated")
+
+    def handle(self, *args, **options):
+        authors = Author.objects.all()
+        if options['authors']:
+            authors = authors.filter(id__in=options['authors'])
+        else:
+            # public posts are shared by every stream, so only rebuild them on a full run
+            TimelineEntry.rebuild_public()
+
+        count = 0
+        for author in authors.iterator():
+            TimelineEntry.rebuild(author)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} timeline(s)."))
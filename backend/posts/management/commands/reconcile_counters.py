@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from posts.models import Post, Comment, Like
+
+
+def like_count(target):
+    likes = Like.objects.filter(**{target: OuterRef('pk')}).order_by().values(target).annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(likes), 0)
+
+
+def comment_count():
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(comments), 0)
+
+
+class Command(BaseCommand):
+    help = "Fix like and comment counters on posts and comments that drifted from the real counts."
+
+    def handle(self, *args, **options):
+        drifted_posts = list(
+            Post.objects.annotate(actual_likes=like_count('post'), actual_comments=comment_count())
+            .filter(~Q(likes_count=F('actual_likes')) | ~Q(comments_count=F('actual_comments')))
+            .values_list('pk', flat=True)
+        )
+        Post.objects.filter(pk__in=drifted_posts).update(likes_count=like_count('post'), comments_count=comment_count())
+
+        drifted_comments = list(
+            Comment.objects.annotate(actual_likes=like_count('comment'))
+            .filter(~Q(likes_count=F('actual_likes')))
+            .values_list('pk', flat=True)
+        )
+        Comment.objects.filter(pk__in=drifted_comments).update(likes_count=like_count('comment'))
+
+        self.stdout.write(self.style.SUCCESS(f"Fixed counters on {len(drifted_posts)} post(s) and {len(drifted_comments)} comment(s)."))
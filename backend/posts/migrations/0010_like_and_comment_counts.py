@@ -0,0 +1,45 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_likes_and_comments(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Like = apps.get_model('posts', 'Like')
+
+    def like_count():
+        likes = Like.objects.filter(object=OuterRef('fqid')).order_by().values('object').annotate(count=Count('id')).values('count')
+        return Coalesce(Subquery(likes), 0)
+
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(count=Count('id')).values('count')
+    Post.objects.update(likes_count=like_count(), comments_count=Coalesce(Subquery(comments), 0))
+    Comment.objects.update(likes_count=like_count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_likes_and_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def link_likes_to_targets(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Like = apps.get_model('posts', 'Like')
+
+    Like.objects.update(
+        post=Subquery(Post.objects.filter(fqid=OuterRef('object')).values('pk')[:1]),
+        comment=Subquery(Comment.objects.filter(fqid=OuterRef('object')).values('pk')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_like_and_comment_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='like',
+            name='comment',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='posts.comment'),
+        ),
+        migrations.AddField(
+            model_name='like',
+            name='post',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='posts.post'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['post', '-published'], name='like_post_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['comment', '-published'], name='like_comment_published_idx'),
+        ),
+        migrations.RunPython(link_likes_to_targets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_like_target'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='like',
+            name='published',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_like_published_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='published',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='published',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_and_comment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('POST', 'Post created or updated'), ('DELETED', 'Post deleted'), ('LIKE', 'Like'), ('COMMENT', 'Comment')], max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('comment', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.comment')),
+                ('like', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.like')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='posts.post')),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:27
+
+from django.db import migrations, models
+from posts.blobs import decode_image, store_blob
+
+
+def move_images_to_blobs(apps, schema_editor):
+    # image posts stored their image as base64 content, posts whose content isn't image data keep it
+    Post = apps.get_model('posts', 'Post')
+    for post in Post.objects.filter(contentType__startswith='image/', image='').exclude(content='').iterator():
+        try:
+            data = decode_image(post.content)
+        except ValueError:
+            continue
+        Post.objects.filter(id=post.id).update(image=store_blob(data), content='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(move_images_to_blobs, migrations.RunPython.noop),
+    ]
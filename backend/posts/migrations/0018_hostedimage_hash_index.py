@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_hostedimage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hostedimage',
+            index=models.Index(fields=['content_hash'], name='hostedimage_hash_idx'),
+        ),
+    ]
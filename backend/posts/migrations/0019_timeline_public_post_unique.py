@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_public_entries(apps, schema_editor):
+    # keep the first public entry of each post
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    duplicates = (
+        TimelineEntry.objects.filter(owner__isnull=True).values('post')
+        .annotate(entries=Count('id'), first=Min('id')).filter(entries__gt=1)
+    )
+    for duplicate in duplicates:
+        TimelineEntry.objects.filter(owner__isnull=True, post=duplicate['post']).exclude(id=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_hostedimage_hash_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_public_entries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(condition=models.Q(('owner__isnull', True)), fields=('post',), name='timeline_public_post_unique'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:22
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_visibility(apps, schema_editor):
+    # only the current visibility of posts is known, deleted posts go to their friends
+    Change = apps.get_model('posts', 'Change')
+    Post = apps.get_model('posts', 'Post')
+    post_visibility = Subquery(Post.objects.filter(id=OuterRef('post_id')).values('visibility')[:1])
+    Change.objects.filter(kind__in=['POST', 'DELETED']).update(visibility=post_visibility)
+    Change.objects.filter(kind='DELETED', visibility='DELETED').update(visibility='FRIENDS')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_timeline_public_post_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='visibility',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.RunPython(fill_visibility, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,21 @@
+import mimetypes
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from authors.models import Follow
+from .blobs import decode_image, store_blob
+from .thumbnails import image_dimensions
+
+COUNTER_FIELDS = ['likes_count', 'comments_count']
+SYNCED_FIELDS = ['title', 'description', 'contentType', 'content', 'image', 'visibility']   # fields of a post its remote node can change, its author and publish time stay
+STREAM_FIELDS = SYNCED_FIELDS + ['author_id', 'published', 'is_shared', 'is_deleted']    # fields that decide a post's stream entries and its logged changes
+
+def fields_without_counters(instance):
+    # counters are only changed with F() updates, so saving an instance must not write back stale values
+    return [field.name for field in instance._meta.concrete_fields if not field.primary_key and field.name not in COUNTER_FIELDS]
 
 # Create your models here.
 # Model representing a post
@@ -26,14 +41,26 @@ class Post(models.Model):
     content = models.TextField()  # Content of the post
     description = models.TextField(blank=True)  # Optional description of the post
     contentType = models.CharField(choices=CONTENT_TYPE_CHOICES, max_length=20, default='text/plain')  # Type of content
-    published = models.DateTimeField(auto_now_add=True)  # Timestamp when the post was published
+    published = models.DateTimeField(default=timezone.now, editable=False)  # Timestamp when the post was published, can be given for posts from remote nodes
     visibility = models.CharField(max_length=10, choices=VISIBILITY_CHOICES, default='PUBLIC')  # Visibility of the post
     is_shared = models.BooleanField(default=False)  # Indicates if the post is shared
     original_post = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='shares')  # Reference to the original post if shared
     shares_count = models.PositiveIntegerField(default=0)  # Count of shares
+    likes_count = models.PositiveIntegerField(default=0)  # Count of likes, kept up to date when likes are saved
+    comments_count = models.PositiveIntegerField(default=0)  # Count of comments, kept up to date when comments are saved
     github_activity_id = models.IntegerField(blank=True, null=True)  # GitHub activity ID
     is_deleted = models.BooleanField(default=False)  # Indicates if the post is deleted
     fqid = models.CharField(unique=True, max_length=200, blank=True, null=True)  # Fully qualified ID
+    image = models.CharField(max_length=64, blank=True, default="")  # SHA-256 digest of the image of an image post in the blob store, see blobs.py
+
+    class Meta:
+        indexes = [
+            # an author's posts newest first, deleted posts are never listed
+            models.Index(fields=['author', '-published'], condition=Q(is_deleted=False), name='post_author_live_idx'),
+            models.Index(fields=['author', '-published'], condition=Q(is_shared=True), name='post_author_shared_idx'),
+            # the public posts other nodes read
+            models.Index(fields=['-published'], condition=Q(visibility='PUBLIC', is_deleted=False), name='post_public_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # Override save method to set fqid and page if not already set
@@ -41,7 +68,59 @@ class Post(models.Model):
             self.fqid = f"{self.author.host}authors/{self.author.id}/posts/{self.id}"
         if not self.page:
             self.page = f"{self.author.page}/posts/{self.id}"
+        self.store_image()
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = fields_without_counters(self)
+        # saves that only touch counters like shares_count leave streams and the changes feed alone
+        changed = getattr(self, 'saved_state', None) != self.stream_state()
         super().save(*args, **kwargs)
+        self.saved_state = self.stream_state()
+        if changed:
+            TimelineEntry.fan_out(self)     # keep readers' streams in sync with this post
+            Change.record_posts([self])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        post.saved_state = post.stream_state()
+        return post
+
+    def stream_state(self):
+        # None for deferred fields, which can't have been changed
+        return tuple(self.__dict__.get(field) for field in STREAM_FIELDS)
+
+    @staticmethod
+    def has_changes(stored, post):
+        # whether a post sent again by its node differs from the stored copy
+        return any(getattr(stored, field) != getattr(post, field) for field in SYNCED_FIELDS)
+
+    def store_image(self):
+        """
+        Move image data sent as content into the blob store, keeping only its digest.
+        """
+        if not self.contentType.startswith('image/') or not self.content:
+            return
+        try:
+            data = decode_image(self.content)
+        except ValueError:
+            # not image data, e.g. the link to the stored image sent back by an edit
+            if self.image:
+                self.content = ""
+            return
+        self.image = store_blob(data)
+        self.content = ""
+
+    @property
+    def image_url(self):
+        """
+        Link to this node's copy of the image, the digest makes it change with the image so
+        it can be cached for good. Posts of remote authors get a link on this node as well,
+        which is relative since only our own authors' host is known.
+        """
+        path = reverse('api:authors:get_image_post', args=[self.author_id, self.id])
+        if self.author.remote_node_id is None and self.author.host:
+            return f"{self.author.host}{path.removeprefix('/api/')}?v={self.image}"
+        return f"{path}?v={self.image}"
 
     @property
     def is_shareable(self):
@@ -77,24 +156,43 @@ class Like(models.Model):
     type = models.CharField(default='like', max_length=10)  # Type of like
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)  # User who liked the post or comment
     object = models.CharField(max_length=200)  # URL of the liked object
-    published = models.DateTimeField(auto_now_add=True)  # Timestamp when the like was made
+    post = models.ForeignKey('Post', null=True, blank=True, db_index=False, on_delete=models.CASCADE, related_name='likes')  # Liked post, if it is stored on this node
+    comment = models.ForeignKey('Comment', null=True, blank=True, db_index=False, on_delete=models.CASCADE, related_name='likes')  # Liked comment, if it is stored on this node
+    published = models.DateTimeField(default=timezone.now)  # Timestamp when the like was made, can be given for likes from remote nodes
     fqid = models.URLField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # likes pages are read newest first for one post or comment
+            models.Index(fields=['post', '-published'], name='like_post_published_idx'),
+            models.Index(fields=['comment', '-published'], name='like_comment_published_idx'),
+        ]
+
     def __str__(self):
         # String representation of the like
         return f"{self.author} liked {self.object}"
     
     def save(self, *args, **kwargs):
-        # Override save method to set fqid
-        try:
-            comment = Comment.objects.get(fqid=self.object)
-            if not self.fqid:
-                self.fqid = f"{comment.post.author.host}authors/{self.author.id}/liked/{self.id}"
-        except:
-            post = Post.objects.get(fqid=self.object)
-            if not self.fqid:
-                self.fqid = f"{post.author.host}authors/{self.author.id}/liked/{self.id}"
-        super().save(*args, **kwargs)
+        # Override save method to set fqid and count the like on the liked object.
+        # Callers that already know the liked post or comment set it to skip the lookup.
+        adding = self._state.adding
+        if self.post_id is None and self.comment_id is None:
+            self.resolve_target()
+        if not self.fqid:
+            host = self.comment.post.author.host if self.comment_id else self.post.author.host
+            self.fqid = f"{host}authors/{self.author.id}/liked/{self.id}"
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                target_model, target_id = (Comment, self.comment_id) if self.comment_id else (Post, self.post_id)
+                target_model.objects.filter(pk=target_id).update(likes_count=F('likes_count') + 1)
+                Change.record_likes([self])
+
+    def resolve_target(self):
+        # Find the liked comment or post by the object URL, nodes shape comment ids differently
+        self.comment = Comment.objects.select_related('post__author').filter(fqid=self.object).first()
+        if self.comment is None:
+            self.post = Post.objects.select_related('author').get(fqid=self.object)
 
 # Model representing a comment on a post
 class Comment(models.Model):
@@ -105,19 +203,263 @@ class Comment(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)  # Unique identifier for the comment
     type = models.CharField(default='comment', max_length=10)  # Type of comment
-    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)  # User who made the comment
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, db_index=False, on_delete=models.CASCADE)  # User who made the comment
     comment = models.TextField()  # Content of the comment
     contentType = models.CharField(choices=CONTENT_TYPE_CHOICES, max_length=50, default='text/plain')  # Type of content
-    published = models.DateTimeField(auto_now_add=True)  # Timestamp when the comment was made
-    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')  # Post that was commented on
+    published = models.DateTimeField(default=timezone.now, editable=False)  # Timestamp when the comment was made, can be given for comments from remote nodes
+    post = models.ForeignKey(Post, db_index=False, on_delete=models.CASCADE, related_name='comments')  # Post that was commented on
     fqid = models.CharField(unique=True, max_length=200, blank=True, null=True)  # Fully qualified ID
+    likes_count = models.PositiveIntegerField(default=0)  # Count of likes, kept up to date when likes are saved
+
+    class Meta:
+        indexes = [
+            # comments pages are read newest first for one post or one author
+            models.Index(fields=['post', '-published'], name='comment_post_published_idx'),
+            models.Index(fields=['author', '-published'], name='comment_author_published_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        # Override save method to set fqid if not already set
+        # Override save method to set fqid if not already set and count the comment on its post
+        adding = self._state.adding
         if not self.fqid:
             self.fqid = f"{self.author.host}authors/{self.author.id}/commented/{self.id}"
-        super().save(*args, **kwargs)
+        if not adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = fields_without_counters(self)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Post.objects.filter(pk=self.post_id).update(comments_count=F('comments_count') + 1)
+                Change.record_comments([self])
 
     def __str__(self):
         # String representation of the comment
         return f"Comment by {self.author} on {self.post.title}"
+
+# Model representing a post in a reader's materialized stream
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE, related_name='timeline')  # Reader of the stream, null for posts every reader sees
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')  # Post shown in the stream
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')  # Author of the post, copied so the stream never joins on posts
+    published = models.DateTimeField()  # Copy of the post's published timestamp, used for ordering
+
+    class Meta:
+        unique_together = ['owner', 'post']
+        constraints = [
+            # owner is null for public entries and nulls never collide in unique_together
+            models.UniqueConstraint(fields=['post'], condition=Q(owner__isnull=True), name='timeline_public_post_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-published'], name='timeline_owner_published_idx'),
+        ]
+
+    @staticmethod
+    def get_readers(post):
+        """
+        Get the ids of the authors whose stream should show a post, using the same
+        visibility rules as the stream. None stands for every reader.
+        """
+        if post.is_deleted or post.visibility == 'DELETED':
+            return set()
+
+        if post.visibility == 'PUBLIC':
+            if not post.is_shared:
+                return {None}
+            # shared public posts only show up for followers of the sharer
+            followers = Follow.objects.filter(user=post.author, status='FOLLOWED').exclude(follower=post.author)
+            return set(followers.values_list('follower', flat=True))
+
+        if post.visibility == 'UNLISTED':
+            # friends are always followers too
+            return set(Follow.objects.filter(user=post.author, status='FOLLOWED').values_list('follower', flat=True))
+
+        if post.visibility == 'FRIENDS':
+            return set(Follow.get_friends(post.author))
+
+        return set()
+
+    @staticmethod
+    def fan_out(post):
+        """
+        Add, update or remove the stream entries of a post after it was written.
+        """
+        entries = TimelineEntry.objects.filter(post=post)
+        readers = TimelineEntry.get_readers(post)
+
+        existing = set(entries.values_list('owner', flat=True))
+        stale = existing - readers
+        if stale:
+            stale_query = Q(owner__in=[owner for owner in stale if owner is not None])
+            if None in stale:
+                stale_query |= Q(owner__isnull=True)
+            entries.filter(stale_query).delete()
+
+        # published can change after the first save (e.g. posts from remote nodes)
+        entries.update(author=post.author_id, published=post.published)
+
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(owner_id=owner, post=post, author_id=post.author_id, published=post.published)
+            for owner in readers - existing
+        ], ignore_conflicts=True)
+
+    @staticmethod
+    def remove(posts):
+        """
+        Remove posts that were deleted in bulk from every stream.
+        """
+        TimelineEntry.objects.filter(post__in=posts).delete()
+
+    @staticmethod
+    def sync_pair(reader, author):
+        """
+        Bring the posts of author in reader's stream up to date after a follow edge between
+        them changed. Only that author's posts are read, not either whole stream.
+        """
+        if reader.id == author.id:
+            return
+        from authors.follow_graph import follow_graph
+        edges = follow_graph.get([reader.id], fresh=True)[reader.id]
+
+        visible = []
+        if author.id in edges.following:
+            visible += [Q(visibility='PUBLIC', is_shared=True), Q(visibility='UNLISTED')]
+            if author.id in edges.followers:
+                visible.append(Q(visibility='FRIENDS'))
+
+        entries = TimelineEntry.objects.filter(owner=reader, author=author)
+        if not visible:
+            entries.delete()
+            return
+
+        query = visible.pop()
+        for condition in visible:
+            query |= condition
+        posts = list(Post.objects.filter(query, author=author, is_deleted=False).values_list('id', 'published'))
+        entries.exclude(post__in=[post_id for post_id, published in posts]).delete()
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(owner=reader, post_id=post_id, author=author, published=published)
+            for post_id, published in posts
+        ], batch_size=500, ignore_conflicts=True)
+
+    @staticmethod
+    def rebuild(author):
+        """
+        Rebuild the entries in an author's stream that depend on who they follow.
+        Used by the rebuild_timelines command, follow changes use sync_pair.
+        """
+        following = Follow.objects.filter(follower=author, status='FOLLOWED').values_list('user', flat=True)
+        friends = Follow.get_friends(author)
+
+        posts = Post.objects.filter(is_deleted=False).filter(
+            (Q(visibility='PUBLIC', is_shared=True, author__in=following) & ~Q(author=author)) |
+            Q(visibility='UNLISTED', author__in=following) |
+            Q(visibility__in=['UNLISTED', 'FRIENDS'], author__in=friends)
+        ).values_list('id', 'author', 'published')
+
+        TimelineEntry.objects.filter(owner=author).delete()
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(owner=author, post_id=post_id, author_id=author_id, published=published)
+            for post_id, author_id, published in posts
+        ], batch_size=500, ignore_conflicts=True)
+
+    @staticmethod
+    def rebuild_public():
+        """
+        Rebuild the entries every reader sees (public posts that are not shares).
+        """
+        posts = Post.objects.filter(is_deleted=False, visibility='PUBLIC', is_shared=False).values_list('id', 'author', 'published')
+
+        TimelineEntry.objects.filter(owner__isnull=True).delete()
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(owner=None, post_id=post_id, author_id=author_id, published=published)
+            for post_id, author_id, published in posts
+        ], batch_size=500)
+
+# Model representing an entry in the append-only log of post, like and comment changes
+class Change(models.Model):
+    KIND_CHOICES = [
+        ('POST', 'Post created or updated'),
+        ('DELETED', 'Post deleted'),
+        ('LIKE', 'Like'),
+        ('COMMENT', 'Comment'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)  # Increasing, used as the cursor of the changes feed
+    kind = models.CharField(choices=KIND_CHOICES, max_length=10)  # What changed
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='changes')  # Post that changed, or that was liked or commented on
+    like = models.ForeignKey(Like, null=True, blank=True, db_index=False, on_delete=models.CASCADE, related_name='+')  # New like, for LIKE changes
+    comment = models.ForeignKey(Comment, null=True, blank=True, db_index=False, on_delete=models.CASCADE, related_name='+')  # New comment, for COMMENT changes
+    visibility = models.CharField(max_length=10, blank=True, default='')  # Visibility the post had, for POST and DELETED changes, so deletions only go to those who could read the post
+    created_at = models.DateTimeField(default=timezone.now)  # When the change was logged
+
+    @staticmethod
+    def record_posts(posts):
+        """
+        Log that posts were created, updated or deleted. Called from Post.save() and by
+        code that writes posts in bulk.
+        """
+        posts = list(posts)
+        # deleting a post sets its visibility to DELETED, so deletions take the visibility
+        # of the post's last change. Friends can read every post, which makes them the
+        # safe readers of deletions of posts whose visibility isn't known.
+        last_visibility = dict(
+            Change.objects.filter(kind='POST', post__in=[post.id for post in posts if post.visibility == 'DELETED'])
+            .order_by('id').values_list('post_id', 'visibility')
+        )
+        Change.objects.bulk_create([
+            Change(kind='POST', post=post, visibility=post.visibility)
+            if not (post.is_deleted or post.visibility == 'DELETED') else
+            Change(kind='DELETED', post=post,
+                   visibility=post.visibility if post.visibility != 'DELETED' else last_visibility.get(post.id, 'FRIENDS'))
+            for post in posts
+        ])
+
+    @staticmethod
+    def record_likes(likes):
+        # likes of comments are logged against the comment's post
+        Change.objects.bulk_create([
+            Change(kind='LIKE', like=like, post_id=like.comment.post_id if like.comment_id else like.post_id)
+            for like in likes
+        ])
+
+    @staticmethod
+    def record_comments(comments):
+        Change.objects.bulk_create([Change(kind='COMMENT', comment=comment, post_id=comment.post_id) for comment in comments])
+
+# Model representing an image uploaded to this node, so they are listed from this table instead of the media directory
+class HostedImage(models.Model):
+    file_name = models.CharField(max_length=255, unique=True)  # Name of the file in media/images/
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='hosted_images')  # Uploader, unknown for imported files
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()  # In bytes
+    width = models.PositiveIntegerField(null=True, blank=True)  # In pixels, unknown if Pillow can't read the file
+    height = models.PositiveIntegerField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64)  # SHA-256 of the file
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # the image listing pages newest first on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='hostedimage_created_idx'),
+            # uploads of an image that is already hosted are matched by hash
+            models.Index(fields=['content_hash'], name='hostedimage_hash_idx'),
+        ]
+
+    @property
+    def url(self):
+        return f"{settings.MEDIA_URL}images/{self.file_name}"
+
+    @staticmethod
+    def describe(file_name, image_file, size, content_hash, **fields):
+        """
+        Get an unsaved HostedImage for a file in media/images/, given an open copy of it.
+        """
+        width, height = image_dimensions(image_file)
+        return HostedImage(
+            file_name=file_name,
+            content_type=mimetypes.guess_type(file_name)[0] or 'application/octet-stream',
+            size=size,
+            width=width,
+            height=height,
+            content_hash=content_hash,
+            **fields,
+        )
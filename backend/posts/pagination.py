@@ -0,0 +1,119 @@
+import base64
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination:
+    """
+    Opt-in cursor pagination keyed on (published, id), newest first. Models timestamped
+    with another field pass its name as time_field.
+
+    Clients ask for it by sending a `cursor` query parameter (empty for the first page).
+    Each page is read with a range filter instead of an OFFSET, and no COUNT(*) is run.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'size'
+    max_page_size = 100
+
+    def __init__(self, page_size, id_field='id', time_field='published'):
+        self.page_size = page_size
+        self.id_field = id_field
+        self.time_field = time_field
+        self.next_position = None
+
+    @classmethod
+    def is_requested(cls, request):
+        return cls.cursor_query_param in request.query_params
+
+    def encode_cursor(self, published, object_id):
+        return base64.urlsafe_b64encode(f"{published.isoformat()}|{object_id}".encode()).decode()
+
+    def decode_cursor(self, cursor, model):
+        try:
+            published, object_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+            published = parse_datetime(published)
+            # a forged id of the wrong type would fail when the filter is built
+            object_id = model._meta.get_field(self.id_field).to_python(object_id)
+        except (ValueError, UnicodeDecodeError, ValidationError):
+            raise NotFound("Invalid cursor")
+        if published is None or object_id in (None, ''):
+            raise NotFound("Invalid cursor")
+        return published, object_id
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(f"-{self.time_field}", f"-{self.id_field}")
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            published, object_id = self.decode_cursor(cursor, queryset.model)
+            queryset = queryset.filter(
+                Q(**{f"{self.time_field}__lt": published}) |
+                Q(**{self.time_field: published, f"{self.id_field}__lt": object_id})
+            )
+
+        # fetch one extra row to know if there is a next page
+        results = list(queryset[:self.page_size + 1])
+        if len(results) > self.page_size:
+            results = results[:self.page_size]
+            last = results[-1]
+            self.next_position = (getattr(last, self.time_field), getattr(last, self.id_field))
+        return results
+
+    def get_next_cursor(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(*self.next_position)
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+def paginate_collection(queryset, request, page_size, count=None):
+    """
+    Page a comments or likes queryset, returning the paging fields of the collection object.
+    Uses keyset pagination when the client sends a cursor, page numbers otherwise.
+    Pass `count` when it is already known (e.g. from a counter column) to skip the COUNT(*).
+    """
+    if KeysetPagination.is_requested(request):
+        paginator = KeysetPagination(page_size)
+        src = paginator.paginate_queryset(queryset, request)
+        return {
+            'size': paginator.page_size,
+            'next': paginator.get_next_link(),
+            'src': src,
+        }
+
+    paginator = Paginator(queryset, page_size)
+    if count is not None:
+        paginator.count = count
+    page_obj = paginator.get_page(request.query_params.get('page', 1))
+    return {
+        'page_number': page_obj.number,
+        'size': paginator.per_page,
+        'count': paginator.count,
+        'src': page_obj.object_list,
+    }
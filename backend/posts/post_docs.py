@@ -134,7 +134,8 @@ get_image_post_by_fqid_docs = swagger_auto_schema(
         openapi.Parameter(
             'post_fqid', openapi.IN_PATH, type=openapi.TYPE_STRING,
             description="Fully Qualified ID (FQID) of the post", example="http://localhost:8000/api/authors/111/posts/249"
-        )
+        ),
+        openapi.Parameter('w', openapi.IN_QUERY, description="Width in pixels to resize the image to, rounded up to 64, 320 or 1080. Wider requests get the full image", type=openapi.TYPE_INTEGER, required=False),
     ],
     responses={
         200: openapi.Response(
@@ -323,3 +324,45 @@ get_post_likes_docs = swagger_auto_schema(
         )
     }
 )
+
+get_changes_docs = swagger_auto_schema(
+    method='get',
+    operation_summary="Get the changes to posts, likes and comments after a cursor",
+    operation_description="""
+    **When to use**: Use this endpoint to keep a copy of the posts you can see up to date without fetching whole streams again.
+
+    **How to use**: Send a GET request with `after` set to the `next` value of your previous request (0 the first time) and an optional `size` (100 by default, at most 500). Each change has a `type` of post (created or updated, with the whole post), deleted (with the post's id), like or comment. Changes come in the order they were made, and only once they are a few seconds old so that no change is skipped by the cursor. Deletions are only sent to those who could read the post before it was deleted.
+
+    **Why/Why not**: Polling this endpoint sends only what changed since the last poll. Nodes authenticated with their node credentials get the changes to public posts; authors also get the unlisted and friends-only posts they can see.
+    """,
+    manual_parameters=[
+        openapi.Parameter('after', openapi.IN_QUERY, description="Cursor, the next value of the previous response", type=openapi.TYPE_INTEGER, required=False),
+        openapi.Parameter('size', openapi.IN_QUERY, description="Changes per response", type=openapi.TYPE_INTEGER, required=False),
+    ],
+    responses={
+        200: openapi.Response(
+            description="The changes after the cursor",
+            examples={
+                "application/json": {
+                    "type": "changes",
+                    "changes": [
+                        {
+                            "id": 42,
+                            "type": "deleted",
+                            "published": "2024-11-12T20:43:43.441503Z",
+                            "object": {
+                                "type": "post",
+                                "id": "http://localhost:3000/api/authors/1/posts/7122560a-9d41-4843-82ed-7273322e8c9b",
+                                "visibility": "DELETED"
+                            }
+                        }
+                    ],
+                    "next": 42
+                }
+            }
+        ),
+        400: openapi.Response(
+            description="after or size is not an integer",
+        )
+    }
+)
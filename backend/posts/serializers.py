@@ -2,10 +2,30 @@ from rest_framework import serializers
 from .models import *
 from authors.models import *
 from django.core.paginator import Paginator
+from django.db import models
+from django.db.models import F, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
 import commonmark
 from django.core.files.base import ContentFile
 import base64
 from authors.serializers import AuthorSummarySerializer
+from .blobs import encode_image
+
+def wants_inline_images(request):
+    # clients get links to images unless they ask for the image data with ?images=inline
+    return request.query_params.get('images') == 'inline'
+
+def get_post_content(post, inline_images=False):
+    """
+    Get the content of a post for its JSON. Stored images are sent as a link to the post's
+    image endpoint, or as base64 when inline_images is set.
+    """
+    if not post.image:
+        return post.content
+    if inline_images:
+        return encode_image(post.image, post.contentType)
+    return post.image_url
+
 # Serializer for Post model
 class PostSerializer(serializers.ModelSerializer):
     author = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -16,8 +36,13 @@ class PostSerializer(serializers.ModelSerializer):
         fields = ['type', 'id', 'page', 'title', 'description', 'contentType', 'content', 'author', 'published', 'visibility', 'is_shared', 'original_post', 'shares_count']
         read_only_fields = ['type', 'id', 'author', 'published', 'is_shared', 'original_post', 'shares_count']
 
+    def __init__(self, *args, **kwargs):
+        self.inline_images = kwargs.pop('inline_images', False)
+        super().__init__(*args, **kwargs)
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
+        representation['content'] = get_post_content(instance, self.inline_images)
         # Remove fields based on whether the post is shared or not
         if instance.is_shared:
             representation.pop('shares_count', None)
@@ -70,6 +95,51 @@ class ShareSerializer(serializers.ModelSerializer):
         fields = ['id', 'sharer', 'post', 'shared_at']
         read_only_fields = ['id', 'sharer', 'shared_at']
 
+def first_rows(queryset, partition, page, size):
+    """
+    Get one page of the newest rows of every partition (e.g. per post) in a single query.
+    """
+    start = (page - 1) * size
+    return queryset.annotate(
+        row=Window(RowNumber(), partition_by=F(partition), order_by=[F('published').desc(), F('id').desc()])
+    ).filter(row__gt=start, row__lte=start + size).order_by(partition, 'row')
+
+def prefetch_post_summaries(posts, page=1):
+    """
+    Load everything PostSummarySerializer needs for a list of posts in a fixed number
+    of queries: authors, one page of comments, the likes on those comments and the
+    likes on the posts. Counts come from the counters stored on the rows.
+    """
+    prefetch_related_objects(posts, 'author')
+    post_ids = [post.id for post in posts]
+
+    comments = {}
+    for comment in first_rows(Comment.objects.filter(post__in=post_ids).select_related('author', 'post__author'), 'post', page, 5):
+        comments.setdefault(comment.post_id, []).append(comment)
+
+    comment_ids = [comment.id for post_comments in comments.values() for comment in post_comments]
+
+    post_likes = {}
+    for like in first_rows(Like.objects.filter(post__in=post_ids).select_related('author'), 'post', page, 5):
+        post_likes.setdefault(like.post_id, []).append(like)
+    comment_likes = {}
+    for like in first_rows(Like.objects.filter(comment__in=comment_ids).select_related('author'), 'comment', 1, 50):
+        comment_likes.setdefault(like.comment_id, []).append(like)
+
+    return {
+        'post_ids': set(post_ids),
+        'comments': comments,
+        'post_likes': post_likes,
+        'comment_likes': comment_likes,
+    }
+
+# Serializer for a page of posts, sharing one prefetch between every post
+class PostSummaryListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        posts = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.prefetched = prefetch_post_summaries(posts, self.child.page)
+        return super().to_representation(posts)
+
 # Serializer for summarizing Post model
 class PostSummarySerializer(serializers.ModelSerializer):
     type = serializers.CharField(default='post', read_only=True)
@@ -83,43 +153,48 @@ class PostSummarySerializer(serializers.ModelSerializer):
 
     def __init__(self, *args, **kwargs):
         self.page = kwargs.pop('page', 1)
+        self.inline_images = kwargs.pop('inline_images', False)
+        self.prefetched = None
         super().__init__(*args, **kwargs)
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        representation['content'] = get_post_content(instance, self.inline_images)
+        return representation
+
+    def get_prefetched(self, obj):
+        # posts serialized on their own load their related rows on first use
+        if self.prefetched is None or obj.id not in self.prefetched['post_ids']:
+            self.prefetched = prefetch_post_summaries([obj], self.page)
+        return self.prefetched
     
     def get_author(self, obj):
-        author = Author.objects.get(id=obj.author.id)
-        return AuthorSummarySerializer(author).data
+        return AuthorSummarySerializer(obj.author).data
     
     def get_comments(self, obj):
-
-        comment_objects = Comment.objects.filter(post__id=obj.id).order_by('-published')
-
-        paginator = Paginator(comment_objects, 5)
-        page_obj = paginator.get_page(self.page)
+        prefetched = self.get_prefetched(obj)
 
         serializer = CommentsSerializer({
             'page': f"{obj.author.page}/posts/{obj.id}",
             'id': f"{obj.author.host}authors/{obj.author.id}/posts/{obj.id}/comments",
-            'page_number': page_obj.number,
-            'size': paginator.per_page,
-            'count': paginator.count,
-            'src': page_obj.object_list,
-        })
+            'page_number': self.page,
+            'size': 5,
+            'count': obj.comments_count,
+            'src': prefetched['comments'].get(obj.id, []),
+        }, context={'prefetched': prefetched})
 
         return serializer.data
     
     def get_likes(self, obj):
-        like_objects = Like.objects.filter(object=obj.fqid).order_by('-published')
-
-        paginator = Paginator(like_objects, 5)
-        page_obj = paginator.get_page(self.page)
+        prefetched = self.get_prefetched(obj)
 
         serializer = LikesSerializer({
             'page': f"{obj.author.page}/posts/{obj.id}",
             'id': f"{obj.author.host}authors/{obj.author.id}/posts/{obj.id}/likes",
-            'page_number': page_obj.number,
-            'size': paginator.per_page,
-            'count': paginator.count,
-            'src': page_obj.object_list,
+            'page_number': self.page,
+            'size': 5,
+            'count': obj.likes_count,
+            'src': prefetched['post_likes'].get(obj.id, []),
         })
 
         return serializer.data
@@ -130,6 +205,7 @@ class PostSummarySerializer(serializers.ModelSerializer):
             'type', 'title', 'id', 'page', 'description', 'contentType', 'content',
             'author', 'comments', 'likes', 'published', 'visibility'
         ]
+        list_serializer_class = PostSummaryListSerializer
 
 # Serializer for Like model
 class LikeSerializer(serializers.ModelSerializer):
@@ -145,9 +221,10 @@ class LikesSerializer(serializers.Serializer):
     type = serializers.CharField(default='likes', read_only=True)
     page = serializers.CharField()
     id = serializers.CharField()
-    page_number = serializers.IntegerField()
+    page_number = serializers.IntegerField(required=False)   # left out in cursor mode
     size = serializers.IntegerField()
-    count = serializers.IntegerField()
+    count = serializers.IntegerField(required=False)         # left out in cursor mode
+    next = serializers.CharField(required=False, allow_null=True)   # only in cursor mode
     src = LikeSerializer(many=True)
 
 # Serializer for Comment model
@@ -175,14 +252,19 @@ class CommentSerializer(serializers.ModelSerializer):
         return f"{obj.post.author.host}authors/{obj.post.author.id}/posts/{obj.post.id}"
 
     def get_likes(self, obj):
-        likes = Like.objects.filter(object=self.get_id(obj))
+        prefetched = self.context.get('prefetched')
+        if prefetched is not None:
+            # likes were already loaded for the whole page of posts
+            likes = prefetched['comment_likes'].get(obj.id, [])
+        else:
+            likes = Like.objects.filter(comment=obj)[:50]  # Return first 50 likes
         likes_serializer = LikesSerializer({
             'page': f"{obj.author.page}/commented/{obj.id}/likes",
             'id': f"{obj.author.host}authors/{obj.author.id}/commented/{obj.id}/likes",
             'page_number': 1,
             'size': 50,
-            'count': likes.count(),
-            'src': likes[:50],  # Return first 50 likes
+            'count': obj.likes_count,
+            'src': likes,
         })
         return likes_serializer.data
 
@@ -191,7 +273,35 @@ class CommentsSerializer(serializers.Serializer):
     type = serializers.CharField(default='comments', read_only=True)
     page = serializers.CharField()
     id = serializers.CharField()
-    page_number = serializers.IntegerField()
+    page_number = serializers.IntegerField(required=False)   # left out in cursor mode
     size = serializers.IntegerField()
-    count = serializers.IntegerField()
+    count = serializers.IntegerField(required=False)         # left out in cursor mode
+    next = serializers.CharField(required=False, allow_null=True)   # only in cursor mode
     src = CommentSerializer(many=True)
+
+def serialize_changes(changes, inline_images=False):
+    """
+    Serialize a page of changes from the changes feed. Posts share one prefetch, and
+    the likes on new comments are loaded with one query.
+    """
+    posts = list({change.post_id: change.post for change in changes if change.kind == 'POST'}.values())
+    serialized_posts = dict(zip((post.id for post in posts), PostSummarySerializer(posts, many=True, inline_images=inline_images).data))
+
+    comment_ids = [change.comment_id for change in changes if change.kind == 'COMMENT']
+    comment_likes = {}
+    for like in first_rows(Like.objects.filter(comment__in=comment_ids).select_related('author'), 'comment', 1, 50):
+        comment_likes.setdefault(like.comment_id, []).append(like)
+    comment_context = {'prefetched': {'comment_likes': comment_likes}}
+
+    entries = []
+    for change in changes:
+        if change.kind == 'POST':
+            object_data = serialized_posts[change.post_id]
+        elif change.kind == 'DELETED':
+            object_data = {'type': 'post', 'id': change.post.fqid, 'visibility': 'DELETED'}
+        elif change.kind == 'LIKE':
+            object_data = LikeSerializer(change.like).data
+        else:
+            object_data = CommentSerializer(change.comment, context=comment_context).data
+        entries.append({'id': change.id, 'type': change.kind.lower(), 'published': change.created_at, 'object': object_data})
+    return entries
@@ -1,18 +1,33 @@
+from django.test import override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
-from authors.models import Author
-from posts.models import Post
+from authors.models import Author, Follow, RemoteNode
+from posts.models import Post, Comment, Like, Change
+from posts.serializers import PostSummarySerializer
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from io import StringIO
 
 from rest_framework.authtoken.models import Token
 from unittest.mock import patch
 import json
 import base64
+import hashlib
+import shutil
+import tempfile
 from urllib.parse import quote
+from unittest import skipUnless
+from io import BytesIO
+from posts.thumbnails import Image
 
 class PostAndGithubActivityTests(APITestCase):
 
     def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_settings.enable()
         self.user = Author.objects.create(username="testuser", display_name="Test User", host="http://localhost:3000/api/")
         self.password = "testpass"
         self.user.set_password(self.password)
@@ -40,6 +55,10 @@ class PostAndGithubActivityTests(APITestCase):
             visibility="UNLISTED"
         )
 
+    def tearDown(self):
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
     def test_get_public_post(self):
         # Test GET request to retrieve a public post
         url = reverse('api:authors:get_post', args=[self.user.id, self.public_post.id])
@@ -157,6 +176,97 @@ class PostAndGithubActivityTests(APITestCase):
          self.assertEqual(response.status_code, status.HTTP_200_OK)
          self.assertEqual(response['Content-Type'], 'image/jpeg;base64')
 
+    def test_image_posts_keep_a_reference_to_one_blob(self):
+        image_data = base64.b64encode(b'image bytes').decode()
+        uploaded = Post.objects.create(title="Uploaded", content=f"data:image/png;base64,{image_data}", contentType="image/png", author=self.user)
+        received = Post.objects.create(title="Received", content=image_data, contentType="image/png;base64", author=self.user)
+        self.assertEqual(uploaded.image, hashlib.sha256(b'image bytes').hexdigest())
+        self.assertEqual(received.image, uploaded.image)
+        self.assertEqual(uploaded.content, "")
+
+        url = reverse('api:authors:get_post', args=[self.user.id, uploaded.id])
+        self.assertEqual(self.client.get(url).data['content'], uploaded.image_url)
+        self.assertEqual(self.client.get(url, {'images': 'inline'}).data['content'], f"data:image/png;base64,{image_data}")
+        url = reverse('api:authors:get_post', args=[self.user.id, received.id])
+        self.assertEqual(self.client.get(url, {'images': 'inline'}).data['content'], image_data)
+
+        # editing a post sends the link back, which keeps the stored image
+        uploaded.content = uploaded.image_url
+        uploaded.save()
+        uploaded.refresh_from_db()
+        self.assertEqual((uploaded.image, uploaded.content), (received.image, ""))
+
+    def test_remote_image_posts_link_to_our_copy(self):
+        node = RemoteNode.objects.create(url="http://nodeaaaa", username="node", password="nodepass")
+        remote_author = Author.objects.create(username="http://nodeaaaa/api/authors/111", display_name="Greg", host="http://nodeaaaa/api/",
+                                              fqid="http://nodeaaaa/api/authors/111", remote_node=node)
+        post = Post.objects.create(title="Remote", content=base64.b64encode(b'remote bytes').decode(), contentType="image/png;base64",
+                                   author=remote_author, visibility="PUBLIC", fqid="http://nodeaaaa/api/authors/111/posts/222")
+
+        link = post.image_url
+        self.assertEqual(link, f"{reverse('api:authors:get_image_post', args=[remote_author.id, post.id])}?v={post.image}")
+        self.assertEqual(b''.join(self.client.get(link).streaming_content), b'remote bytes')
+
+    def test_image_endpoints_validate_and_serve_ranges(self):
+        image = b'0123456789' * 10
+        post = Post.objects.create(title="Image", content=base64.b64encode(image).decode(), contentType="image/png;base64", author=self.user, visibility="PUBLIC")
+        url = reverse('api:authors:get_image_post', args=[self.user.id, post.id])
+
+        response = self.client.get(url)
+        etag = f'"{post.image}"'
+        last_modified = response['Last-Modified']
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        self.assertEqual(self.client.get(url, {'v': post.image})['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse([query for query in queries if '"content"' in query['sql']])
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=5-14')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], 'bytes 5-14/100')
+        self.assertEqual(b''.join(response.streaming_content), image[5:15])
+        response = self.client.get(url, HTTP_RANGE='bytes=-3', HTTP_IF_RANGE=etag)
+        self.assertEqual(b''.join(response.streaming_content), image[-3:])
+        # a range of an image that changed since gets the whole new image
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=100-').status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        response = self.client.get(reverse('api:posts:get_post_image', args=[post.fqid]))
+        self.assertEqual(response.data['src'], post.image_url)
+        response = self.client.get(reverse('api:posts:get_post_image', args=[post.fqid]), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @skipUnless(Image, "resizing images needs Pillow")
+    def test_image_endpoints_send_thumbnails(self):
+        png = BytesIO()
+        Image.new('RGBA', (1600, 800), (255, 0, 0, 255)).save(png, 'PNG')
+        post = Post.objects.create(title="Image", content=base64.b64encode(png.getvalue()).decode(), contentType="image/png;base64", author=self.user, visibility="PUBLIC")
+        url = reverse('api:authors:get_image_post', args=[self.user.id, post.id])
+
+        response = self.client.get(url, {'w': 300}, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['ETag'], f'"{post.image}-320.webp"')
+        self.assertIn('Accept', response['Vary'])
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 160))
+
+        # browsers without WebP get JPEG, and the copy made on the first request is reused
+        response = self.client.get(url, {'w': 64})
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with patch('posts.thumbnails.resize') as resize:
+            self.assertEqual(self.client.get(url, {'w': 64})['ETag'], f'"{post.image}-64.jpg"')
+        resize.assert_not_called()
+
+        # wider than any thumbnail gets the image itself
+        self.assertEqual(self.client.get(url, {'w': 4000})['ETag'], f'"{post.image}"')
+        self.assertEqual(self.client.get(url, {'w': 'wide'}).status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_non_image_post_by_fqid(self):
          encoded_fqid = quote(self.public_post.fqid, safe="")
 
@@ -165,3 +275,159 @@ class PostAndGithubActivityTests(APITestCase):
          response = self.client.get(url)
          self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
          self.assertIn("Not an image post", response.json()['detail'])
+
+    def test_post_summary_list_query_count(self):
+        # serializing a page of posts takes the same number of queries no matter how many posts it has
+        other = Author.objects.create(username="otheruser", display_name="Other User", host="http://localhost:3000/api/")
+
+        def make_posts(count):
+            for i in range(count):
+                post = Post.objects.create(title=f"Post {i}", content="content", author=self.user, visibility="PUBLIC")
+                comment = Comment.objects.create(author=other, post=post, comment="nice")
+                Like.objects.create(author=other, object=post.fqid)
+                Like.objects.create(author=self.user, object=comment.fqid)
+
+        def count_queries():
+            posts = Post.objects.all()
+            with CaptureQueriesContext(connection) as queries:
+                data = PostSummarySerializer(posts, many=True).data
+            return len(queries), data
+
+        make_posts(2)
+        few_queries, _ = count_queries()
+        make_posts(6)
+        many_queries, data = count_queries()
+
+        self.assertEqual(few_queries, many_queries)
+        post_data = next(post for post in data if post['title'] == "Post 0")
+        self.assertEqual(post_data['comments']['count'], 1)
+        self.assertEqual(post_data['likes']['count'], 1)
+        self.assertEqual(post_data['comments']['src'][0]['likes']['count'], 1)
+
+    def test_like_and_comment_counters(self):
+        # counters follow new likes and comments, and saving a stale post doesn't overwrite them
+        stale_post = Post.objects.get(id=self.public_post.id)
+        comment = Comment.objects.create(author=self.user, post=self.public_post, comment="first")
+        Like.objects.create(author=self.user, object=self.public_post.fqid)
+        Like.objects.create(author=self.user, object=comment.fqid)
+
+        stale_post.title = "Renamed"
+        stale_post.save()
+
+        self.public_post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(self.public_post.likes_count, 1)
+        self.assertEqual(self.public_post.comments_count, 1)
+        self.assertEqual(comment.likes_count, 1)
+
+    def test_like_links_target(self):
+        # likes point at the liked post or comment so they can be read through the index
+        comment = Comment.objects.create(author=self.user, post=self.public_post, comment="first")
+        post_like = Like.objects.create(author=self.user, object=self.public_post.fqid)
+        comment_like = Like.objects.create(author=self.user, object=comment.fqid)
+
+        self.assertEqual(post_like.post, self.public_post)
+        self.assertIsNone(post_like.comment)
+        self.assertEqual(comment_like.comment, comment)
+        self.assertIsNone(comment_like.post)
+
+    def test_reconcile_counters_command(self):
+        Comment.objects.create(author=self.user, post=self.public_post, comment="first")
+        Post.objects.filter(id=self.public_post.id).update(likes_count=7, comments_count=0)
+
+        call_command('reconcile_counters', stdout=StringIO())
+
+        self.public_post.refresh_from_db()
+        self.assertEqual(self.public_post.likes_count, 0)
+        self.assertEqual(self.public_post.comments_count, 1)
+
+    def test_explain_queries_uses_indexes(self):
+        posts = Post.objects.count()
+        out = StringIO()
+        call_command('explain_queries', seed=5, runs=1, stdout=out)
+
+        self.assertIn('post_public_idx', out.getvalue())
+        self.assertIn('comment_post_published_idx', out.getvalue())
+        self.assertEqual(Post.objects.count(), posts)    # the seeded data is rolled back
+
+
+class ChangesFeedTests(APITestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(username="author", display_name="Author", host="http://localhost:3000/api/")
+        self.reader = Author.objects.create(username="reader", display_name="Reader", host="http://localhost:3000/api/")
+        self.public_post = Post.objects.create(title="Public", content="public", author=self.author, visibility="PUBLIC")
+        self.friends_post = Post.objects.create(title="Friends", content="friends", author=self.author, visibility="FRIENDS")
+        self.url = reverse('api:posts:get_changes')
+        patcher = patch('posts.views.CHANGES_SETTLE_TIME', 0)     # changes are sent as soon as they are made
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_changes_after_cursor(self):
+        response = self.client.get(self.url)
+        self.assertEqual([(change['type'], change['object']['title']) for change in response.data['changes']], [('post', "Public")])
+        cursor = response.data['next']
+
+        comment = Comment.objects.create(author=self.reader, post=self.public_post, comment="hi")
+        Like.objects.create(author=self.reader, object=comment.fqid)
+        self.public_post.visibility = 'DELETED'
+        self.public_post.is_deleted = True
+        self.public_post.save()
+
+        response = self.client.get(self.url, {'after': cursor})
+        # changes to a post are hidden once it is deleted, except the deletion itself
+        self.assertEqual([change['type'] for change in response.data['changes']], ['deleted'])
+        self.assertEqual(response.data['changes'][0]['object']['id'], self.public_post.fqid)
+
+        response = self.client.get(self.url, {'after': response.data['next']})
+        self.assertEqual(response.data['changes'], [])
+
+    def test_counter_saves_are_not_logged(self):
+        changes = Change.objects.count()
+        post = Post.objects.get(id=self.public_post.id)
+        post.increment_shares_count()
+        self.assertEqual(Change.objects.count(), changes)
+
+        post.title = "Edited"
+        post.save()
+        self.assertEqual(Change.objects.count(), changes + 1)
+
+    def test_friends_see_friends_only_changes(self):
+        Follow.objects.create(user=self.author, follower=self.reader, status='FOLLOWED')
+        Follow.objects.create(user=self.reader, follower=self.author, status='FOLLOWED')
+        Comment.objects.create(author=self.reader, post=self.friends_post, comment="hi")
+
+        token = Token.objects.create(user=self.reader)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual([change['type'] for change in response.data['changes']], ['post', 'post', 'comment'])
+        self.assertEqual(response.data['changes'][2]['object']['comment'], "hi")
+        self.assertLess(len(queries), 15)
+
+    def test_deletions_only_go_to_readers_of_the_post(self):
+        self.friends_post.visibility = 'DELETED'
+        self.friends_post.is_deleted = True
+        self.friends_post.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual([change['type'] for change in response.data['changes']], ['post'])
+
+        Follow.objects.create(user=self.author, follower=self.reader, status='FOLLOWED')
+        Follow.objects.create(user=self.reader, follower=self.author, status='FOLLOWED')
+        token = Token.objects.create(user=self.reader)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        response = self.client.get(self.url)
+        self.assertEqual([change['type'] for change in response.data['changes']], ['post', 'deleted'])
+        self.assertEqual(response.data['changes'][1]['object']['id'], self.friends_post.fqid)
+
+    def test_recent_changes_wait_to_settle(self):
+        cursor = self.client.get(self.url).data['next']
+        with patch('posts.views.CHANGES_SETTLE_TIME', 60):
+            Post.objects.create(title="New", content="new", author=self.author, visibility="PUBLIC")
+            response = self.client.get(self.url, {'after': cursor})
+            self.assertEqual(response.data['changes'], [])
+            self.assertEqual(response.data['next'], cursor)
+
+        response = self.client.get(self.url, {'after': cursor})
+        self.assertEqual([change['object']['title'] for change in response.data['changes']], ["New"])
@@ -0,0 +1,114 @@
+'''
+Smaller copies of stored images, for feeds and pickers that don't need the full image.
+
+The image endpoints send one of THUMBNAIL_WIDTHS when asked with ?w=, as WebP to browsers
+that accept it and as JPEG otherwise. A copy is made the first time it is asked for, or
+ahead of time by the make_thumbnails command, and kept under MEDIA_ROOT/thumbnails/ next
+to the path of its image. Copies are never changed: images of posts are stored by digest
+and uploaded images under a new name, so a new image always gets new copies.
+
+Resizing needs Pillow. Without it, or for files Pillow can't read, the full image is sent.
+'''
+
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+try:
+    from PIL import Image
+except ImportError:     # Pillow is optional, images are then sent at full size
+    Image = None
+
+THUMBNAIL_DIR = 'thumbnails'
+THUMBNAIL_WIDTHS = (64, 320, 1080)
+THUMBNAIL_QUALITY = 80
+FORMATS = {     # extension -> (Pillow format, content type)
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+
+
+def thumbnail_width(requested):
+    """
+    Get the width to send for a ?w= value: the smallest thumbnail at least that wide, or
+    None if it is wider than all of them. Raises ValueError if it isn't a positive integer.
+    """
+    requested = int(requested)
+    if requested < 1:
+        raise ValueError(requested)
+    return next((width for width in THUMBNAIL_WIDTHS if width >= requested), None)
+
+
+def thumbnail_format(request):
+    return 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpg'
+
+
+def thumbnail_path(path, width, extension):
+    return f"{THUMBNAIL_DIR}/{path}/{width}.{extension}"
+
+
+def resize(data, width, extension):
+    # never scaled up, a narrower image is only re-encoded
+    with Image.open(BytesIO(data)) as image:
+        image.thumbnail((width, width * 10))
+        if extension == 'jpg' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = BytesIO()
+        image.save(output, FORMATS[extension][0], quality=THUMBNAIL_QUALITY)
+    return output.getvalue()
+
+
+def image_dimensions(image_file):
+    """
+    Get the (width, height) of an image file, or (None, None) without Pillow or for files
+    it can't read. Only the image's header is read.
+    """
+    if Image is None:
+        return None, None
+    try:
+        image_file.seek(0)
+        with Image.open(image_file) as image:
+            return image.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, None
+
+
+def make_thumbnail(path, width, extension):
+    """
+    Get the path of a thumbnail of the stored image at path, making it if it doesn't
+    exist yet. Returns None if it can't be made.
+    """
+    if Image is None:
+        return None
+    thumbnail = thumbnail_path(path, width, extension)
+    if default_storage.exists(thumbnail):
+        return thumbnail
+
+    with default_storage.open(path, 'rb') as source:
+        data = source.read()
+    try:
+        resized = resize(data, width, extension)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    saved_path = default_storage.save(thumbnail, ContentFile(resized))
+    if saved_path != thumbnail:
+        # another request made the same thumbnail at the same time, keep theirs
+        default_storage.delete(saved_path)
+    return thumbnail
+
+
+def get_thumbnail(request, path):
+    """
+    Get the (path, width, extension) of the thumbnail a request asks for with ?w=, or None
+    to send the image at path itself. Raises ValueError for a bad ?w=.
+    """
+    if 'w' not in request.GET:
+        return None
+    width = thumbnail_width(request.GET['w'])
+    if width is None:
+        return None
+    extension = thumbnail_format(request)
+    thumbnail = make_thumbnail(path, width, extension)
+    if thumbnail is None:
+        return None
+    return thumbnail, width, extension
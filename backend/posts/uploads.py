@@ -0,0 +1,89 @@
+'''
+Image uploads that are never held in memory whole.
+
+A raw upload body is copied to a temporary file a chunk at a time and hashed on the way.
+Multipart files, which Django already spools to disk, are hashed a chunk at a time. Both
+stop as soon as the image passes settings.MAX_IMAGE_UPLOAD_SIZE. Requests whose
+Content-Length is already too big are refused by limit_upload_size before anything is read.
+'''
+
+import functools
+import hashlib
+import tempfile
+from django.conf import settings
+from django.http import JsonResponse
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+BODY_OVERHEAD = 64 * 1024   # room for multipart headers and JSON around the image
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def too_large_response():
+    return JsonResponse({"error": f"Images can be at most {settings.MAX_IMAGE_UPLOAD_SIZE} bytes"}, status=413)
+
+
+def max_body_size():
+    # data: URIs are base64, which is 4/3 the size of the image
+    return settings.MAX_IMAGE_UPLOAD_SIZE * 4 // 3 + BODY_OVERHEAD
+
+
+def limit_upload_size(view):
+    """
+    Refuse upload requests that are too big from their Content-Length, before the body is
+    read. Goes outside @api_view, which may parse the body while checking CSRF.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > max_body_size():
+            return too_large_response()
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def hash_chunks(chunks, limit=None, output=None):
+    """
+    Get the (size, SHA-256) of chunks of an image, writing them to output if given.
+    Raises UploadTooLarge once they pass limit bytes.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise UploadTooLarge(size)
+        digest.update(chunk)
+        if output is not None:
+            output.write(chunk)
+    return size, digest.hexdigest()
+
+
+def receive_stream(stream):
+    """
+    Copy a raw upload body to a temporary file. Returns (file, size, SHA-256); the caller
+    closes the file.
+    """
+    image_file = tempfile.TemporaryFile()
+    try:
+        chunks = iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b'')
+        size, content_hash = hash_chunks(chunks, settings.MAX_IMAGE_UPLOAD_SIZE, image_file)
+    except BaseException:
+        image_file.close()
+        raise
+    image_file.seek(0)
+    return image_file, size, content_hash
+
+
+def receive_file(uploaded_file):
+    """
+    Hash a multipart file where Django stored it. Returns (file, size, SHA-256).
+    """
+    size, content_hash = hash_chunks(uploaded_file.chunks(UPLOAD_CHUNK_SIZE), settings.MAX_IMAGE_UPLOAD_SIZE)
+    uploaded_file.seek(0)
+    return uploaded_file, size, content_hash
@@ -8,6 +8,9 @@ urlpatterns = [
     # Post GitHub activity for a specific author
     path('<int:author_id>/github/', views.post_github_activity, name="post_github"),
     
+    # Changes to posts, likes and comments after a cursor, for delta sync
+    path("changes/", views.get_changes, name="get_changes"),
+
     # Get an image post by its fqid
     path("<str:fqid>/image/", views.get_image_post_by_fqid, name="get_image_post_by_fqid"),
 
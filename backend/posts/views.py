@@ -4,14 +4,27 @@ from .models import *
 from rest_framework.response import Response
 from authors.serializers import *
 from posts.serializers import *
+from posts.pagination import paginate_collection
 from django.shortcuts import get_object_or_404
 import requests
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import base64
-from django.http import HttpResponse, JsonResponse
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django.contrib.auth.models import User
 from urllib.parse import unquote
+from django.db.models import Q, Min
+from django.utils import timezone
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import authentication_classes
+from authors.follow_graph import follow_graph
+from authors.node_authentication import NodeBasicAuthentication
+from authors.token_authentication import CachedTokenAuthentication
+from .blobs import blob_path, decode_image
+from .thumbnails import FORMATS, get_thumbnail
 
 '''
 Documentation 
@@ -31,12 +44,12 @@ def get_post(request, post_fqid):
 
     # Public and unlisted posts are visible to everyone
     if post.visibility in ['PUBLIC', 'UNLISTED']:
-        return Response(PostSummarySerializer(post).data, status=200)
+        return Response(PostSummarySerializer(post, inline_images=wants_inline_images(request)).data, status=200)
 
     # For friends-only posts, check if the user is authenticated
     if post.visibility == 'FRIENDS':
         if request.user.is_authenticated:
-            return Response(PostSummarySerializer(post).data, status=200)
+            return Response(PostSummarySerializer(post, inline_images=wants_inline_images(request)).data, status=200)
         else:
             return Response({"detail": "Authentication required to view this post."}, status=401)
 
@@ -47,12 +60,21 @@ def get_post(request, post_fqid):
 @api_view(['GET'])
 # Get the image from a post
 def get_post_image(request, post_fqid):
-    post = get_object_or_404(Post, fqid=post_fqid)
+    post = get_object_or_404(Post.objects.only(*IMAGE_FIELDS), fqid=post_fqid)
 
     if not post.contentType.startswith('image/'):
         return Response({"error": "post is not an image post"}, status=404)
-    
-    return Response({'src': post.content})
+
+    inline_images = wants_inline_images(request)
+    if not post.image:
+        return Response({'src': get_post_content(post, inline_images)})
+
+    # the link and the inline data only change with the image
+    etag = f'"{post.image}-inline"' if inline_images else f'"{post.image}"'
+    response = get_conditional_response(request, etag=etag) or Response({'src': get_post_content(post, inline_images)})
+    response['ETag'] = etag
+    response['Cache-Control'] = image_cache_control(request, post)
+    return response
 
 @api_view(['GET'])
 def get_post_comments(request, post_fqid):
@@ -70,16 +92,10 @@ def get_post_comments(request, post_fqid):
         return Response({"detail": "Invalid post visibility setting."}, status=400)
 
     comments = Comment.objects.filter(post=post).order_by('-published')
-    paginator = Paginator(comments, 5)  # 5 comments per page
-    page_number = request.query_params.get('page', 1)
-    page_obj = paginator.get_page(page_number)
     serializer = CommentsSerializer({
         'page': post.page,
         'id': f"{post.author.host}authors/{post.author.id}/posts/{post.id}",
-        'page_number': page_obj.number,
-        'size': paginator.per_page,
-        'count': paginator.count,
-        'src': page_obj.object_list,
+        **paginate_collection(comments, request, 5, count=post.comments_count),  # 5 comments per page
     })
     return Response(serializer.data)
 
@@ -89,18 +105,11 @@ def get_post_likes(request, post_fqid):
     post = Post.objects.filter(fqid=post_fqid)
     if post.exists():
         post = post.first()
-        object_full_id = post.fqid
-        likes = Like.objects.filter(object=object_full_id).order_by('-published')
-        paginator = Paginator(likes, 50)  # 50 likes per page
-        page_number = request.query_params.get('page', 1)
-        page_obj = paginator.get_page(page_number)
+        likes = Like.objects.filter(post=post).order_by('-published')
         serializer = LikesSerializer({
             'page': post.page,
             'id': f"{post.author.host}authors/{post.author.id}/posts/{post.id}/likes",
-            'page_number': page_obj.number,
-            'size': paginator.per_page,
-            'count': paginator.count,
-            'src': page_obj.object_list,
+            **paginate_collection(likes, request, 50, count=post.likes_count),  # 50 likes per page
         })
         return Response(serializer.data)
     return Response({'error': f'post with fqid={post_fqid} does not exist'}, status=404)
@@ -170,23 +179,190 @@ def post_github_activity(request, author_id):
     return Response(status=201)
 
 
+IMAGE_FIELDS = ['id', 'fqid', 'contentType', 'image', 'visibility']    # all serving an image needs, the content column isn't read
+RANGE_CHUNK_SIZE = 64 * 1024
+
+def image_cache_control(request, post):
+    scope = 'public' if post.visibility == 'PUBLIC' else 'private'
+    if request.GET.get('v') == post.image:
+        # links in post JSON carry the image's digest, so what they point at never changes
+        return f"{scope}, max-age=31536000, immutable"
+    # the image of a post can change when it is edited, check the ETag every time
+    return f"{scope}, no-cache"
+
+def parse_range(header, size):
+    """
+    Get the (start, end) bytes of a single `bytes=` range, inclusive. Returns None for
+    headers that are ignored (other units, several ranges) and raises ValueError if the
+    range is past the end of the image.
+    """
+    unit, _, ranges = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in ranges:
+        return None
+    first, _, last = ranges.strip().partition('-')
+    try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = size - int(last), size - 1   # the last N bytes
+    except ValueError:
+        return None
+    start, end = max(start, 0), min(end, size - 1)
+    if start > end:
+        raise ValueError(header)
+    return start, end
+
+def read_range(blob, start, end):
+    with blob:
+        blob.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = blob.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def serve_file(request, path, etag, content_type, cache_control):
+    """
+    Send a stored file that never changes under the given ETag. Conditional requests get
+    a 304 and single byte ranges a 206.
+    """
+    last_modified = int(default_storage.get_modified_time(path).timestamp())
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        not_modified['Cache-Control'] = cache_control
+        return not_modified
+
+    size = default_storage.size(path)
+    byte_range = None
+    # If-Range asks for the range only if the file is still the one it has part of
+    if 'Range' in request.headers and request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+
+    if byte_range is None:
+        response = FileResponse(default_storage.open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(default_storage.open(path, 'rb'), start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = end - start + 1
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = cache_control
+    return response
+
+def serve_sized_file(request, path, etag, content_type, cache_control):
+    """
+    Send a stored image, or the thumbnail of it asked for with ?w=.
+    """
+    try:
+        thumbnail = get_thumbnail(request, path)
+    except ValueError:
+        return JsonResponse({"detail": "w must be a positive integer."}, status=400)
+    if thumbnail is not None:
+        path, width, extension = thumbnail
+        etag = f'{etag[:-1]}-{width}.{extension}"'
+        content_type = FORMATS[extension][1]
+
+    response = serve_file(request, path, etag, content_type, cache_control)
+    if 'w' in request.GET:
+        # the thumbnail is WebP or JPEG depending on what the browser accepts
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+def serve_image(request, post):
+    """
+    Send the image of an image post straight from the blob store, with the image's
+    digest as a strong ETag.
+    """
+    if not post.image:
+        # content that never made it to the store isn't image data
+        try:
+            return HttpResponse(decode_image(post.content), content_type=post.contentType)
+        except ValueError:
+            return JsonResponse({"detail": "Invalid image data"}, status=400)
+
+    return serve_sized_file(request, blob_path(post.image), f'"{post.image}"', post.contentType, image_cache_control(request, post))
+
 @get_image_post_by_fqid_docs
 @api_view(['GET'])
 def get_image_post_by_fqid(request, fqid):
     decoded_fqid = unquote(fqid)
     
     # Fetch the post by FQID
-    post = get_object_or_404(Post, fqid=decoded_fqid, visibility='PUBLIC')
+    post = get_object_or_404(Post.objects.only(*IMAGE_FIELDS), fqid=decoded_fqid, visibility='PUBLIC')
 
     # Check if the contentType is an image
     if not post.contentType.startswith('image/'):
         return JsonResponse({"detail": "Not an image post"}, status=404)
 
-    # Decode the base64 content to binary
+    return serve_image(request, post)
+
+
+CHANGES_PAGE_SIZE = 100     # changes sent per request by default
+MAX_CHANGES_PAGE_SIZE = 500
+CHANGES_SETTLE_TIME = 5     # seconds before a change is sent, so changes committed late aren't skipped by the cursor
+
+def readable(user, visibility_field):
+    """
+    Q for the changes of posts the user may read, by the visibility in visibility_field.
+    """
+    visible = Q(**{visibility_field: 'PUBLIC'})
+    if isinstance(user, Author):
+        edges = follow_graph.get([user.id], fresh=True)[user.id]
+        visible |= (
+            Q(post__author=user) |
+            Q(**{visibility_field: 'UNLISTED', 'post__author__in': edges.following}) |
+            Q(**{visibility_field: 'FRIENDS', 'post__author__in': edges.friends})
+        )
+    return visible
+
+def visible_changes(user):
+    """
+    Changes the user may read, judged on the current state of the post. Deletions are
+    judged on the visibility the post had before it was deleted.
+    """
+    live = readable(user, 'post__visibility') & Q(post__is_deleted=False)
+    deleted = Q(kind='DELETED') & readable(user, 'visibility')
+    return Change.objects.filter(deleted | (~Q(kind='DELETED') & live))
+
+def settled_changes(changes, after):
+    """
+    The changes after the cursor that can be sent. Ids are handed out before transactions
+    commit, so a change can show up after changes with higher ids were read. Only changes
+    older than CHANGES_SETTLE_TIME are sent, up to the first one that isn't, so the cursor
+    never passes a change that may still be committing.
+    """
+    horizon = timezone.now() - timedelta(seconds=CHANGES_SETTLE_TIME)
+    unsettled = Change.objects.filter(id__gt=after, created_at__gt=horizon).aggregate(first=Min('id'))['first']
+    changes = changes.filter(id__gt=after)
+    return changes.filter(id__lt=unsettled) if unsettled is not None else changes
+
+@get_changes_docs
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication, NodeBasicAuthentication])
+def get_changes(request):
     try:
-        image_data = base64.b64decode(post.content)
-    except base64.binascii.Error:
-        return JsonResponse({"detail": "Invalid image data"}, status=400)
+        after = int(request.query_params.get('after', 0))
+        size = min(max(int(request.query_params.get('size', CHANGES_PAGE_SIZE)), 1), MAX_CHANGES_PAGE_SIZE)
+    except ValueError:
+        return Response({"detail": "after and size must be integers."}, status=400)
 
-    # Return the image as a binary
-    return HttpResponse(image_data, content_type=post.contentType)
+    changes = list(
+        settled_changes(visible_changes(request.user), after)
+        .select_related('post__author', 'like__author', 'comment__author', 'comment__post__author')
+        .order_by('id')[:size]
+    )
+    return Response({
+        "type": "changes",
+        "changes": serialize_changes(changes, wants_inline_images(request)),
+        # pass next as after on the next request, it stays put when nothing changed
+        "next": changes[-1].id if changes else after,
+    }, status=200)
@@ -22,7 +22,7 @@ function App() {
   useEffect(() => {
     fetch(`/api/posts/${authorSerial}/github/`, {
       headers: {
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
     })
   });
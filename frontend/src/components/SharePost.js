@@ -18,7 +18,7 @@ const SharePost = () => {
           headers: {
             'Content-Type': 'application/json',
             'X-CSRFToken': csrftoken, 
-            'Authorization': `Basic ${localStorage.getItem('authToken')}`, 
+            'Authorization': `Token ${localStorage.getItem('authToken')}`, 
           },
         });
 
@@ -12,6 +12,7 @@ import Box from '@mui/material/Box';
 import CloseIcon from '@mui/icons-material/Close';
 import SendIcon from '@mui/icons-material/Send';
 import { PostProfilePicture } from "./profilePicture";
+import { responsiveImage } from '../imageSizes';
 
 
 const PostState = {
@@ -81,7 +82,7 @@ const Content = ({ post, postState }) => {
         headers: {
           'Content-Type': 'application/json',
           'X-CSRFToken': csrftoken,
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
         body: JSON.stringify(updatedData)
       });
@@ -235,7 +236,7 @@ const Content = ({ post, postState }) => {
               <div className="italic text-neutral-700 pb-3 post-description post-description" dangerouslySetInnerHTML={{ __html: post.description }}/> 
               <div>
                  {/* eslint-disable-next-line */}
-              <div className="flex justify-center post-content"><img src={post.content} className="w-1/2" alt="Image Not Found" /></div>
+              <div className="flex justify-center post-content"><img {...responsiveImage(post.content, "50vw")} className="w-1/2" alt="Image Not Found" /></div>
               </div>
 
             </div>
@@ -371,7 +372,7 @@ export default function Post({ post }) {
   function getPostInfo() {
     fetch(post.id + "/", {
       headers: {
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
     })
     .then(r => r.json())
@@ -389,7 +390,7 @@ export default function Post({ post }) {
 
     fetch(`${post.author.id}/`, {
       headers: {
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
     })
     .then(r => r.json())
@@ -409,7 +410,7 @@ export default function Post({ post }) {
       let postId = post.id.split("/").pop();
       fetch(`${self.id}` + "/liked/" + postId, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then(r => r.json())
@@ -453,7 +454,7 @@ export default function Post({ post }) {
         headers: {
           'Content-Type': 'application/json',
           'X-CSRFToken': csrftoken,
-          'Authorization': `Basic ${token}`,
+          'Authorization': `Token ${token}`,
         }
       });
 
@@ -476,7 +477,7 @@ export default function Post({ post }) {
         headers: {
           'Content-Type': 'application/x-www-form-urlencoded',
           'X-CSRFToken': csrftoken,
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then(r => {
@@ -496,7 +497,7 @@ export default function Post({ post }) {
       headers: {
         'Content-Type': 'application/x-www-form-urlencoded',
         'X-CSRFToken': csrftoken,
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
       body: data.toString(),
     })
@@ -512,7 +513,7 @@ export default function Post({ post }) {
     let nextPageNum = (comments.length) % 5 + 2;
     fetch(`${post.id}/comments?page=${nextPageNum}`, {
       headers: {
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
     })
     .then(r => r.json())
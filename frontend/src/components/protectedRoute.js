@@ -9,12 +9,21 @@
 
 import { Navigate, useLocation } from 'react-router-dom';
 
+const API_TOKEN = /^[0-9a-f]{40}$/;     // the keys of DRF tokens
+
 export default function ProtectedRoute({ children }) {
   const location = useLocation();
 
   const token = localStorage.getItem('authToken');
 
-  if (!!!token) {
+  // logins before API tokens stored Basic credentials here, which the API no longer
+  // accepts as a token, so those users log in again to get one
+  if (token && !API_TOKEN.test(token)) {
+    localStorage.removeItem('authToken');
+    localStorage.removeItem('authorId');
+  }
+
+  if (!API_TOKEN.test(token || '')) {
     return <Navigate to="/login" state={{ from: location }} replace />;
   }
 
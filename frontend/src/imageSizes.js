@@ -0,0 +1,40 @@
+// our image endpoints send smaller copies of an image when asked with ?w=
+const WIDTHS = [64, 320, 1080];
+
+// the resizable URL of an image on this node, or null for images we can't resize
+function resizableURL(url) {
+    if (!url || url.startsWith('data:')) {
+        return null;
+    }
+    if (url.includes('/image/?v=')) {
+        return url;
+    }
+    const uploaded = url.match(/^(?:https?:\/\/[^/]+)?\/media\/images\/([^/?#]+)$/);
+    if (uploaded && (url.startsWith('/') || url.startsWith(window.location.origin))) {
+        return `${window.location.origin}/api/authors/images/${uploaded[1]}/`;
+    }
+    return null;
+}
+
+function withWidth(url, width) {
+    return `${url}${url.includes('?') ? '&' : '?'}w=${width}`;
+}
+
+// img props that let the browser pick the smallest copy that fills `sizes`
+export function responsiveImage(url, sizes) {
+    const resizable = resizableURL(url);
+    if (!resizable) {
+        return { src: url };
+    }
+    return {
+        src: withWidth(resizable, WIDTHS[WIDTHS.length - 1]),
+        srcSet: WIDTHS.map((width) => `${withWidth(resizable, width)} ${width}w`).join(', '),
+        sizes: sizes,
+    };
+}
+
+// the URL of a copy of an image at least `width` pixels wide
+export function sizedImageURL(url, width) {
+    const resizable = resizableURL(url);
+    return resizable ? withWidth(resizable, width) : url;
+}
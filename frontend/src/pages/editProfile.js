@@ -21,7 +21,7 @@ export default function EditProfile() {
     // get profile information
     fetch(`${authorId}/full/`, {
       headers: {
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
     })
     .then((r) => r.json())
@@ -53,7 +53,7 @@ export default function EditProfile() {
         headers: {
           'Content-Type': 'application/x-www-form-urlencoded',
           'X-CSRFToken': csrftoken,
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
         body: data.toString(),
       });
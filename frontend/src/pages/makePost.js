@@ -1,7 +1,8 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import './makePost.css';
 import getCookie from '../getCSRFToken';
+import { sizedImageURL } from '../imageSizes';
 
 import Modal from '@mui/material/Modal';
 import Box from '@mui/material/Box';
@@ -26,6 +27,85 @@ const style = {
   p: 4,
 };
 
+// picker of the images hosted on this node, loads more pages on request
+const ImageSelector = ({ images, next, onLoadMore, onSelect }) => {
+
+  const [open, setOpen] = useState(false);
+  const handleOpen = () => setOpen(true);
+  const handleClose = () => setOpen(false);
+
+  // thumbnails by filename, so each page only fetches the images it added
+  const [imageUrls, setImageUrls] = useState({});
+  const requested = useRef(new Set());
+
+  useEffect(() => {
+    const added = images.filter((filename) => !requested.current.has(filename));
+    added.forEach((filename) => requested.current.add(filename));
+
+    const fetchImages = async () => {
+      const fetchedUrls = await Promise.all(
+        added.map(async (filename) => {
+          // the picker only shows small copies
+          const response = await fetch(sizedImageURL(filename, 320), {
+            headers: {
+              'Authorization': `Token ${localStorage.getItem('authToken')}`,
+            },
+          });
+          const blob = await response.blob();
+          return [filename, URL.createObjectURL(blob)];
+        })
+      );
+
+      setImageUrls((current) => ({ ...current, ...Object.fromEntries(fetchedUrls) }));
+    };
+
+    if (added.length > 0) {
+      fetchImages();
+    }
+  }, [images]);
+
+  function setImage(event) {
+    onSelect(event.target.id);
+    handleClose();
+  }
+
+  return (
+    <div>
+      <button type="button" onClick={handleOpen} className='bg-customOrange rounded p-2 px-5'>Select Image</button>
+      <Modal
+        open={open}
+        onClose={handleClose}
+      >
+        <Box sx={{ ...style, maxHeight: '90vh', overflowY: 'auto' }}>
+          <div className="grid grid-cols-2 pb-3 mb-3 border-b">
+            <h2 className="font-bold text-3xl">
+              Select Image
+            </h2>
+            <div className="flex justify-end">
+              <CloseIcon sx={{ color: '#bbb' }} onClick={handleClose} className="cursor-pointer" />
+            </div>
+          </div>
+
+          <div className="grid grid-cols-3 gap-4">
+            {
+              images.some((filename) => imageUrls[filename]) ? (
+                images.filter((filename) => imageUrls[filename]).map((filename) => {
+                  return <img src={imageUrls[filename]} id={filename.split("/").pop()} key={filename} alt="Image not found" className='border rounded' onClick={setImage}></img>
+                })
+              ) : (<p>No Images Found</p>)
+            }
+          </div>
+          {next && (
+            <div className="flex justify-center mt-3">
+              <button type="button" onClick={onLoadMore} className='bg-customOrange rounded p-2 px-5'>Load More</button>
+            </div>
+          )}
+        </Box>
+      </Modal>
+    </div>
+  )
+}
+
 const MakePost = () => {
   const [title, setTitle] = useState('');
   const [description, setDescription] = useState('');
@@ -36,6 +116,7 @@ const MakePost = () => {
   const [visibility, setVisbility] = useState('PUBLIC');
 
   const [commonmarkImages, setCommonmarkImages] = useState([]);
+  const [commonmarkImagesNext, setCommonmarkImagesNext] = useState(null);
   const [commonmarkImage, setCommonmarkImage] = useState('');
 
   // upload image from <a href="https://www.flaticon.com/free-icons/upload" title="upload icons">Upload icons created by Kiranshastry - Flaticon</a>
@@ -49,17 +130,22 @@ const MakePost = () => {
 
   const navigate = useNavigate();
 
-  useEffect(() => {
-    // get all hosted images
-    fetch('/api/authors/images/all/', {
+  // hosted images come a page at a time, newest first
+  const loadImages = (url) => {
+    fetch(url, {
       headers: {
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
     })
       .then(r => r.json())
       .then(data => {
-        setCommonmarkImages(data.images)
+        setCommonmarkImages(images => images.concat(data.images))
+        setCommonmarkImagesNext(data.next)
       })
+  }
+
+  useEffect(() => {
+    loadImages('/api/authors/images/all/')
   }, [])
 
   const handleSubmit = async (e) => {
@@ -95,7 +181,7 @@ const MakePost = () => {
         headers: {
           'Content-Type': 'application/x-www-form-urlencoded',
           'X-CSRFToken': csrftoken,
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
         body: data.toString()
       });
@@ -119,71 +205,6 @@ const MakePost = () => {
     })
   }
 
-  const ImageSelector = ({ images }) => {
-
-    const [open, setOpen] = useState(false);
-    const handleOpen = () => setOpen(true);
-    const handleClose = () => setOpen(false);
-
-    const [imageUrls, setImageUrls] = useState([]);
-
-    useEffect(() => {
-      const fetchImages = async () => {
-        const fetchedUrls = await Promise.all(
-          images.map(async (filename) => {
-            const response = await fetch(filename, {
-              headers: {
-                'Authorization': `Basic ${localStorage.getItem('authToken')}`,
-              },
-            });
-            const blob = await response.blob();
-            return URL.createObjectURL(blob);
-          })
-        );
-
-        setImageUrls(fetchedUrls);
-      };
-
-      fetchImages();
-    }, []);
-
-    function setImage(event) {
-      setCommonmarkImage(event.target.id);
-      handleClose();
-    }
-
-    return (
-      <div>
-        <button type="button" onClick={handleOpen} className='bg-customOrange rounded p-2 px-5'>Select Image</button>
-        <Modal
-          open={open}
-          onClose={handleClose}
-        >
-          <Box sx={style}>
-            <div className="grid grid-cols-2 pb-3 mb-3 border-b">
-              <h2 className="font-bold text-3xl">
-                Select Image
-              </h2>
-              <div className="flex justify-end">
-                <CloseIcon sx={{ color: '#bbb' }} onClick={handleClose} className="cursor-pointer" />
-              </div>
-            </div>
-
-            <div className="grid grid-cols-3 gap-4">
-              {
-                imageUrls.length > 0 ? (
-                  imageUrls.map((image, index) => {
-                    return <img src={image} id={images[index].split("/").pop()} alt="Image not found" className='border rounded' onClick={setImage}></img>
-                  })
-                ) : (<p>No Images Found</p>)
-              }
-            </div>
-          </Box>
-        </Modal>
-      </div>
-    )
-  }
-
   useEffect(() => {
     if (commonmarkImage) {
       let commonmarkImageText = `![Image](${window.location.origin}/media/images/${commonmarkImage})`
@@ -278,7 +299,7 @@ const MakePost = () => {
           </div>
 
           <div className={`flex ${activeButton === "markdown" ? "justify-between" : "justify-end"} px-20 pb-8`}>
-            {activeButton === "markdown" && <ImageSelector images={commonmarkImages} />}
+            {activeButton === "markdown" && <ImageSelector images={commonmarkImages} next={commonmarkImagesNext} onLoadMore={() => loadImages(commonmarkImagesNext)} onSelect={setCommonmarkImage} />}
             <select className='border rounded' value={visibility} onChange={handleChange}>
               <option value="PUBLIC">Public</option>
               <option value="FRIENDS">Friends-Only</option>
@@ -17,7 +17,7 @@ function FollowRequest({request, authorId}) {
         headers: {
           'Content-Type': 'application/x-www-form-urlencoded',
           'X-CSRFToken': csrftoken,
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
         body: data.toString()
       })
@@ -44,7 +44,7 @@ function FollowRequest({request, authorId}) {
         headers: {
           'Content-Type': 'application/x-www-form-urlencoded',
           'X-CSRFToken': csrftoken,
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
         body: data.toString()
       })
@@ -95,7 +95,7 @@ export default function Notifications() {
   useEffect(() => {
     fetch(`api/authors/${authorSerial}/follow_requests/`, {
       headers: {
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
     })
     .then((response) => response.json())
@@ -70,7 +70,7 @@ export default function Profile() {
     localStorage.setItem('host', host);
     fetch(`/api/authors/${profileAuthorId}/`, {
       headers: {
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
     })
     .then((r) => r.json())
@@ -112,7 +112,7 @@ export default function Profile() {
 
       fetch(`${authorId}/relationship/${profileAuthorId}/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then((r) => r.json())
@@ -163,7 +163,7 @@ export default function Profile() {
         
       fetch(`${profileInfo.fqid}/posts/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
         })
         .then((r) => r.json())
@@ -173,7 +173,7 @@ export default function Profile() {
 
       fetch(`${authorId}/relationship/${profileAuthorId}/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then((r) => r.json())
@@ -184,7 +184,7 @@ export default function Profile() {
       // get followers
       fetch(`${profileInfo.fqid}/followers/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then((r) => r.json())
@@ -195,7 +195,7 @@ export default function Profile() {
       // get people author follows
       fetch(`${profileInfo.fqid}/following/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then((r) => r.json())
@@ -206,7 +206,7 @@ export default function Profile() {
       // get friends of the author
       fetch(`${profileInfo.fqid}/friends/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then((r) => r.json())
@@ -218,7 +218,7 @@ export default function Profile() {
       
       fetch(`${authorId}/posts/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
         })
         .then((r) => r.json())
@@ -228,7 +228,7 @@ export default function Profile() {
 
       fetch(`${authorId}/relationship/${profileAuthorId}/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then((r) => r.json())
@@ -239,7 +239,7 @@ export default function Profile() {
       // get followers
       fetch(`${authorId}/followers/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then((r) => r.json())
@@ -250,7 +250,7 @@ export default function Profile() {
       // get people author follows
       fetch(`${authorId}/following/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then((r) => r.json())
@@ -261,7 +261,7 @@ export default function Profile() {
       // get friends of the author
       fetch(`${authorId}/friends/`, {
         headers: {
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
       })
       .then((r) => r.json())
@@ -288,7 +288,7 @@ export default function Profile() {
         headers: {
           'Content-Type': 'application/x-www-form-urlencoded',
           'X-CSRFToken': csrftoken,
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
         body: data.toString(),
       })
@@ -312,7 +312,7 @@ export default function Profile() {
         headers: {
           'Content-Type': 'application/x-www-form-urlencoded',
           'X-CSRFToken': csrftoken,
-          'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+          'Authorization': `Token ${localStorage.getItem('authToken')}`,
         },
         body: data.toString(),
       })
@@ -37,7 +37,7 @@ export default function Search() {
 
     fetch(`/api/authors/search/?keyword=${data}`, {
       headers: {
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
     })
     .then((r) => r.json())
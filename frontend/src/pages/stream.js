@@ -10,7 +10,7 @@ export default function StreamPage() {
     // get posts
     fetch(`${authorId}/stream/`, {
       headers: {
-        'Authorization': `Basic ${localStorage.getItem('authToken')}`,
+        'Authorization': `Token ${localStorage.getItem('authToken')}`,
       },
     })
     .then((r) => r.json())